@@ -17,8 +17,9 @@ class GroupParams:
     pass
 
 class ParamGroup:
-    def __init__(self, parser: ArgumentParser, name : str, fill_none = False):
+    def __init__(self, parser: ArgumentParser, name : str, fill_none = False, helps = None):
         group = parser.add_argument_group(name)
+        helps = helps or {}
         for key, value in vars(self).items():
             shorthand = False
             if key.startswith("_"):
@@ -26,16 +27,17 @@ class ParamGroup:
                 key = key[1:]
             t = type(value)
             value = value if not fill_none else None 
+            help = helps.get(key)
             if shorthand:
                 if t == bool:
-                    group.add_argument("--" + key, ("-" + key[0:1]), default=value, action="store_true")
+                    group.add_argument("--" + key, ("-" + key[0:1]), default=value, action="store_true", help=help)
                 else:
-                    group.add_argument("--" + key, ("-" + key[0:1]), default=value, type=t)
+                    group.add_argument("--" + key, ("-" + key[0:1]), default=value, type=t, help=help)
             else:
                 if t == bool:
-                    group.add_argument("--" + key, default=value, action="store_true")
+                    group.add_argument("--" + key, default=value, action="store_true", help=help)
                 else:
-                    group.add_argument("--" + key, default=value, type=t)
+                    group.add_argument("--" + key, default=value, type=t, help=help)
 
     def extract(self, args):
         group = GroupParams()
@@ -56,6 +58,10 @@ class ModelParams(ParamGroup):
         self.train_test_exp = False
         self.data_device = "cuda"
         self.eval = False
+        self.lazy_load = False
+        self.prefetch_views = 8
+        self.image_cache_size = 64
+        self.image_pack = ""
         super().__init__(parser, "Loading Parameters", sentinel)
 
     def extract(self, args):
@@ -69,6 +75,9 @@ class PipelineParams(ParamGroup):
         self.compute_cov3D_python = False
         self.debug = False
         self.antialiasing = False
+        self.rasterizer = "cuda"
+        self.frustum_culling = False
+        self.lod_threshold = 2.0
         super().__init__(parser, "Pipeline Parameters")
 
 class OptimizationParams(ParamGroup):
@@ -97,7 +106,22 @@ class OptimizationParams(ParamGroup):
         self.depth_l1_weight_final = 0.01
         self.random_background = False
         self.optimizer_type = "default"
-        super().__init__(parser, "Optimization Parameters")
+        self.capacity_headroom = 1.5
+        self.text_roi_render = False
+        self.views_per_step = 1
+        self.viewpoint_sampler = "uniform"
+        self.sampler_uniform_fraction = 0.5
+        self.sampler_loss_decay = 0.9
+        self.contribution_prune_iteration = -1
+        self.contribution_prune_target = 0
+        self.contribution_prune_budget_mb = 0.0
+        self.contribution_prune_view_stride = 1
+        super().__init__(parser, "Optimization Parameters", helps={
+            "contribution_prune_iteration": "iteration at which the least contributing non-text Gaussians are pruned, -1 to disable. "
+                                            "Training pauses while every contribution_prune_view_stride-th training view is rendered with "
+                                            "the pure PyTorch rasterizer, which loops over tiles in Python and is far slower than the CUDA one: "
+                                            "expect minutes for millions of Gaussians and hundreds of views. The elapsed time is printed",
+            "contribution_prune_view_stride": "render every k-th training view to measure the contributions"})
 
 def get_combined_args(parser : ArgumentParser):
     cmdlne_string = sys.argv[1:]
@@ -0,0 +1,46 @@
+import os
+import torch
+from argparse import ArgumentParser
+from arguments import ModelParams, get_combined_args
+from scene.gaussian_model import GaussianModel
+from scene.lod import build_lod, save_lod
+from utils.general_utils import safe_state
+from utils.system_utils import searchForMaxIteration
+
+def build_model_lod(dataset, iteration, num_levels, cell_size, chunk_cells, merge_text):
+    if iteration == -1:
+        iteration = searchForMaxIteration(os.path.join(dataset.model_path, "point_cloud"))
+    point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(iteration))
+    gaussians = GaussianModel(dataset.sh_degree)
+    gaussians.load_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+
+    text_mask = None
+    text_mask_path = os.path.join(point_cloud_path, "text_points_mask.pt")
+    if not merge_text:
+        if os.path.exists(text_mask_path):
+            text_mask = torch.load(text_mask_path, map_location=gaussians.get_xyz.device).bool()
+        else:
+            print("[ WARNING ] No text mask found at {}, text Gaussians are merged as well".format(text_mask_path))
+
+    levels, cell_sizes, chunks = build_lod(gaussians, text_mask, num_levels, cell_size, chunk_cells)
+    output_path = os.path.join(dataset.model_path, "lod", "iteration_{}".format(iteration))
+    save_lod(output_path, gaussians, levels, cell_sizes, chunks)
+    for index, (level, size) in enumerate(zip(levels, cell_sizes)):
+        print("Level {}: {} Gaussians, cell size {:.4f}".format(index, level["xyz"].shape[0], size))
+    print("{} chunks written to {}".format(chunks["min"].shape[0], output_path))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Build a level-of-detail hierarchy of a trained model")
+    model = ModelParams(parser, sentinel=True)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--levels", default=4, type=int, help="number of levels, including the full model")
+    parser.add_argument("--cell_size", default=0.0, type=float, help="merge cell size of level 1, 0 to derive it from the point density")
+    parser.add_argument("--chunk_cells", default=4, type=int, help="chunk size in cells of the coarsest level")
+    parser.add_argument("--merge_text", action="store_true", help="merge the text Gaussians like the others")
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Building LOD of " + args.model_path)
+
+    safe_state(args.quiet)
+
+    build_model_lod(model.extract(args), args.iteration, args.levels, args.cell_size, args.chunk_cells, args.merge_text)
@@ -0,0 +1,90 @@
+import os
+import json
+import torch
+from tqdm import tqdm
+from argparse import ArgumentParser
+from arguments import ModelParams, PipelineParams, get_combined_args
+from gaussian_renderer import render
+from scene import Scene, GaussianModel
+from utils.compression_utils import compress_gaussians, save_compressed
+from utils.general_utils import safe_state
+from utils.metric_utils import image_metrics
+
+def evaluate_psnr(views, gaussians, pipeline, background, train_test_exp):
+    """Mean PSNR over `views`, of the whole images and of their text masks, and the renders' sizes."""
+    full, text = [], []
+    for view in tqdm(views, desc="Rendering"):
+        rendering = render(view, gaussians, pipeline, background, use_trained_exp=train_test_exp)["render"]
+        gt = view.original_image[0:3, :, :].to(rendering.device)
+        mask = view.gt_mask.to(rendering.device)
+        if train_test_exp:
+            rendering, gt, mask = [image[..., image.shape[-1] // 2:] for image in (rendering, gt, mask)]
+        values = image_metrics(rendering[None], gt[None], mask[None])
+        full.append(values["psnr"])
+        text.append(values["psnr_text"])
+    if not full:
+        return float("nan"), float("nan")
+    # psnr_text is NaN for the views without text
+    full, text = torch.cat(full), torch.cat(text)
+    return full.mean().item(), text.nanmean().item()
+
+def report_evaluation(model_path, iteration):
+    """PSNR (metrics.py) and CER (metrics_ocr.py) of the full and compressed renders, once both have been evaluated."""
+    full, compressed = "ours_{}".format(iteration), "ours_{}_compressed".format(iteration)
+    for name, path, key in (("PSNR", os.path.join(model_path, "results.json"), "PSNR"),
+                            ("CER", os.path.join(model_path, "test_ocr_output", "ocr_results.json"), "overall_cer")):
+        results = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                results = json.load(f)
+        if full in results and compressed in results:
+            print("  {:5}: {:>10.5f} full, {:>10.5f} compressed, delta {:+.5f}".format(
+                name, results[full][key], results[compressed][key], results[compressed][key] - results[full][key]))
+        else:
+            print("  {:5}: run render.py --compressed and {} to compare {} and {}".format(
+                name, "metrics.py" if name == "PSNR" else "metrics_ocr.py", full, compressed))
+
+def compress_model(dataset, iteration, pipeline, codebook_size, kmeans_iterations, truncate_fraction, truncate_degree, skip_eval):
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree)
+        scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+        point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+
+        data = compress_gaussians(gaussians, codebook_size, kmeans_iterations, truncate_fraction, truncate_degree)
+        compressed_path = os.path.join(point_cloud_path, "point_cloud_compressed.npz")
+        save_compressed(compressed_path, data)
+        full_size = os.path.getsize(os.path.join(point_cloud_path, "point_cloud.ply"))
+        compressed_size = os.path.getsize(compressed_path)
+        print("{} Gaussians: {:.2f} MB PLY, {:.2f} MB compressed ({:.1f}x)".format(
+            gaussians.get_xyz.shape[0], full_size / 2**20, compressed_size / 2**20, full_size / max(compressed_size, 1)))
+        if skip_eval:
+            return
+
+        bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device=gaussians.get_xyz.device)
+        views = scene.getTestCameras() or scene.getTrainCameras()
+        full_psnr, full_text_psnr = evaluate_psnr(views, gaussians, pipeline, background, dataset.train_test_exp)
+        gaussians.load_compressed(compressed_path)
+        compressed_psnr, compressed_text_psnr = evaluate_psnr(views, gaussians, pipeline, background, dataset.train_test_exp)
+        print("  PSNR (image): {:>10.5f} full, {:>10.5f} compressed, delta {:+.5f}".format(full_psnr, compressed_psnr, compressed_psnr - full_psnr))
+        print("  PSNR (text) : {:>10.5f} full, {:>10.5f} compressed, delta {:+.5f}".format(full_text_psnr, compressed_text_psnr, compressed_text_psnr - full_text_psnr))
+        report_evaluation(dataset.model_path, scene.loaded_iter)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compress a trained model")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--codebook_size", default=4096, type=int, help="entries of the f_rest codebook")
+    parser.add_argument("--kmeans_iterations", default=10, type=int)
+    parser.add_argument("--truncate_fraction", default=0.0, type=float, help="fraction of the least contributing Gaussians whose SH degree is truncated")
+    parser.add_argument("--truncate_degree", default=0, type=int, help="SH degree kept by the truncated Gaussians")
+    parser.add_argument("--skip_eval", action="store_true", help="skip the PSNR comparison of the full and compressed models")
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Compressing " + args.model_path)
+
+    safe_state(args.quiet)
+
+    compress_model(model.extract(args), args.iteration, pipeline.extract(args), args.codebook_size, args.kmeans_iterations,
+                   args.truncate_fraction, args.truncate_degree, args.skip_eval)
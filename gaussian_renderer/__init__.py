@@ -11,29 +11,89 @@
 
 import torch
 import math
-from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
 from scene.gaussian_model import GaussianModel
+from scene.cameras import CropCam
+from gaussian_renderer.torch_rasterizer import RasterizationSettings, TorchRasterizer
+from utils.spatial_index import GaussianGrid, GaussianSubset
+
+try:
+    from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+    CUDA_RASTERIZER_AVAILABLE = True
+except ImportError:
+    CUDA_RASTERIZER_AVAILABLE = False
 from utils.sh_utils import eval_sh
 
-def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, separate_sh = False, override_color = None, use_trained_exp=False):
+def in_view(viewpoint_camera, xyz):
+    """Points in front of the camera (like the rasterizer's frustum test) whose center projects into the image."""
+    points = torch.cat([xyz, torch.ones_like(xyz[:, :1])], dim=1)
+    p_hom = points @ viewpoint_camera.full_proj_transform
+    p_ndc = p_hom[:, :2] / (p_hom[:, 3:] + 0.0000001)
+    p_view = points @ viewpoint_camera.world_view_transform
+    return (p_view[:, 2] > 0.2) & (p_ndc.abs() <= 1).all(dim=1)
+
+def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, separate_sh = False, override_color = None, use_trained_exp=False, crop=None, track_contribution=False):
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the device of the Gaussians!
+
+    pipe.rasterizer selects diff_gaussian_rasterization ("cuda") or the
+    PyTorch reference rasterizer ("torch"), which is also used whenever the
+    CUDA rasterizer is not installed or the Gaussians are not on a GPU.
+
+    With a `crop` window (x0, y0, x1, y1) only that part of the image is
+    rasterized (see CropCam). Screen-space gradients are rescaled to full image
+    units and Gaussians visible in the full image count as visible, so the
+    densification statistics match those of a full render.
+
+    With pipe.frustum_culling only the chunks of pc.spatial_index (a
+    GaussianGrid) that may reach the image are handed to the rasterizer; radii
+    and visibility are returned for all Gaussians as usual. A model holding a
+    LOD hierarchy (pc.lod) draws, per chunk, the coarsest level whose cells
+    project to at most pipe.lod_threshold pixels.
+
+    With `track_contribution` the output also holds "contribution", the largest
+    blending weight of every Gaussian in this view, computed by the PyTorch
+    rasterizer whatever pipe.rasterizer selects.
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True) + 0
     try:
         screenspace_points.retain_grad()
     except:
         pass
 
+    means2D = screenspace_points
+    full_view_visible = None
+    if crop is not None:
+        full_view_visible = in_view(viewpoint_camera, pc.get_xyz.detach())
+        viewpoint_camera = CropCam(viewpoint_camera, crop)
+        # the rasterizer returns gradients in NDC units of the rendered window
+        means2D = screenspace_points * torch.tensor([viewpoint_camera.full_width / viewpoint_camera.image_width,
+                                                     viewpoint_camera.full_height / viewpoint_camera.image_height, 1.0], device=screenspace_points.device)
+
+    num_points = pc.get_xyz.shape[0]
+    culled = None
+    if pc.lod is not None:
+        # the LOD chunks are frustum culled as well
+        pc = pc.lod.subset(pc, viewpoint_camera, pipe.lod_threshold)
+    elif pipe.frustum_culling:
+        if pc.spatial_index is None:
+            pc.spatial_index = GaussianGrid()
+        pc = pc.spatial_index.subset(pc, viewpoint_camera)
+    if isinstance(pc, GaussianSubset):
+        culled = pc.indices
+        means2D = means2D[culled]
+        if override_color is not None:
+            override_color = override_color[culled]
+
     # Set up rasterization configuration
     tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
     tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
 
-    raster_settings = GaussianRasterizationSettings(
+    use_cuda_rasterizer = pipe.rasterizer == "cuda" and CUDA_RASTERIZER_AVAILABLE and pc.get_xyz.is_cuda and not track_contribution
+    raster_settings = (GaussianRasterizationSettings if use_cuda_rasterizer else RasterizationSettings)(
         image_height=int(viewpoint_camera.image_height),
         image_width=int(viewpoint_camera.image_width),
         tanfovx=tanfovx,
@@ -49,10 +109,12 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
         antialiasing=pipe.antialiasing
     )
 
-    rasterizer = GaussianRasterizer(raster_settings=raster_settings)
+    if use_cuda_rasterizer:
+        rasterizer = GaussianRasterizer(raster_settings=raster_settings)
+    else:
+        rasterizer = TorchRasterizer(raster_settings=raster_settings, track_contribution=track_contribution)
 
     means3D = pc.get_xyz
-    means2D = screenspace_points
     opacity = pc.get_opacity
 
     # If precomputed 3d covariance is provided, use it. If not, then it will be computed from
@@ -117,12 +179,20 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     # Those Gaussians that were frustum culled or had a radius of 0 were not visible.
     # They will be excluded from value updates used in the splitting criteria.
     rendered_image = rendered_image.clamp(0, 1)
+    if culled is not None:
+        radii = torch.zeros(num_points, dtype=radii.dtype, device=radii.device).index_copy_(0, culled, radii)
+    visible = radii > 0 if full_view_visible is None else (radii > 0) | full_view_visible
     out = {
         "render": rendered_image,
         "viewspace_points": screenspace_points,
-        "visibility_filter" : (radii > 0).nonzero(),
+        "visibility_filter" : visible,
         "radii": radii,
         "depth" : depth_image
         }
+    if track_contribution:
+        contribution = rasterizer.contribution
+        if culled is not None:
+            contribution = torch.zeros(num_points, device=contribution.device).index_copy_(0, culled, contribution)
+        out["contribution"] = contribution
     
     return out
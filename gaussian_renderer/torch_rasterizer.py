@@ -0,0 +1,224 @@
+from typing import NamedTuple
+import torch
+from utils.general_utils import build_scaling_rotation
+from utils.sh_utils import eval_sh
+
+BLOCK_X, BLOCK_Y = 16, 16
+# (gaussians x pixels) elements composited at once
+_BATCH_ELEMENTS = 1 << 22
+
+class RasterizationSettings(NamedTuple):
+    """Same fields as diff_gaussian_rasterization.GaussianRasterizationSettings."""
+    image_height: int
+    image_width: int
+    tanfovx: float
+    tanfovy: float
+    bg: torch.Tensor
+    scale_modifier: float
+    viewmatrix: torch.Tensor
+    projmatrix: torch.Tensor
+    sh_degree: int
+    campos: torch.Tensor
+    prefiltered: bool
+    debug: bool
+    antialiasing: bool
+
+def _covariance_3d(scales, rotations, scale_modifier):
+    L = build_scaling_rotation(scale_modifier * scales, rotations)
+    return L @ L.transpose(1, 2)
+
+def _unpack_covariance_3d(cov3D_precomp):
+    # upper triangle (xx, xy, xz, yy, yz, zz) as written by strip_symmetric
+    a, b, c, d, e, f = cov3D_precomp.unbind(dim=1)
+    return torch.stack([torch.stack([a, b, c], dim=1), torch.stack([b, d, e], dim=1), torch.stack([c, e, f], dim=1)], dim=1)
+
+class TorchRasterizer:
+    """
+    Pure PyTorch reference of the diff_gaussian_rasterization forward pass.
+
+    Follows the CUDA rasterizer step by step: projection with the 1.3 x fov
+    clamp and 0.3 px low-pass dilation, 3 sigma radii, 16x16 tile binning,
+    per-tile depth sort and front-to-back alpha compositing with the same
+    alpha (1/255, 0.99) and transmittance (1e-4) cut-offs. Runs on any device
+    and is differentiable through autograd; the gradient of `means2D` is the
+    screen-space gradient in the CUDA rasterizer's (NDC) units.
+
+    With `track_contribution`, each call also sets `contribution`, the largest
+    blending weight (alpha times transmittance) of every Gaussian over the
+    pixels of the image.
+    """
+
+    def __init__(self, raster_settings, track_contribution=False):
+        self.raster_settings = raster_settings
+        self.track_contribution = track_contribution
+        self.contribution = None
+
+    def preprocess(self, means3D, opacities, scales=None, rotations=None, cov3D_precomp=None):
+        """Pixel positions, depths, conics, opacities and integer radii of the Gaussians (radius 0 when culled)."""
+        settings = self.raster_settings
+        width, height = settings.image_width, settings.image_height
+        focal_x = width / (2.0 * settings.tanfovx)
+        focal_y = height / (2.0 * settings.tanfovy)
+
+        points = torch.cat([means3D, torch.ones_like(means3D[:, :1])], dim=1)
+        p_view = points @ settings.viewmatrix
+        in_frustum = p_view[:, 2] > 0.2
+        # culled Gaussians get a harmless depth so they cannot produce inf / nan gradients
+        ones = torch.ones_like(p_view[:, 2])
+        p_hom = points @ settings.projmatrix
+        p_proj = p_hom[:, :3] / (torch.where(in_frustum, p_hom[:, 3], ones)[:, None] + 0.0000001)
+
+        if cov3D_precomp is not None:
+            cov3D = _unpack_covariance_3d(cov3D_precomp)
+        else:
+            cov3D = _covariance_3d(scales, rotations, settings.scale_modifier)
+
+        # EWA splatting, the Jacobian evaluated at the clamped center
+        tz = torch.where(in_frustum, p_view[:, 2], ones)
+        limx, limy = 1.3 * settings.tanfovx, 1.3 * settings.tanfovy
+        tx = (p_view[:, 0] / tz).clamp(-limx, limx) * tz
+        ty = (p_view[:, 1] / tz).clamp(-limy, limy) * tz
+        zeros = torch.zeros_like(tz)
+        J = torch.stack([torch.stack([focal_x / tz, zeros, -(focal_x * tx) / (tz * tz)], dim=1),
+                         torch.stack([zeros, focal_y / tz, -(focal_y * ty) / (tz * tz)], dim=1)], dim=1)
+        T = J @ settings.viewmatrix[:3, :3].T
+        cov2D = T @ cov3D @ T.transpose(1, 2)
+        a, b, c = cov2D[:, 0, 0], cov2D[:, 0, 1], cov2D[:, 1, 1]
+
+        det_cov = a * c - b * b
+        a, c = a + 0.3, c + 0.3
+        det = a * c - b * b
+        opacity = opacities[:, 0]
+        if settings.antialiasing:
+            opacity = opacity * torch.sqrt(torch.clamp_min(det_cov / det, 0.000025))
+
+        valid = in_frustum & (det != 0)
+        det_inv = 1.0 / torch.where(valid, det, torch.ones_like(det))
+        conic = torch.stack([c * det_inv, -b * det_inv, a * det_inv], dim=1)
+
+        mid = 0.5 * (a + c)
+        lambda1 = mid + torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+        lambda2 = mid - torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+        radii = torch.ceil(3.0 * torch.sqrt(torch.maximum(lambda1, lambda2))).detach()
+        xy = torch.stack([((p_proj[:, 0] + 1.0) * width - 1.0) * 0.5, ((p_proj[:, 1] + 1.0) * height - 1.0) * 0.5], dim=1)
+
+        rect_min, rect_max = self._tile_rect(xy.detach(), radii)
+        touches_tiles = (rect_max - rect_min).prod(dim=1) > 0
+        valid = valid & touches_tiles & torch.isfinite(radii)
+        radii = torch.where(valid, radii, torch.zeros_like(radii)).int()
+        return xy, tz, conic, opacity, radii, rect_min, rect_max
+
+    def _tile_rect(self, xy, radii):
+        grid = torch.tensor([(self.raster_settings.image_width + BLOCK_X - 1) // BLOCK_X,
+                             (self.raster_settings.image_height + BLOCK_Y - 1) // BLOCK_Y], device=xy.device)
+        block = torch.tensor([BLOCK_X, BLOCK_Y], device=xy.device)
+        radii = torch.nan_to_num(radii, nan=0.0, posinf=0.0)[:, None]
+        # the CUDA code truncates towards zero
+        rect_min = torch.minimum(grid, torch.clamp_min(torch.trunc((xy - radii) / block), 0).long())
+        rect_max = torch.minimum(grid, torch.clamp_min(torch.trunc((xy + radii + block - 1) / block), 0).long())
+        return rect_min, rect_max
+
+    def colors(self, means3D, shs=None, dc=None, colors_precomp=None):
+        if colors_precomp is not None:
+            return colors_precomp
+        if dc is not None:
+            shs = torch.cat([dc, shs], dim=1)
+        directions = means3D - self.raster_settings.campos
+        directions = directions / directions.norm(dim=1, keepdim=True)
+        return torch.clamp_min(eval_sh(self.raster_settings.sh_degree, shs.transpose(1, 2), directions) + 0.5, 0.0)
+
+    def bin_tiles(self, depths, radii, rect_min, rect_max):
+        """Gaussian ids of every (tile, Gaussian) overlap sorted by tile then depth, and each tile's range in it."""
+        settings = self.raster_settings
+        grid_x = (settings.image_width + BLOCK_X - 1) // BLOCK_X
+        grid_y = (settings.image_height + BLOCK_Y - 1) // BLOCK_Y
+        visible = torch.nonzero(radii > 0, as_tuple=True)[0]
+        extent = (rect_max - rect_min)[visible]
+        counts = extent[:, 0] * extent[:, 1]
+
+        gaussian = torch.repeat_interleave(visible, counts)
+        first = torch.cumsum(counts, dim=0) - counts
+        local = torch.arange(gaussian.shape[0], device=depths.device) - torch.repeat_interleave(first, counts)
+        width = torch.repeat_interleave(extent[:, 0], counts)
+        tile_x = rect_min[gaussian, 0] + local % width
+        tile_y = rect_min[gaussian, 1] + local // width
+        tile = tile_y * grid_x + tile_x
+
+        depth_rank = torch.empty_like(radii, dtype=torch.long)
+        depth_rank[torch.argsort(depths.detach(), stable=True)] = torch.arange(depths.shape[0], device=depths.device)
+        order = torch.argsort(tile * depths.shape[0] + depth_rank[gaussian], stable=True)
+        tile_counts = torch.bincount(tile, minlength=grid_x * grid_y)
+        tile_ends = torch.cumsum(tile_counts, dim=0)
+        return gaussian[order], tile_ends - tile_counts, tile_counts
+
+    def __call__(self, means3D, means2D, opacities, shs=None, colors_precomp=None, scales=None, rotations=None,
+                 cov3D_precomp=None, dc=None):
+        """(3, H, W) image, (N,) radii and (1, H, W) inverse depth, as returned by GaussianRasterizer."""
+        settings = self.raster_settings
+        width, height = settings.image_width, settings.image_height
+        device = means3D.device
+
+        xy, depths, conic, opacity, radii, rect_min, rect_max = self.preprocess(means3D, opacities, scales, rotations, cov3D_precomp)
+        # means2D only carries the screen-space gradient, in NDC units like the CUDA rasterizer
+        xy = xy + means2D[:, :2] * torch.tensor([0.5 * width, 0.5 * height], device=device)
+        colors = self.colors(means3D, shs, dc, colors_precomp)
+        features = torch.cat([colors, 1.0 / depths[:, None]], dim=1)
+
+        gaussian_ids, tile_starts, tile_counts = self.bin_tiles(depths, radii, rect_min, rect_max)
+        grid_x = (width + BLOCK_X - 1) // BLOCK_X
+        pixel_y, pixel_x = torch.meshgrid(torch.arange(BLOCK_Y, device=device), torch.arange(BLOCK_X, device=device), indexing="ij")
+        pixel_offsets = torch.stack([pixel_x.reshape(-1), pixel_y.reshape(-1)], dim=1).float()
+
+        out = torch.zeros((features.shape[1], height, width), device=device)
+        if self.track_contribution:
+            self.contribution = torch.zeros(means3D.shape[0], device=device)
+        transmittance = torch.ones((1, height, width), device=device)
+        tiles = torch.nonzero(tile_counts, as_tuple=True)[0].tolist()
+        starts, counts = tile_starts.tolist(), tile_counts.tolist()
+        # tiles with similar counts are composited together, padded to the largest one
+        tiles.sort(key=lambda tile: counts[tile])
+        batch_start = 0
+        while batch_start < len(tiles):
+            batch_end = batch_start + 1
+            while (batch_end < len(tiles) and
+                   (batch_end - batch_start + 1) * counts[tiles[batch_end]] * BLOCK_X * BLOCK_Y <= _BATCH_ELEMENTS):
+                batch_end += 1
+            batch = tiles[batch_start:batch_end]
+            batch_start = batch_end
+
+            length = counts[batch[-1]]
+            index = torch.arange(length, device=device)
+            batch_starts = torch.tensor([starts[tile] for tile in batch], device=device)
+            batch_counts = torch.tensor([counts[tile] for tile in batch], device=device)
+            present = index[None] < batch_counts[:, None]
+            ids = gaussian_ids[torch.where(present, batch_starts[:, None] + index[None], 0)]
+
+            tile_index = torch.tensor(batch, device=device)
+            origin = torch.stack([tile_index % grid_x * BLOCK_X, tile_index // grid_x * BLOCK_Y], dim=1).float()
+            pixels = origin[:, None] + pixel_offsets[None]
+            d = xy[ids][:, :, None] - pixels[:, None]
+            con = conic[ids]
+            power = (-0.5 * (con[..., 0:1] * d[..., 0] ** 2 + con[..., 2:3] * d[..., 1] ** 2)
+                     - con[..., 1:2] * d[..., 0] * d[..., 1])
+            alpha = torch.clamp_max(opacity[ids][..., None] * torch.exp(power), 0.99)
+            alpha = torch.where(present[..., None] & (power <= 0) & (alpha >= 1.0 / 255.0), alpha, torch.zeros_like(alpha))
+
+            # front to back; a Gaussian is blended only while the transmittance after it stays >= 1e-4
+            T_after = torch.cumprod(1 - alpha, dim=1)
+            T_before = torch.cat([torch.ones_like(T_after[:, :1]), T_after[:, :-1]], dim=1)
+            blended = T_after >= 0.0001
+            weights = torch.where(blended, alpha * T_before, torch.zeros_like(alpha))
+            T_final = torch.where(blended, 1 - alpha, torch.ones_like(alpha)).prod(dim=1)
+            tile_out = torch.einsum("bgp,bgc->bcp", weights, features[ids])
+            if self.track_contribution:
+                # padding entries have zero weight
+                self.contribution.scatter_reduce_(0, ids.reshape(-1), weights.detach().amax(dim=2).reshape(-1), "amax")
+
+            for batch_tile, tile in enumerate(batch):
+                x0, y0 = tile % grid_x * BLOCK_X, tile // grid_x * BLOCK_Y
+                x1, y1 = min(x0 + BLOCK_X, width), min(y0 + BLOCK_Y, height)
+                out[:, y0:y1, x0:x1] = tile_out[batch_tile].reshape(-1, BLOCK_Y, BLOCK_X)[:, :y1 - y0, :x1 - x0]
+                transmittance[:, y0:y1, x0:x1] = T_final[batch_tile].reshape(1, BLOCK_Y, BLOCK_X)[:, :y1 - y0, :x1 - x0]
+
+        color = out[:colors.shape[1]] + transmittance * settings.bg[:, None, None]
+        return color, radii, out[colors.shape[1]:]
@@ -5,11 +5,20 @@ from pathlib import Path
 from PIL import Image as PILImage
 from utils.general_utils import PILtoTorchMask
 from utils.read_write_model import (
-    read_points3D_binary, read_images_binary, read_cameras_binary, qvec2rotmat
+    read_points3D_binary_columnar, read_images_binary, read_images_binary_columnar, read_cameras_binary, qvec2rotmat
 )
+from utils.track_utils import PointTrackIndex
+from utils.mask_cache import get_mask_cache
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Upper bound on the scratch memory used per projection chunk
+MASK_PROJECTION_BUDGET_MB = 256
+# Rough number of bytes of temporaries needed to project one (point, view) pair
+_BYTES_PER_PAIR = 256
+
+_projectors = {}
+
 def load_mask(mask_path, resolution = None):
     """Load a mask image and return it as a binary numpy array."""
     mask = PILImage.open(mask_path)
@@ -24,28 +33,18 @@ def load_mask(mask_path, resolution = None):
 
 def get_track_ids(source_path):
     """
-    Get the track IDs from the COLMAP sparse reconstruction directory.
+    Get the track IDs from the COLMAP sparse reconstruction directory as a PointTrackIndex.
     """
     points3D_path = os.path.join(source_path, "sparse/0/points3D.bin")
-    points3D = read_points3D_binary(points3D_path)
-    images_path = os.path.join(source_path, "sparse/0/images.bin")
-    images = read_images_binary(images_path)
-
-    num_images = len(images)+1
-    track_ids = torch.zeros((len(points3D), num_images), dtype=torch.bool, device=device)
-
-    for i, (point_id, point) in enumerate(points3D.items()):
-        for img_id in point.image_ids:
-            track_ids[i, img_id] = True
-
-    return track_ids
+    points3D = read_points3D_binary_columnar(points3D_path)
+    return PointTrackIndex.from_colmap(points3D.track_offsets, points3D.image_ids, device=device)
 
 def localize_gaussians(points, track_ids, source_path, visibility_threshold=1):
     """
     Get boolean mask of points which project onto text regions in the images at least `visibility_threshold` times.
     Args:
         points (torch.Tensor): Tensor of shape (N, 3) containing 3D points.
-        track_ids (torch.Tensor): Tensor of shape (N, T) containing track IDs for each point.
+        track_ids (PointTrackIndex): Images observing each of the N points.
         source_path (str): Path to the COLMAP sparse reconstruction directory.
         visibility_threshold (int): Minimum number of images a point must be visible in to be considered valid.
     Returns:
@@ -55,10 +54,135 @@ def localize_gaussians(points, track_ids, source_path, visibility_threshold=1):
     visibility_counts = get_vis_counts(points, track_ids, source_path)
     return visibility_counts >= visibility_threshold
 
+class MaskProjector:
+    """
+    Projects points into all masked views of a COLMAP reconstruction at once.
+
+    Extrinsics and intrinsics of every view with a non-empty text mask are stacked
+    into batched tensors and the masks are kept as a bit-packed ragged stack, so
+    repeated visibility queries neither re-read masks from disk nor loop over
+    images in Python. Only (point, view) pairs present in the point tracks are
+    projected, in chunks bounded by `memory_budget_mb`.
+    """
+
+    def __init__(self, source_path, device=device, memory_budget_mb=MASK_PROJECTION_BUDGET_MB):
+        masks_dir = os.path.join(source_path, "masks")
+        if not os.path.exists(masks_dir):
+            print(f"Mask directory does not exist: {masks_dir}")
+            exit(1)
+
+        cameras = read_cameras_binary(os.path.join(source_path, "sparse/0/cameras.bin"))
+        images = read_images_binary_columnar(os.path.join(source_path, "sparse/0/images.bin"))
+
+        self.device = torch.device(device)
+        self.memory_budget_mb = memory_budget_mb
+
+        mask_cache = get_mask_cache(source_path)
+        image_ids, rotations, translations, intrinsics, sizes = [], [], [], [], []
+        mask_bits, mask_byte_offsets = [], []
+        num_mask_bytes = 0
+        for i, img_id in enumerate(images.ids.tolist()):
+            mask_path = os.path.join(masks_dir, f"{Path(images.names[i])}")
+            camera = cameras[images.camera_ids[i]]
+            packed = mask_cache.get_packed(mask_path, (camera.width, camera.height))
+            if packed is None or not packed.any():
+                continue
+
+            if len(camera.params) == 3:
+                f, cx, cy = camera.params
+                fx, fy = f, f
+            else:
+                fx, fy, cx, cy = camera.params[:4]
+
+            image_ids.append(img_id)
+            rotations.append(qvec2rotmat(images.qvecs[i]))
+            translations.append(images.tvecs[i])
+            intrinsics.append((fx, fy, cx, cy))
+            sizes.append((camera.width, camera.height))
+            mask_bits.append(packed)
+            mask_byte_offsets.append(num_mask_bytes)
+            num_mask_bytes += packed.shape[0]
+
+        self.image_ids = torch.tensor(image_ids, dtype=torch.long, device=self.device)
+        self.R = torch.tensor(np.array(rotations), dtype=torch.float32, device=self.device).reshape(-1, 3, 3)
+        self.T = torch.tensor(np.array(translations), dtype=torch.float32, device=self.device).reshape(-1, 3)
+        self.intrinsics = torch.tensor(intrinsics, dtype=torch.float32, device=self.device).reshape(-1, 4)
+        self.sizes = torch.tensor(sizes, dtype=torch.long, device=self.device).reshape(-1, 2)
+        self.mask_byte_offsets = torch.tensor(mask_byte_offsets, dtype=torch.long, device=self.device)
+        self.mask_bits = torch.from_numpy(np.concatenate(mask_bits) if mask_bits else np.zeros(0, dtype=np.uint8)).to(self.device)
+
+        max_image_id = max(images.ids.tolist(), default=0)
+        self.image_to_view = torch.full((max_image_id + 1,), -1, dtype=torch.long, device=self.device)
+        self.image_to_view[self.image_ids] = torch.arange(len(image_ids), device=self.device)
+        mask_cache.flush()
+
+    @property
+    def num_views(self):
+        return self.image_ids.shape[0]
+
+    def _track_pairs(self, track_ids):
+        """(point, view) pairs of the track index that fall on a masked view."""
+        track_ids = track_ids.to(self.device)
+        image_ids = track_ids.image_ids.long()
+        in_range = image_ids < self.image_to_view.shape[0]
+        views = torch.where(in_range, self.image_to_view[image_ids.clamp(max=self.image_to_view.shape[0] - 1)], -1)
+        keep = views >= 0
+        return track_ids.rows()[keep], views[keep]
+
+    def project_hits(self, points, views):
+        """
+        Project points[i] into view views[i] and return whether it lands on a text pixel.
+        Args:
+            points (torch.Tensor): (P, 3) world-space points.
+            views (torch.Tensor): (P,) view indices into the stacked cameras.
+        """
+        points_cam = torch.bmm(self.R[views], points.unsqueeze(-1)).squeeze(-1) + self.T[views]
+        z = points_cam[:, 2]
+        fx, fy, cx, cy = self.intrinsics[views].unbind(-1)
+        width, height = self.sizes[views].unbind(-1)
+
+        u = fx * (points_cam[:, 0] / z) + cx
+        v = fy * (points_cam[:, 1] / z) + cy
+        valid = (z > 0) & (u >= 0) & (u < width) & (v >= 0) & (v < height)
+
+        u_int = torch.where(valid, u, 0).long()
+        v_int = torch.where(valid, v, 0).long()
+        bit = v_int * width + u_int
+        byte = self.mask_bits[self.mask_byte_offsets[views] + (bit >> 3)]
+        return valid & (((byte.long() >> (bit & 7)) & 1) == 1)
+
+    def visibility_counts(self, points, track_ids):
+        """Number of masked views in which each point is tracked and projects onto text."""
+        points = points.detach().to(self.device, torch.float32)
+        visibility_counts = torch.zeros(points.shape[0], dtype=torch.int32, device=self.device)
+        if self.num_views == 0:
+            return visibility_counts
+
+        rows, views = self._track_pairs(track_ids)
+        chunk_size = max(1, int(self.memory_budget_mb * 2**20) // _BYTES_PER_PAIR)
+        for start in range(0, rows.shape[0], chunk_size):
+            chunk_rows = rows[start:start + chunk_size]
+            hits = self.project_hits(points[chunk_rows], views[start:start + chunk_size])
+            visibility_counts.index_add_(0, chunk_rows, hits.int())
+        return visibility_counts
+
+def get_mask_projector(source_path, device=device):
+    """Return the MaskProjector of `source_path`, building it on first use."""
+    key = (os.path.abspath(source_path), str(device))
+    if key not in _projectors:
+        _projectors[key] = MaskProjector(source_path, device=device)
+    return _projectors[key]
+
 def get_vis_counts(points, track_ids, source_path):
     """
     Get visibility counts for each point based on mask projections.
     """
+    return get_mask_projector(source_path).visibility_counts(points, track_ids)
+
+def get_vis_counts_reference(points, track_ids, source_path, device=device):
+    """
+    Per-image reference implementation of get_vis_counts, kept to validate and benchmark MaskProjector.
+    """
     
     masks_dir = os.path.join(source_path, "masks")
     if not os.path.exists(masks_dir):
@@ -72,6 +196,7 @@ def get_vis_counts(points, track_ids, source_path):
     images = read_images_binary(images_path)
     
     points_tensor = points.clone().detach().to(device)
+    track_ids = track_ids.to(device)
     
     visibility_counts = torch.zeros(len(points), dtype=torch.int32, device=device)
 
@@ -99,7 +224,7 @@ def get_vis_counts(points, track_ids, source_path):
         R = torch.from_numpy(R).float().to(device)
         T = torch.from_numpy(img.tvec).float().to(device)
 
-        visible_points_mask = track_ids[:, img_id] == True
+        visible_points_mask = track_ids.column(img_id)
 
         points_cam = torch.mm(points_tensor, R.T) + T
         z = points_cam[:, 2]
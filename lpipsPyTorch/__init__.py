@@ -2,6 +2,68 @@ import torch
 
 from .modules.lpips import LPIPS
 
+_modules = {}
+_evaluators = {}
+
+
+def get_lpips_module(net_type: str = 'alex', version: str = '0.1', device='cpu', half: bool = False):
+    r"""The LPIPS module of (net_type, version) on `device`, with a float16 feature network if `half`.
+    The network is built and its linear layers loaded only once per combination.
+    """
+    key = (net_type, version, str(torch.device(device)), half)
+    if key not in _modules:
+        module = LPIPS(net_type, version).to(device).eval()
+        if half:
+            # the features are normalized and weighted in float32
+            module.net.half()
+        _modules[key] = module
+    return _modules[key]
+
+
+class LPIPSEvaluator:
+    r"""Batched LPIPS of image pairs for evaluation, with a cached network.
+
+    Arguments:
+        net_type (str): 'alex' | 'squeeze' | 'vgg'. Default: 'alex'.
+        version (str): the version of LPIPS. Default: 0.1.
+        device: device the network runs on. Default: cuda.
+        half (bool): run the feature network in float16. Default: False.
+    """
+    def __init__(self, net_type: str = 'alex', version: str = '0.1', device='cuda', half: bool = False):
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if half else torch.float32
+        self.module = get_lpips_module(net_type, version, self.device, half)
+
+    def __call__(self, x: torch.Tensor, y: torch.Tensor, batch_size: int = 8):
+        r"""(N,) LPIPS of N x 3 x H x W image pairs, evaluated batch_size pairs at a time."""
+        values = []
+        with torch.inference_mode():
+            for start in range(0, x.shape[0], batch_size):
+                x_batch = x[start:start + batch_size].to(self.device, self.dtype)
+                y_batch = y[start:start + batch_size].to(self.device, self.dtype)
+                values.append(self.module(x_batch, y_batch).float().flatten())
+        return torch.cat(values) if values else torch.zeros(0, device=self.device)
+
+    def pairs(self, xs, ys, batch_size: int = 8):
+        r"""(N,) LPIPS of two lists of 1 x 3 x H x W images, batching consecutive images of the same size."""
+        values = []
+        start = 0
+        while start < len(xs):
+            end = start + 1
+            while end < len(xs) and end - start < batch_size and xs[end].shape == xs[start].shape:
+                end += 1
+            values.append(self(torch.cat(xs[start:end]), torch.cat(ys[start:end]), batch_size))
+            start = end
+        return torch.cat(values) if values else torch.zeros(0, device=self.device)
+
+
+def get_lpips_evaluator(net_type: str = 'alex', version: str = '0.1', device='cuda', half: bool = False):
+    r"""The LPIPSEvaluator of (net_type, version, device, half), created once."""
+    key = (net_type, version, str(torch.device(device)), half)
+    if key not in _evaluators:
+        _evaluators[key] = LPIPSEvaluator(net_type, version, device, half)
+    return _evaluators[key]
+
 
 def lpips(x: torch.Tensor,
           y: torch.Tensor,
@@ -16,6 +78,5 @@ def lpips(x: torch.Tensor,
                         'alex' | 'squeeze' | 'vgg'. Default: 'alex'.
         version (str): the version of LPIPS. Default: 0.1.
     """
-    device = x.device
-    criterion = LPIPS(net_type, version).to(device)
+    criterion = get_lpips_module(net_type, version, x.device)
     return criterion(x, y)
@@ -57,7 +57,8 @@ class BaseNet(nn.Module):
         for i, (_, layer) in enumerate(self.layers._modules.items(), 1):
             x = layer(x)
             if i in self.target_layers:
-                output.append(normalize_activation(x))
+                # normalized in float32, a half precision network's eps would underflow
+                output.append(normalize_activation(x.float()))
             if len(output) == len(self.target_layers):
                 break
         return output
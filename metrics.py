@@ -11,29 +11,28 @@
 
 from pathlib import Path
 import os
-from PIL import Image
+import math
 import torch
-import torchvision.transforms.functional as tf
-from utils.loss_utils import ssim
-from lpipsPyTorch import lpips
+from lpipsPyTorch import get_lpips_evaluator
 import json
 from tqdm import tqdm
-from utils.image_utils import psnr
+from utils.metric_utils import image_metrics
+from utils.image_pair_loader import ImagePairLoader
+from utils.text_regions import evaluate_text_regions, REGION_METRICS
 from argparse import ArgumentParser
 
-def readImages(renders_dir, gt_dir):
-    renders = []
-    gts = []
-    image_names = []
-    for fname in os.listdir(renders_dir):
-        render = Image.open(renders_dir / fname)
-        gt = Image.open(gt_dir / fname)
-        renders.append(tf.to_tensor(render).unsqueeze(0)[:, :3, :, :].cuda())
-        gts.append(tf.to_tensor(gt).unsqueeze(0)[:, :3, :, :].cuda())
-        image_names.append(fname)
-    return renders, gts, image_names
+def finite_or_none(value):
+    # NaN and inf are not valid json
+    return value if math.isfinite(value) else None
 
-def evaluate(model_paths):
+def evaluate(model_paths, lpips_batch_size=8, lpips_half=False, batch_size=8, num_workers=4, max_in_flight=2,
+             text_regions=False, regions_only=False, region_padding=8, region_min_area=16):
+
+    text_regions = text_regions or regions_only
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    # built once, every scene and method reuses the network
+    lpips_evaluator = get_lpips_evaluator('vgg', device=device, half=lpips_half)
 
     full_dict = {}
     per_view_dict = {}
@@ -62,29 +61,76 @@ def evaluate(model_paths):
                 method_dir = test_dir / method
                 gt_dir = method_dir/ "gt"
                 renders_dir = method_dir / "renders"
-                renders, gts, image_names = readImages(renders_dir, gt_dir)
+                masks_dir = method_dir / "masks"
+                if not masks_dir.is_dir():
+                    masks_dir = None
+                loader = ImagePairLoader(renders_dir, gt_dir, masks_dir, batch_size=batch_size, num_workers=num_workers,
+                                         max_in_flight=max_in_flight, device=device)
 
-                ssims = []
-                psnrs = []
+                values = {}
                 lpipss = []
-
-                for idx in tqdm(range(len(renders)), desc="Metric evaluation progress"):
-                    ssims.append(ssim(renders[idx], gts[idx]))
-                    psnrs.append(psnr(renders[idx], gts[idx]))
-                    lpipss.append(lpips(renders[idx], gts[idx], net_type='vgg'))
-
-                print("  SSIM : {:>12.7f}".format(torch.tensor(ssims).mean(), ".5"))
-                print("  PSNR : {:>12.7f}".format(torch.tensor(psnrs).mean(), ".5"))
-                print("  LPIPS: {:>12.7f}".format(torch.tensor(lpipss).mean(), ".5"))
+                regions = {}
+                image_names = []
+                method_regions = text_regions and masks_dir is not None
+                if text_regions and not method_regions:
+                    print("[ WARNING ] No masks found at {}, text regions are not evaluated".format(method_dir / "masks"))
+
+                with torch.no_grad(), tqdm(total=len(loader), desc="Metric evaluation progress") as progress_bar:
+                    for renders, gts, masks, names in loader:
+                        if not regions_only:
+                            # SSIM, PSNR and their text variants in one pass over the batch
+                            for key, value in image_metrics(renders, gts, masks).items():
+                                values.setdefault(key, []).append(value)
+                            lpipss.extend(lpips_evaluator(renders, gts, lpips_batch_size).tolist())
+                        if method_regions:
+                            regions.update(evaluate_text_regions(renders, gts, masks, names, lpips_evaluator, lpips_batch_size,
+                                                                 region_padding, region_min_area))
+                        image_names.extend(names)
+                        progress_bar.update(len(names))
+                values = {key: torch.cat(value).tolist() for key, value in values.items()}
+
+                if not regions_only:
+                    ssims = values["ssim"]
+                    psnrs = values["psnr"]
+                    print("  SSIM : {:>12.7f}".format(torch.tensor(ssims).mean(), ".5"))
+                    print("  PSNR : {:>12.7f}".format(torch.tensor(psnrs).mean(), ".5"))
+                    print("  LPIPS: {:>12.7f}".format(torch.tensor(lpipss).mean(), ".5"))
+                    if "psnr_text" in values:
+                        print("  SSIM (text): {:>12.7f}".format(torch.tensor(values["ssim_text"]).nanmean(), ".5"))
+                        print("  PSNR (text): {:>12.7f}".format(torch.tensor(values["psnr_text"]).nanmean(), ".5"))
+
+                    full_dict[scene_dir][method].update({"SSIM": torch.tensor(ssims).mean().item(),
+                                                            "PSNR": torch.tensor(psnrs).mean().item(),
+                                                            "LPIPS": torch.tensor(lpipss).mean().item()})
+                    per_view_dict[scene_dir][method].update({"SSIM": {name: ssim for ssim, name in zip(torch.tensor(ssims).tolist(), image_names)},
+                                                                "PSNR": {name: psnr for psnr, name in zip(torch.tensor(psnrs).tolist(), image_names)},
+                                                                "LPIPS": {name: lp for lp, name in zip(torch.tensor(lpipss).tolist(), image_names)}})
+                    if "psnr_text" in values:
+                        # means over the views that show text, views without text are null in the json
+                        full_dict[scene_dir][method].update({"SSIM_text": torch.tensor(values["ssim_text"]).nanmean().item(),
+                                                                "PSNR_text": torch.tensor(values["psnr_text"]).nanmean().item(),
+                                                                "L1_text": torch.tensor(values["l1_text"]).nanmean().item()})
+                        text_values = lambda key: {name: finite_or_none(value) for name, value in zip(image_names, values[key])}
+                        per_view_dict[scene_dir][method].update({"SSIM_text": text_values("ssim_text"),
+                                                                    "PSNR_text": text_values("psnr_text"),
+                                                                    "L1_text": text_values("l1_text")})
+
+                if method_regions:
+                    # region scores are means over the regions, of a view or of all views
+                    region_mean = lambda records, key: finite_or_none(torch.tensor([record[key] for record in records]).nanmean().item()) if records else None
+                    region_scores = lambda records: {key: region_mean(records, key) for key in REGION_METRICS.values()}
+                    all_regions = [record for name in image_names for record in regions[name]]
+                    scores = region_scores(all_regions)
+                    for key in ("SSIM", "PSNR", "LPIPS"):
+                        print("  {:5} ({} regions): {:>12.7f}".format(key, len(all_regions), scores[key] if scores[key] is not None else float("nan")))
+
+                    full_dict[scene_dir][method]["regions"] = {"count": len(all_regions), **scores}
+                    per_view_dict[scene_dir][method]["regions"] = {
+                        name: {**region_scores(regions[name]),
+                               "regions": [{key: value if key == "box" else finite_or_none(value) for key, value in record.items()} for record in regions[name]]}
+                        for name in image_names}
                 print("")
 
-                full_dict[scene_dir][method].update({"SSIM": torch.tensor(ssims).mean().item(),
-                                                        "PSNR": torch.tensor(psnrs).mean().item(),
-                                                        "LPIPS": torch.tensor(lpipss).mean().item()})
-                per_view_dict[scene_dir][method].update({"SSIM": {name: ssim for ssim, name in zip(torch.tensor(ssims).tolist(), image_names)},
-                                                            "PSNR": {name: psnr for psnr, name in zip(torch.tensor(psnrs).tolist(), image_names)},
-                                                            "LPIPS": {name: lp for lp, name in zip(torch.tensor(lpipss).tolist(), image_names)}})
-
             with open(scene_dir + "/results.json", 'w') as fp:
                 json.dump(full_dict[scene_dir], fp, indent=True)
             with open(scene_dir + "/per_view.json", 'w') as fp:
@@ -93,11 +139,21 @@ def evaluate(model_paths):
             print("Unable to compute metrics for model", scene_dir)
 
 if __name__ == "__main__":
-    device = torch.device("cuda:0")
-    torch.cuda.set_device(device)
+    if torch.cuda.is_available():
+        torch.cuda.set_device(torch.device("cuda:0"))
 
     # Set up command line argument parser
     parser = ArgumentParser(description="Training script parameters")
     parser.add_argument('--model_paths', '-m', required=True, nargs="+", type=str, default=[])
+    parser.add_argument('--lpips_batch_size', type=int, default=8, help="image pairs per LPIPS forward pass")
+    parser.add_argument('--lpips_half', action="store_true", help="evaluate LPIPS in half precision")
+    parser.add_argument('--batch_size', type=int, default=8, help="image pairs decoded and uploaded together")
+    parser.add_argument('--num_workers', type=int, default=4, help="image decoding threads")
+    parser.add_argument('--max_in_flight', type=int, default=2, help="batches decoded ahead of the one being evaluated")
+    parser.add_argument('--text_regions', action="store_true", help="also evaluate crops around the connected text regions of the masks")
+    parser.add_argument('--regions_only', action="store_true", help="evaluate the text region crops only, not the full frames")
+    parser.add_argument('--region_padding', type=int, default=8, help="pixels added around the text regions, closer regions are merged")
+    parser.add_argument('--region_min_area', type=int, default=16, help="text pixels below which a region is ignored")
     args = parser.parse_args()
-    evaluate(args.model_paths)
+    evaluate(args.model_paths, args.lpips_batch_size, args.lpips_half, args.batch_size, args.num_workers, args.max_in_flight,
+             args.text_regions, args.regions_only, args.region_padding, args.region_min_area)
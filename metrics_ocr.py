@@ -3,7 +3,7 @@ import os
 import json
 from argparse import ArgumentParser
 
-from metrics_ocr.run_ocr import run_ocr
+from metrics_ocr.run_ocr import run_ocr, add_ocr_arguments, get_dispatcher
 from metrics_ocr.visualize_ocr import visualize_folder
 from metrics_ocr.get_ocr_results import evaluate_cer
 
@@ -11,7 +11,9 @@ from metrics_ocr.get_ocr_results import evaluate_cer
 if __name__ == "__main__":
     parser = ArgumentParser(description="Training script parameters")
     parser.add_argument('--model_paths', '-m', required=True, nargs="+", type=str, default=[])
+    add_ocr_arguments(parser)
     args = parser.parse_args()
+    dispatcher = get_dispatcher(args)
 
     for model_path in args.model_paths:
         print(f"OCR Evaluation for model: {model_path}")
@@ -30,13 +32,13 @@ if __name__ == "__main__":
             gt_output_folder = ocr_output_dir / "gt"
             gt_ocr_jsons = gt_output_folder / "ocr_jsons"
             gt_ocr_visualizations = gt_output_folder / "visualizations"
-            run_ocr(str(gt_dir), str(masks_dir), str(gt_ocr_jsons))
+            run_ocr(str(gt_dir), str(masks_dir), str(gt_ocr_jsons), dispatcher)
             visualize_folder(str(gt_dir), str(gt_ocr_jsons), str(gt_ocr_visualizations))
 
             renders_output_folder = ocr_output_dir / method
             renders_ocr_jsons = renders_output_folder / "ocr_jsons"
             renders_ocr_visualizations = renders_output_folder / "visualizations"
-            run_ocr(str(renders_dir), str(masks_dir), str(renders_ocr_jsons))
+            run_ocr(str(renders_dir), str(masks_dir), str(renders_ocr_jsons), dispatcher)
             visualize_folder(str(renders_dir), str(renders_ocr_jsons), str(renders_ocr_visualizations))
 
             results = evaluate_cer(str(gt_ocr_jsons), str(renders_ocr_jsons))
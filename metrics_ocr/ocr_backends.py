@@ -0,0 +1,245 @@
+import abc
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from shapely.geometry import Polygon
+
+class OCRError(Exception):
+    """OCR request failure; `retryable` failures are retried by the OCRDispatcher."""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+def text_region(text, vertices):
+    """OCR region dict of a detected text and its polygon vertices [(x, y), ...], None if they do not form a polygon."""
+    try:
+        poly = Polygon(vertices)
+        if not poly.is_valid:
+            poly = poly.convex_hull
+    except Exception as e:
+        print(f"Error processing polygon for text '{text}': {str(e)}")
+        return None
+    return {'text': text, 'polygon': list(vertices), 'bounds': list(vertices)}
+
+class OCRBackend(abc.ABC):
+    """
+    Text detection on encoded images. `recognize_batch` returns, for each
+    image, its list of region dicts (see text_region) or None if the image
+    could not be processed; it may raise for failures of the whole request.
+    """
+
+    name = None
+    # images sent in one request
+    max_batch_size = 1
+
+    @abc.abstractmethod
+    def recognize(self, content):
+        """List of region dicts of the encoded image `content`, None if it could not be processed."""
+
+    def recognize_batch(self, contents):
+        return [self.recognize(content) for content in contents]
+
+    def retryable(self, error):
+        """Whether a request that raised `error` is worth sending again."""
+        if isinstance(error, OCRError):
+            return error.retryable
+        return isinstance(error, (ConnectionError, TimeoutError, urllib.error.URLError))
+
+class VisionBackend(OCRBackend):
+    """Google Cloud Vision text detection, batching up to 16 images per request."""
+
+    name = "vision"
+    max_batch_size = 16
+
+    def __init__(self):
+        from google.cloud import vision
+        self.vision = vision
+        self.client = vision.ImageAnnotatorClient()
+
+    def _regions(self, response):
+        if response.error.message:
+            print(f"API Error: {response.error.message}")
+            return None
+        regions = []
+        for text in response.text_annotations[1:]:  # Skip first annotation (aggregated text)
+            region = text_region(text.description, [(v.x, v.y) for v in text.bounding_poly.vertices])
+            if region is not None:
+                regions.append(region)
+        return regions
+
+    def recognize(self, content):
+        return self._regions(self.client.text_detection(image=self.vision.Image(content=content)))
+
+    def recognize_batch(self, contents):
+        if len(contents) == 1:
+            return [self.recognize(contents[0])]
+        feature = self.vision.Feature(type_=self.vision.Feature.Type.TEXT_DETECTION)
+        requests = [self.vision.AnnotateImageRequest(image=self.vision.Image(content=content), features=[feature]) for content in contents]
+        return [self._regions(response) for response in self.client.batch_annotate_images(requests=requests).responses]
+
+    def retryable(self, error):
+        from google.api_core import exceptions
+        return isinstance(error, (exceptions.TooManyRequests, exceptions.ServiceUnavailable, exceptions.DeadlineExceeded,
+                                  exceptions.InternalServerError)) or super().retryable(error)
+
+class TesseractBackend(OCRBackend):
+    """Offline word detection with a local Tesseract install (pytesseract)."""
+
+    name = "tesseract"
+
+    def __init__(self, lang="eng", min_confidence=0.0):
+        import pytesseract
+        from PIL import Image
+        self.pytesseract = pytesseract
+        self.Image = Image
+        self.lang = lang
+        self.min_confidence = min_confidence
+
+    def recognize(self, content):
+        image = self.Image.open(io.BytesIO(content))
+        data = self.pytesseract.image_to_data(image, lang=self.lang, output_type=self.pytesseract.Output.DICT)
+        regions = []
+        for text, conf, x, y, w, h in zip(data['text'], data['conf'], data['left'], data['top'], data['width'], data['height']):
+            # words only, the layout levels above them have no text
+            if not text.strip() or float(conf) < self.min_confidence:
+                continue
+            region = text_region(text.strip(), [(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+            if region is not None:
+                regions.append(region)
+        return regions
+
+class HTTPBackend(OCRBackend):
+    """
+    OCR service on `url` that takes a PNG as the POST body and answers with a
+    JSON list of {"text", "polygon": [[x, y], ...]}, e.g. a local engine
+    wrapped in a small web server, or a stand-in for testing.
+    """
+
+    name = "http"
+
+    def __init__(self, url, timeout=60.0):
+        self.url = url
+        self.timeout = timeout
+
+    def recognize(self, content):
+        request = urllib.request.Request(self.url, data=content, headers={'Content-Type': 'image/png'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                answer = json.load(response)
+        except urllib.error.HTTPError as e:
+            raise OCRError(f"{self.url} answered {e.code}", retryable=e.code == 429 or e.code >= 500) from e
+        regions = []
+        for item in answer.get('regions', []) if isinstance(answer, dict) else answer:
+            region = text_region(item['text'], [tuple(vertex) for vertex in item['polygon']])
+            if region is not None:
+                regions.append(region)
+        return regions
+
+BACKENDS = {backend.name: backend for backend in (VisionBackend, TesseractBackend, HTTPBackend)}
+
+def create_backend(name="vision", url=None, lang="eng"):
+    if name == "http":
+        if not url:
+            raise ValueError("The http OCR backend needs a url")
+        return HTTPBackend(url)
+    if name == "tesseract":
+        return TesseractBackend(lang)
+    if name == "vision":
+        return VisionBackend()
+    raise ValueError(f"Unknown OCR backend '{name}', expected one of {', '.join(BACKENDS)}")
+
+class RateLimiter:
+    """Spaces requests so that at most `rate` images per second are sent, across threads. A rate of 0 disables it."""
+
+    def __init__(self, rate=0.0):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self, count=1):
+        if self.interval == 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + count * self.interval
+        if start > now:
+            time.sleep(start - now)
+
+class OCRDispatcher:
+    """
+    Runs an OCRBackend over many images with at most `concurrency` requests
+    in flight. Images are sent in batches of up to `batch_size` (capped by the
+    backend), rate limited to `rate_limit` images per second; requests that
+    fail with a retryable error are retried up to `max_retries` times with
+    exponential backoff from `retry_delay` seconds.
+    """
+
+    def __init__(self, backend, concurrency=8, batch_size=None, rate_limit=0.0, max_retries=3, retry_delay=1.0):
+        self.backend = backend
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, min(batch_size or backend.max_batch_size, backend.max_batch_size))
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _request(self, contents):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(len(contents))
+            try:
+                return self.backend.recognize_batch(contents)
+            except Exception as e:
+                if attempt == self.max_retries or not self.backend.retryable(e):
+                    raise
+                delay = self.retry_delay * 2 ** attempt
+                print(f"OCR request failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _run_batch(self, keys, load):
+        contents, results = [], {}
+        for key in keys:
+            try:
+                contents.append((key, load(key)))
+            except Exception as e:
+                print(f"OCR failed for {key}: {str(e)}")
+                results[key] = None
+        if contents:
+            try:
+                regions = self._request([content for _, content in contents])
+            except Exception as e:
+                print(f"OCR failed for {', '.join(str(key) for key, _ in contents)}: {str(e)}")
+                regions = [None] * len(contents)
+            results.update({key: value for (key, _), value in zip(contents, regions)})
+        return [(key, results[key]) for key in keys]
+
+    def map(self, keys, load):
+        """
+        Yields (key, regions) for each of `keys` in order, regions None on
+        failure. `load(key)` returns the encoded image and runs on the worker
+        threads, so at most about 2 * concurrency batches are held in memory.
+        """
+        keys = list(keys)
+        batches = iter([keys[start:start + self.batch_size] for start in range(0, len(keys), self.batch_size)])
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ocr") as executor:
+            def submit():
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.append(executor.submit(self._run_batch, batch, load))
+
+            try:
+                for _ in range(2 * self.concurrency):
+                    submit()
+                while pending:
+                    results = pending.popleft().result()
+                    submit()
+                    yield from results
+            finally:
+                for future in pending:
+                    future.cancel()
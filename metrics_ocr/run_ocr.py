@@ -1,15 +1,18 @@
 import os
 import json
-from google.cloud import vision
-from shapely.geometry import Polygon
 from tqdm import tqdm
 import cv2
 import numpy as np
+from metrics_ocr.ocr_backends import BACKENDS, OCRDispatcher, create_backend
 
-client = vision.ImageAnnotatorClient()
+_default_backend = None
 
-def polygon_from_vertices(vertices):
-    return Polygon([(vertex.x, vertex.y) for vertex in vertices])
+def get_default_backend():
+    """The Google Vision backend, created on first use."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = create_backend("vision")
+    return _default_backend
 
 def multiply_image_with_mask(image_path, mask_path):
     image = cv2.imread(image_path)
@@ -32,57 +35,31 @@ def multiply_image_with_mask(image_path, mask_path):
     content = buffer.tobytes()
     return content
 
-def ocr_api(image_path, mask_path):
+def ocr_api(image_path, mask_path, backend=None):
     """Run OCR and return detected text regions with polygon bounds."""
     try:
         content = multiply_image_with_mask(image_path, mask_path)
-        image = vision.Image(content=content)
-        response = client.text_detection(image=image)
-        
-        if response.error.message:
-            print(f"API Error: {response.error.message}")
-            return None
-        
-        texts = response.text_annotations
-        if not texts:
-            return []
-        
-        regions = []
-        for text in texts[1:]:  # Skip first annotation (aggregated text)
-            try:
-                poly = polygon_from_vertices(text.bounding_poly.vertices)
-                if not poly.is_valid:
-                    poly = poly.convex_hull
-                regions.append({
-                    'text': text.description,
-                    'polygon': [(v.x, v.y) for v in text.bounding_poly.vertices],
-                    'bounds': [(v.x, v.y) for v in text.bounding_poly.vertices]
-                })
-            except Exception as e:
-                print(f"Error processing polygon for text '{text.description}': {str(e)}")
-                continue
-        return regions
+        return (backend or get_default_backend()).recognize(content)
     except Exception as e:
         print(f"OCR failed for {image_path}: {str(e)}")
         return None
 
-def run_ocr(input_folder, masks_folder, output_json_dir):
+def run_ocr(input_folder, masks_folder, output_json_dir, dispatcher=None):
     """Process all images in a folder and save OCR results as JSON."""
     if os.path.exists(output_json_dir):
         print(f"Output directory {output_json_dir} already exists. Skipping...")
         return
     
     os.makedirs(output_json_dir, exist_ok=True)
+    if dispatcher is None:
+        dispatcher = OCRDispatcher(get_default_backend())
     
+    img_names = [img_name for img_name in os.listdir(input_folder) if img_name.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    # images are masked and encoded on the dispatcher's threads
+    load = lambda img_name: multiply_image_with_mask(os.path.join(input_folder, img_name), os.path.join(masks_folder, img_name))
+
     results = {}
-    for img_name in tqdm(os.listdir(input_folder)):
-        if not img_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-            continue
-            
-        img_path = os.path.join(input_folder, img_name)
-        mask_path = os.path.join(masks_folder, img_name)
-        regions = ocr_api(img_path, mask_path)
-        
+    for img_name, regions in tqdm(dispatcher.map(img_names, load), total=len(img_names)):
         if regions is not None:
             output_path = os.path.join(output_json_dir, f"{os.path.splitext(img_name)[0]}.json")
             with open(output_path, 'w') as f:
@@ -90,6 +67,21 @@ def run_ocr(input_folder, masks_folder, output_json_dir):
             results[img_name] = regions
     
     return results
+
+def add_ocr_arguments(parser):
+    parser.add_argument('--ocr_backend', type=str, default="vision", choices=list(BACKENDS), help="OCR engine: Google Vision, local Tesseract or an HTTP service.")
+    parser.add_argument('--ocr_url', type=str, default=None, help="Endpoint of the http backend.")
+    parser.add_argument('--ocr_lang', type=str, default="eng", help="Language of the tesseract backend.")
+    parser.add_argument('--ocr_concurrency', type=int, default=8, help="OCR requests in flight.")
+    parser.add_argument('--ocr_batch_size', type=int, default=0, help="Images per OCR request, 0 for the backend's maximum.")
+    parser.add_argument('--ocr_rate_limit', type=float, default=0.0, help="Images per second sent to the backend, 0 for no limit.")
+    parser.add_argument('--ocr_retries', type=int, default=3, help="Retries of a failed OCR request.")
+
+def get_dispatcher(args):
+    """OCRDispatcher configured by the add_ocr_arguments options."""
+    backend = create_backend(args.ocr_backend, args.ocr_url, args.ocr_lang)
+    return OCRDispatcher(backend, concurrency=args.ocr_concurrency, batch_size=args.ocr_batch_size,
+                         rate_limit=args.ocr_rate_limit, max_retries=args.ocr_retries)
     
 
 if __name__ == "__main__":
@@ -98,15 +90,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run OCR on images and save results as JSON.")
     parser.add_argument('--model_path', type=str, required=True, help="Path to the model directory.")
     parser.add_argument('--iteration', type=int, required=True, help="Iteration number to process.")
+    add_ocr_arguments(parser)
 
     args = parser.parse_args()
+    dispatcher = get_dispatcher(args)
     model_path = args.model_path
     gt_folder = os.path.join(model_path, "eval_test", "gt")
     renders_folder = os.path.join(model_path, "eval_test", f"renders_{args.iteration}")
     output_folder = os.path.join(model_path, "eval_test", "ocr_output")
     masks_folder = os.path.join(model_path, "eval_test", "masks")
 
-    run_ocr(gt_folder, masks_folder, os.path.join(output_folder, "gt", "prediction_jsons"))
-    run_ocr(renders_folder, masks_folder, os.path.join(output_folder, f"renders_{args.iteration}", "prediction_jsons"))
+    run_ocr(gt_folder, masks_folder, os.path.join(output_folder, "gt", "prediction_jsons"), dispatcher)
+    run_ocr(renders_folder, masks_folder, os.path.join(output_folder, f"renders_{args.iteration}", "prediction_jsons"), dispatcher)
 
     print("Running OCR complete")
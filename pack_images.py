@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+from argparse import ArgumentParser
+from PIL import Image
+import cv2
+from tqdm import tqdm
+from arguments import ModelParams
+from scene.dataset_readers import sceneLoadTypeCallbacks
+from utils.camera_utils import get_resolution, get_mask_path, read_invdepth
+from utils.image_pack import ImagePackWriter
+from utils.mask_cache import get_mask_cache
+
+def pack_images(dataset, output, resolution_scale=1.0):
+    if os.path.exists(os.path.join(dataset.source_path, "sparse")):
+        scene_info = sceneLoadTypeCallbacks["Colmap"](dataset.source_path, dataset.images, dataset.depths, dataset.eval, dataset.train_test_exp)
+    elif os.path.exists(os.path.join(dataset.source_path, "transforms_train.json")):
+        scene_info = sceneLoadTypeCallbacks["Blender"](dataset.source_path, dataset.white_background, dataset.depths, dataset.eval)
+    else:
+        sys.exit("Could not recognize scene type!")
+
+    output_path = os.path.join(dataset.source_path, output)
+    writer = ImagePackWriter(output_path, metadata={"resolution": dataset.resolution, "resolution_scale": resolution_scale,
+                                                    "images": dataset.images, "depths": dataset.depths})
+    mask_cache = get_mask_cache(dataset.source_path)
+    for cam_info in tqdm(scene_info.train_cameras + scene_info.test_cameras, desc="Packing images"):
+        image = Image.open(cam_info.image_path)
+        resolution = get_resolution(dataset, image.size[0], image.size[1], resolution_scale)
+        # same resampling as PILtoTorch / Camera, so packed and unpacked training match
+        image = np.array(image.resize(resolution))
+
+        mask_path = get_mask_path(cam_info)
+        mask = mask_cache.get(mask_path, resolution)
+        if mask is None:
+            print("[ WARNING ] Mask file not found at path: ", mask_path)
+            mask = np.zeros((resolution[1], resolution[0]), dtype=bool)
+
+        invdepthmap = read_invdepth(cam_info, scene_info.is_nerf_synthetic)
+        if invdepthmap is not None:
+            invdepthmap = cv2.resize(invdepthmap, resolution)
+            if invdepthmap.ndim != 2:
+                invdepthmap = invdepthmap[..., 0]
+
+        writer.add(cam_info.image_name, image, mask, invdepthmap, cam_info.image_path, mask_path, cam_info.depth_path or None)
+    writer.close()
+    mask_cache.flush()
+    print(f"Packed {len(writer.entries)} images into {output_path}")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Pre-decode training images, masks and depths into an image pack")
+    lp = ModelParams(parser)
+    parser.add_argument("--output", default="image_pack.bin", type=str, help="pack file, relative to the source path")
+    args = parser.parse_args(sys.argv[1:])
+
+    pack_images(lp.extract(args), args.output)
@@ -0,0 +1,47 @@
+import os
+import torch
+from argparse import ArgumentParser
+from arguments import ModelParams, PipelineParams, get_combined_args
+from scene import Scene, GaussianModel
+from utils.general_utils import safe_state
+from utils.pruning_utils import prune_low_contribution, prune_target
+
+def prune_model(dataset, iteration, pipeline, target_count, budget_mb, view_stride):
+    gaussians = GaussianModel(dataset.sh_degree)
+    scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+    point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+
+    text_mask_path = os.path.join(point_cloud_path, "text_points_mask.pt")
+    if os.path.exists(text_mask_path):
+        gaussians.text_points_mask = torch.load(text_mask_path, map_location=gaussians.get_xyz.device).bool()
+    else:
+        print("[ WARNING ] No text mask found at {}, text Gaussians are not protected".format(text_mask_path))
+
+    target_count = prune_target(gaussians, target_count, budget_mb)
+    if target_count is None:
+        print("[ WARNING ] Neither --target_count nor --budget_mb is set, nothing to prune")
+        return
+
+    bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
+    background = torch.tensor(bg_color, dtype=torch.float32, device=gaussians.get_xyz.device)
+    prune_low_contribution(gaussians, scene.getTrainCameras(), pipeline, background, target_count, dataset.train_test_exp, view_stride)
+
+    gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud_pruned.ply"))
+    if gaussians.text_points_mask is not None:
+        torch.save(gaussians.text_points_mask.cpu(), os.path.join(point_cloud_path, "text_points_mask_pruned.pt"))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Prune the least contributing non-text Gaussians of a trained model")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--target_count", default=0, type=int, help="number of Gaussians to keep")
+    parser.add_argument("--budget_mb", default=0.0, type=float, help="size of the pruned point cloud file in MB")
+    parser.add_argument("--view_stride", default=1, type=int, help="render every k-th training view with the (slow) PyTorch rasterizer to measure the contributions")
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Pruning " + args.model_path)
+
+    safe_state(args.quiet)
+
+    prune_model(model.extract(args), args.iteration, pipeline.extract(args), args.target_count, args.budget_mb, args.view_stride)
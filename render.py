@@ -27,7 +27,7 @@ except:
     SPARSE_ADAM_AVAILABLE = False
 
 
-def render_set(model_path, name, iteration, views, gaussians, pipeline, background, train_test_exp, separate_sh):
+def render_set(model_path, name, iteration, views, gaussians, pipeline, background, train_test_exp, separate_sh, prefetch=None):
     render_path = os.path.join(model_path, name, "ours_{}".format(iteration), "renders")
     gts_path = os.path.join(model_path, name, "ours_{}".format(iteration), "gt")
     masks_path = os.path.join(model_path, name, "ours_{}".format(iteration), "masks")
@@ -37,6 +37,8 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
     makedirs(masks_path, exist_ok=True)
 
     for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
+        if prefetch is not None:
+            prefetch(views[idx + 1:])
         rendering = render(view, gaussians, pipeline, background, use_trained_exp=train_test_exp, separate_sh=separate_sh)["render"]
         gt = view.original_image[0:3, :, :]
         mask = torch.where(view.gt_mask > 127, 255, 0).float() / 255.0
@@ -45,24 +47,38 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
         if args.train_test_exp:
             rendering = rendering[..., rendering.shape[-1] // 2:]
             gt = gt[..., gt.shape[-1] // 2:]
+            mask = mask[..., mask.shape[-1] // 2:]
 
         torchvision.utils.save_image(rendering, os.path.join(render_path, '{0:05d}'.format(idx) + ".png"))
         torchvision.utils.save_image(gt, os.path.join(gts_path, '{0:05d}'.format(idx) + ".png"))
         torchvision.utils.save_image(mask, os.path.join(masks_path, '{0:05d}'.format(idx) + ".png"))
 
-def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, separate_sh: bool):
+def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, separate_sh: bool, lod : bool = False, compressed : bool = False, pruned : bool = False):
     with torch.no_grad():
         gaussians = GaussianModel(dataset.sh_degree)
         scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+        iteration_name = scene.loaded_iter
+        if lod:
+            # the hierarchy written by build_lod.py, rendered next to the full model's results
+            gaussians.load_lod(os.path.join(dataset.model_path, "lod", "iteration_{}".format(scene.loaded_iter)))
+            iteration_name = "{}_lod".format(scene.loaded_iter)
+        elif compressed:
+            # the model written by compress.py
+            gaussians.load_compressed(os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter), "point_cloud_compressed.npz"))
+            iteration_name = "{}_compressed".format(scene.loaded_iter)
+        elif pruned:
+            # the model written by prune.py
+            gaussians.load_ply(os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter), "point_cloud_pruned.ply"))
+            iteration_name = "{}_pruned".format(scene.loaded_iter)
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
-        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+        background = torch.tensor(bg_color, dtype=torch.float32, device=gaussians.get_xyz.device)
 
         if not skip_train:
-             render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, background, dataset.train_test_exp, separate_sh)
+             render_set(dataset.model_path, "train", iteration_name, scene.getTrainCameras(), gaussians, pipeline, background, dataset.train_test_exp, separate_sh, scene.prefetch)
 
         if not skip_test:
-             render_set(dataset.model_path, "test", scene.loaded_iter, scene.getTestCameras(), gaussians, pipeline, background, dataset.train_test_exp, separate_sh)
+             render_set(dataset.model_path, "test", iteration_name, scene.getTestCameras(), gaussians, pipeline, background, dataset.train_test_exp, separate_sh, scene.prefetch)
 
 if __name__ == "__main__":
     # Set up command line argument parser
@@ -73,10 +89,13 @@ if __name__ == "__main__":
     parser.add_argument("--skip_train", action="store_true")
     parser.add_argument("--skip_test", action="store_true")
     parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--lod", action="store_true", help="render the level-of-detail hierarchy of build_lod.py")
+    parser.add_argument("--compressed", action="store_true", help="render the compressed model of compress.py")
+    parser.add_argument("--pruned", action="store_true", help="render the pruned model of prune.py")
     args = get_combined_args(parser)
     print("Rendering " + args.model_path)
 
     # Initialize system state (RNG)
     safe_state(args.quiet)
 
-    render_sets(model.extract(args), args.iteration, pipeline.extract(args), args.skip_train, args.skip_test, SPARSE_ADAM_AVAILABLE)
\ No newline at end of file
+    render_sets(model.extract(args), args.iteration, pipeline.extract(args), args.skip_train, args.skip_test, SPARSE_ADAM_AVAILABLE, args.lod, args.compressed, args.pruned)
\ No newline at end of file
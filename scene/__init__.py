@@ -12,19 +12,23 @@
 import os
 import random
 import json
-from utils.system_utils import searchForMaxIteration
+from utils.system_utils import searchForMaxIteration, atomic_write_path
+from utils.save_utils import tensors_to_host
 from scene.dataset_readers import sceneLoadTypeCallbacks
 from scene.gaussian_model import GaussianModel
 from arguments import ModelParams
-from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON
+from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON, CameraDataLoader
+from utils.image_pack import ImagePack
 
 class Scene:
 
     gaussians : GaussianModel
 
-    def __init__(self, args : ModelParams, gaussians : GaussianModel, load_iteration=None, shuffle=True, resolution_scales=[1.0], merge_ply_iter=-1):
+    def __init__(self, args : ModelParams, gaussians : GaussianModel, load_iteration=None, shuffle=True, resolution_scales=[1.0], merge_ply_iter=-1, previous_scene=None, colmap_track_ids=None):
         """b
         :param path: Path to colmap scene main folder.
+        :param previous_scene: Scene of the previous training phase. Its scene info and loaded
+            cameras are reused and its Gaussians are merged in memory instead of through merge_ply_iter.
         """
         self.model_path = args.model_path
         self.loaded_iter = None
@@ -37,6 +41,10 @@ class Scene:
                 self.loaded_iter = load_iteration
             print("Loading trained model at iteration {}".format(self.loaded_iter))
 
+        if previous_scene is not None:
+            self._init_from_previous_scene(previous_scene, shuffle, colmap_track_ids)
+            return
+
         self.train_cameras = {}
         self.test_cameras = {}
 
@@ -62,17 +70,33 @@ class Scene:
             with open(os.path.join(self.model_path, "cameras.json"), 'w') as file:
                 json.dump(json_cams, file)
 
+        # shuffling index orders draws the same permutations as shuffling the lists, and keeps them for the next phase
+        self.camera_orders = {"train": list(range(len(scene_info.train_cameras))), "test": list(range(len(scene_info.test_cameras)))}
         if shuffle:
-            random.shuffle(scene_info.train_cameras)  # Multi-res consistent random shuffling
-            random.shuffle(scene_info.test_cameras)  # Multi-res consistent random shuffling
+            random.shuffle(self.camera_orders["train"])  # Multi-res consistent random shuffling
+            random.shuffle(self.camera_orders["test"])  # Multi-res consistent random shuffling
+            scene_info = scene_info._replace(train_cameras=[scene_info.train_cameras[idx] for idx in self.camera_orders["train"]],
+                                             test_cameras=[scene_info.test_cameras[idx] for idx in self.camera_orders["test"]])
 
+        self.scene_info = scene_info
         self.cameras_extent = scene_info.nerf_normalization["radius"]
 
+        # in lazy mode cameras only hold poses, images are decoded on demand and prefetched
+        self.data_loader = None
+        self.prefetch_views = args.prefetch_views
+        if args.lazy_load:
+            self.data_loader = CameraDataLoader(cache_size=args.image_cache_size, num_workers=min(4, max(1, args.prefetch_views)))
+
+        # pre-decoded images written by pack_images.py
+        image_pack = None
+        if args.image_pack:
+            image_pack = ImagePack(os.path.join(args.source_path, args.image_pack))
+
         for resolution_scale in resolution_scales:
             print("Loading Training Cameras")
-            self.train_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.train_cameras, resolution_scale, args, scene_info.is_nerf_synthetic, False)
+            self.train_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.train_cameras, resolution_scale, args, scene_info.is_nerf_synthetic, False, self.data_loader, image_pack)
             print("Loading Test Cameras")
-            self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args, scene_info.is_nerf_synthetic, True)
+            self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args, scene_info.is_nerf_synthetic, True, self.data_loader, image_pack)
 
         if self.loaded_iter:
             self.gaussians.load_ply(os.path.join(self.model_path,
@@ -87,17 +111,71 @@ class Scene:
             else:
                 self.gaussians.create_from_pcd(scene_info.point_cloud, scene_info.train_cameras, self.cameras_extent)
 
+    def _init_from_previous_scene(self, previous_scene, shuffle, colmap_track_ids):
+        scene_info = previous_scene.scene_info
+        self.train_cameras = {}
+        self.test_cameras = {}
 
-    def save(self, iteration):
+        self.camera_orders = {}
+
+        def shuffled(split, cam_infos, cameras):
+            # draws the same permutation random.shuffle would apply to a freshly read list and applies it to
+            # the read order, undoing the previous scene's shuffle
+            order = list(range(len(cam_infos)))
+            if shuffle:
+                random.shuffle(order)
+            position = {read_idx: idx for idx, read_idx in enumerate(previous_scene.camera_orders[split])}
+            indices = [position[read_idx] for read_idx in order]
+            for resolution_scale, camera_list in cameras.items():
+                cameras[resolution_scale] = [camera_list[idx] for idx in indices]
+                for uid, camera in enumerate(cameras[resolution_scale]):
+                    camera.uid = uid
+            self.camera_orders[split] = order
+            return [cam_infos[idx] for idx in indices]
+
+        self.train_cameras = dict(previous_scene.train_cameras)
+        self.test_cameras = dict(previous_scene.test_cameras)
+        self.scene_info = scene_info._replace(train_cameras=shuffled("train", scene_info.train_cameras, self.train_cameras),
+                                              test_cameras=shuffled("test", scene_info.test_cameras, self.test_cameras))
+        self.cameras_extent = previous_scene.cameras_extent
+        self.data_loader = previous_scene.data_loader
+        self.prefetch_views = previous_scene.prefetch_views
+
+        self.gaussians.create_from_pcd_and_gaussians(self.scene_info.point_cloud, self.scene_info.train_cameras, self.cameras_extent,
+                                                     previous_scene.gaussians, colmap_track_ids)
+        # the previous phase's model has been merged, release it (and its optimizer state)
+        previous_scene.gaussians = None
+
+    def save(self, iteration, saver=None):
+        """Save the point cloud and exposures, in the background if `saver` is asynchronous."""
         point_cloud_path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration))
-        self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
-        exposure_dict = {
-            image_name: self.gaussians.get_exposure_from_name(image_name).detach().cpu().numpy().tolist()
-            for image_name in self.gaussians.exposure_mapping
+        snapshot = {
+            "attributes": self.gaussians.get_ply_attributes(),
+            "exposure": {
+                image_name: self.gaussians.get_exposure_from_name(image_name).detach().clone()
+                for image_name in self.gaussians.exposure_mapping
+            }
         }
 
-        with open(os.path.join(self.model_path, "exposure.json"), "w") as f:
-            json.dump(exposure_dict, f, indent=2)
+        def write(snapshot):
+            self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"), snapshot["attributes"])
+            exposure_dict = {
+                image_name: exposure.numpy().tolist()
+                for image_name, exposure in snapshot["exposure"].items()
+            }
+
+            with atomic_write_path(os.path.join(self.model_path, "exposure.json")) as tmp_path, open(tmp_path, "w") as f:
+                json.dump(exposure_dict, f, indent=2)
+
+        if saver is None:
+            write(tensors_to_host(snapshot))
+        else:
+            saver.submit(write, snapshot)
+
+    def prefetch(self, cameras):
+        """Start decoding `cameras` in the background (lazy mode only)."""
+        if self.data_loader is not None:
+            self.data_loader.prefetch(cameras[:self.prefetch_views])
 
     def getTrainCameras(self, scale=1.0):
         return self.train_cameras[scale]
@@ -9,19 +9,113 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
+import math
 import torch
 from torch import nn
 import numpy as np
 from utils.graphics_utils import getWorld2View2, getProjectionMatrix
-from utils.general_utils import PILtoTorch, PILtoTorchMask
+from utils.general_utils import PILtoTorch
 import cv2
 
+def depth_is_reliable(depth_params):
+    return depth_params is None or not (depth_params["scale"] < 0.2 * depth_params["med_scale"] or depth_params["scale"] > 5 * depth_params["med_scale"])
+
+def prepare_camera_data(resolution, image, invdepthmap, mask, depth_params, train_test_exp=False, is_test_dataset=False, is_test_view=False):
+    """
+    Resize a decoded image, text mask and inverse depth map to `resolution` and
+    convert them to the (host) tensors exposed by Camera. `image` is either a
+    PIL image or an already resized (C, H, W) float tensor.
+    """
+    if torch.is_tensor(image):
+        # already decoded and resized, e.g. read from an image pack
+        resized_image_rgb = image
+    else:
+        resized_image_rgb = PILtoTorch(image, resolution)
+    # mask is a binary (H, W) array at `resolution`, kept as uint8 0/255 like the source PNGs
+    gt_mask = torch.from_numpy(mask).to(torch.uint8)[None] * 255
+    gt_image = resized_image_rgb[:3, ...]
+    if resized_image_rgb.shape[0] == 4:
+        alpha_mask = resized_image_rgb[3:4, ...]
+    else: 
+        alpha_mask = torch.ones_like(resized_image_rgb[0:1, ...])
+
+    if train_test_exp and is_test_view:
+        if is_test_dataset:
+            alpha_mask[..., :alpha_mask.shape[-1] // 2] = 0
+        else:
+            alpha_mask[..., alpha_mask.shape[-1] // 2:] = 0
+
+    data = {"original_image": gt_image.clamp(0.0, 1.0), "alpha_mask": alpha_mask, "gt_mask": gt_mask,
+            "invdepthmap": None, "depth_mask": None}
+
+    if invdepthmap is not None:
+        depth_mask = torch.ones_like(alpha_mask)
+        if invdepthmap.shape[:2] != (resolution[1], resolution[0]):
+            invdepthmap = cv2.resize(invdepthmap, resolution)
+        invdepthmap[invdepthmap < 0] = 0
+
+        if depth_params is not None:
+            if not depth_is_reliable(depth_params):
+                depth_mask *= 0
+            
+            if depth_params["scale"] > 0:
+                invdepthmap = invdepthmap * depth_params["scale"] + depth_params["offset"]
+
+        if invdepthmap.ndim != 2:
+            invdepthmap = invdepthmap[..., 0]
+        data["invdepthmap"] = torch.from_numpy(invdepthmap[None])
+        data["depth_mask"] = depth_mask
+    return data
+
+# the rasterizer clamps Gaussian centers to 1.3 * tan(fov / 2) around the principal point
+_FRUSTUM_CLAMP = 1.3
+
+def _crop_range(start, stop, size):
+    """Widen [start, stop) towards the image center until the rasterizer's clamp around the center covers it."""
+    center = size / 2
+    needed = math.ceil(2 * max(center - start, stop - center) / _FRUSTUM_CLAMP)
+    if stop - start < needed:
+        if center - start < stop - center:
+            start = max(0, stop - needed)
+        else:
+            stop = min(size, start + needed)
+    return start, stop
+
+def text_crop_window(mask):
+    """
+    Pixel window (x0, y0, x1, y1) containing every text pixel of a boolean (H, W)
+    mask, or None if there is none. The window is widened where needed so that
+    the rasterizer's center clamp does not cut into it when rendered through a
+    CropCam, which then gives the same pixels as the full render.
+    """
+    rows = torch.nonzero(mask.any(dim=1))
+    cols = torch.nonzero(mask.any(dim=0))
+    if rows.numel() == 0:
+        return None
+    height, width = mask.shape
+    x0, x1 = _crop_range(cols[0].item(), cols[-1].item() + 1, width)
+    y0, y1 = _crop_range(rows[0].item(), rows[-1].item() + 1, height)
+    return x0, y0, x1, y1
+
+def crop_image(image, crop):
+    """The (x0, y0, x1, y1) window of a (..., H, W) tensor, or the tensor itself if crop is None."""
+    if crop is None or image is None:
+        return image
+    x0, y0, x1, y1 = crop
+    return image[..., y0:y1, x0:x1]
+
 class Camera(nn.Module):
-    def __init__(self, resolution, colmap_id, R, T, FoVx, FoVy, depth_params, image, invdepthmap,
+    def __init__(self, resolution, colmap_id, R, T, FoVx, FoVy, depth_params, data_source,
                  image_name, uid,
                  trans=np.array([0.0, 0.0, 0.0]), scale=1.0, data_device = "cuda",
-                 train_test_exp = False, is_test_dataset = False, is_test_view = False, mask = None
+                 has_depth = False, text_coverage = 1.0, data_loader = None
                  ):
+        """
+        `data_source` is a callable returning the prepare_camera_data dict of this view.
+        Without a `data_loader` it is called once and the tensors are kept on
+        `data_device`; with one (lazy mode) only pose and intrinsics are kept and
+        the image, masks and inverse depth are fetched from the loader on access.
+        """
         super(Camera, self).__init__()
 
         self.uid = uid
@@ -31,52 +125,63 @@ class Camera(nn.Module):
         self.FoVx = FoVx
         self.FoVy = FoVy
         self.image_name = image_name
+        self.image_width, self.image_height = resolution
+        # fraction of the pixels covered by the text mask
+        self.text_coverage = text_coverage
+        self.has_text = text_coverage > 0
+        self.depth_reliable = has_depth and depth_is_reliable(depth_params)
 
+        default_device = "cuda" if torch.cuda.is_available() else "cpu"
         try:
             self.data_device = torch.device(data_device)
         except Exception as e:
             print(e)
-            print(f"[Warning] Custom device {data_device} failed, fallback to default cuda device" )
-            self.data_device = torch.device("cuda")
+            print(f"[Warning] Custom device {data_device} failed, fallback to default {default_device} device" )
+            self.data_device = torch.device(default_device)
+        # the "cuda" default of --data_device runs on CPU-only machines too
+        if self.data_device.type == "cuda" and not torch.cuda.is_available():
+            self.data_device = torch.device("cpu")
 
-        resized_image_rgb = PILtoTorch(image, resolution)
-        self.gt_mask = PILtoTorchMask(mask, resolution)
-        gt_image = resized_image_rgb[:3, ...]
-        self.alpha_mask = None
-        if resized_image_rgb.shape[0] == 4:
-            self.alpha_mask = resized_image_rgb[3:4, ...].to(self.data_device)
-        else: 
-            self.alpha_mask = torch.ones_like(resized_image_rgb[0:1, ...].to(self.data_device))
-
-        if train_test_exp and is_test_view:
-            if is_test_dataset:
-                self.alpha_mask[..., :self.alpha_mask.shape[-1] // 2] = 0
-            else:
-                self.alpha_mask[..., self.alpha_mask.shape[-1] // 2:] = 0
-
-        self.original_image = gt_image.clamp(0.0, 1.0).to(self.data_device)
-        self.image_width = self.original_image.shape[2]
-        self.image_height = self.original_image.shape[1]
-
-        self.invdepthmap = None
-        self.depth_reliable = False
-        if invdepthmap is not None:
-            self.depth_mask = torch.ones_like(self.alpha_mask)
-            self.invdepthmap = cv2.resize(invdepthmap, resolution)
-            self.invdepthmap[self.invdepthmap < 0] = 0
-            self.depth_reliable = True
-
-            if depth_params is not None:
-                if depth_params["scale"] < 0.2 * depth_params["med_scale"] or depth_params["scale"] > 5 * depth_params["med_scale"]:
-                    self.depth_reliable = False
-                    self.depth_mask *= 0
-                
-                if depth_params["scale"] > 0:
-                    self.invdepthmap = self.invdepthmap * depth_params["scale"] + depth_params["offset"]
-
-            if self.invdepthmap.ndim != 2:
-                self.invdepthmap = self.invdepthmap[..., 0]
-            self.invdepthmap = torch.from_numpy(self.invdepthmap[None]).to(self.data_device)
+        self.data_source = data_source
+        self.data_loader = data_loader
+        self._data = None
+        self._text_crop = False
+        if data_loader is None:
+            # the text mask stays on the host, it is only moved where it is used
+            self._data = {key: value.to(self.data_device) if value is not None and key != "gt_mask" else value
+                          for key, value in data_source().items()}
+
+    def get_data(self):
+        if self._data is not None:
+            return self._data
+        return self.data_loader.get(self)
+
+    @property
+    def text_crop(self):
+        """Crop window around the text of this view (see text_crop_window), computed once."""
+        if self._text_crop is False:
+            self._text_crop = text_crop_window(self.gt_mask[0] > 127)
+        return self._text_crop
+
+    @property
+    def original_image(self):
+        return self.get_data()["original_image"]
+
+    @property
+    def alpha_mask(self):
+        return self.get_data()["alpha_mask"]
+
+    @property
+    def gt_mask(self):
+        return self.get_data()["gt_mask"]
+
+    @property
+    def invdepthmap(self):
+        return self.get_data()["invdepthmap"]
+
+    @property
+    def depth_mask(self):
+        return self.get_data()["depth_mask"]
 
         self.zfar = 100.0
         self.znear = 0.01
@@ -84,8 +189,10 @@ class Camera(nn.Module):
         self.trans = trans
         self.scale = scale
 
-        self.world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1).cuda()
-        self.projection_matrix = getProjectionMatrix(znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy).transpose(0,1).cuda()
+        # pose and projection live where the Gaussians are rendered
+        render_device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1).to(render_device)
+        self.projection_matrix = getProjectionMatrix(znear=self.znear, zfar=self.zfar, fovX=self.FoVx, fovY=self.FoVy).transpose(0,1).to(render_device)
         self.full_proj_transform = (self.world_view_transform.unsqueeze(0).bmm(self.projection_matrix.unsqueeze(0))).squeeze(0)
         self.camera_center = self.world_view_transform.inverse()[3, :3]
         
@@ -102,3 +209,31 @@ class MiniCam:
         view_inv = torch.inverse(self.world_view_transform)
         self.camera_center = view_inv[3][:3]
 
+class CropCam:
+    """
+    The (x0, y0, x1, y1) pixel window of `camera` as a camera of its own: same
+    pose and focal length, with the projection shifted so the window fills the
+    image. Rendering it gives the same pixels as cropping the full render.
+    """
+
+    def __init__(self, camera, crop):
+        x0, y0, x1, y1 = crop
+        self.crop = crop
+        self.full_width = camera.image_width
+        self.full_height = camera.image_height
+        self.image_width = x1 - x0
+        self.image_height = y1 - y0
+        self.FoVx = 2 * math.atan(math.tan(camera.FoVx / 2) * self.image_width / self.full_width)
+        self.FoVy = 2 * math.atan(math.tan(camera.FoVy / 2) * self.image_height / self.full_height)
+        self.image_name = camera.image_name
+        self.world_view_transform = camera.world_view_transform
+        self.camera_center = camera.camera_center
+
+        # maps the full image NDC to the NDC of the window, under the rasterizer's pixel = ((ndc + 1) * size - 1) / 2
+        ndc_to_crop = torch.eye(4, device=camera.full_proj_transform.device)
+        ndc_to_crop[0, 0] = self.full_width / self.image_width
+        ndc_to_crop[1, 1] = self.full_height / self.image_height
+        ndc_to_crop[0, 3] = (self.full_width - 2 * x0 - self.image_width) / self.image_width
+        ndc_to_crop[1, 3] = (self.full_height - 2 * y0 - self.image_height) / self.image_height
+        # matrices are stored transposed
+        self.full_proj_transform = camera.full_proj_transform @ ndc_to_crop.T
@@ -19,7 +19,8 @@ from utils.graphics_utils import getWorld2View2, focal2fov, fov2focal
 import numpy as np
 import json
 from pathlib import Path
-from plyfile import PlyData, PlyElement
+from plyfile import PlyData
+from utils.ply_utils import write_ply
 from utils.sh_utils import SH2RGB
 from scene.gaussian_model import BasicPointCloud
 from localization_3d import localize_gaussians
@@ -133,15 +134,7 @@ def storePly(path, xyz, rgb):
             ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
     
     normals = np.zeros_like(xyz)
-
-    elements = np.empty(xyz.shape[0], dtype=dtype)
-    attributes = np.concatenate((xyz, normals, rgb), axis=1)
-    elements[:] = list(map(tuple, attributes))
-
-    # Create the PlyData object and write to file
-    vertex_element = PlyElement.describe(elements, 'vertex')
-    ply_data = PlyData([vertex_element])
-    ply_data.write(path)
+    write_ply(path, [xyz, normals, rgb], dtype)
 
 def readColmapSceneInfo(path, images, depths, eval, train_test_exp, llffhold=8, read_only_non_text=False):
     try:
@@ -16,19 +16,31 @@ from torch import nn
 import os
 import json
 from utils.system_utils import mkdir_p
-from plyfile import PlyData, PlyElement
+from utils.ply_utils import write_ply, read_ply_matrix
+from utils.buffer_utils import CapacityBuffer
 from utils.sh_utils import RGB2SH
-from simple_knn._C import distCUDA2
 from utils.graphics_utils import BasicPointCloud
 from utils.general_utils import strip_symmetric, build_scaling_rotation
 from localization_3d import localize_gaussians, get_vis_counts, get_track_ids
+from utils.track_utils import PointTrackIndex
+from scene.lod import LODIndex
+from utils.compression_utils import load_compressed, decode_features_rest
 
 try:
     from diff_gaussian_rasterization import SparseGaussianAdam
 except:
     pass
 
-from diff_gaussian_rasterization import MaskedGaussianAdam
+# the CUDA extensions are only needed for training, loading and rendering work without them
+try:
+    from diff_gaussian_rasterization import MaskedGaussianAdam
+except ImportError:
+    MaskedGaussianAdam = None
+
+try:
+    from simple_knn._C import distCUDA2
+except ImportError:
+    distCUDA2 = None
 
 class GaussianModel:
 
@@ -64,8 +76,16 @@ class GaussianModel:
         self.xyz_gradient_accum = torch.empty(0)
         self.denom = torch.empty(0)
         self.optimizer = None
+        self.spatial_index = None
+        self.lod = None
+        self.text_points_mask = None
+        self.point_track_ids = None
+        # f_rest codebook, indices and SH degrees of a compressed model (see load_compressed)
+        self.features_rest_codes = None
         self.percent_dense = 0
         self.spatial_lr_scale = 0
+        self.capacity_headroom = 1.0
+        self._capacity_buffers = {}
         self.setup_functions()
 
     def capture(self):
@@ -117,7 +137,7 @@ class GaussianModel:
     @property
     def get_features(self):
         features_dc = self._features_dc
-        features_rest = self._features_rest
+        features_rest = self.get_features_rest
         return torch.cat((features_dc, features_rest), dim=1)
     
     @property
@@ -126,6 +146,8 @@ class GaussianModel:
     
     @property
     def get_features_rest(self):
+        if self.features_rest_codes is not None:
+            return decode_features_rest(*self.features_rest_codes, self.max_sh_degree)
         return self._features_rest
     
     @property
@@ -179,11 +201,25 @@ class GaussianModel:
         self._exposure = nn.Parameter(exposure.requires_grad_(True))
 
     def create_from_pcd_and_ply(self, pcd : BasicPointCloud, cam_infos : int, spatial_lr_scale : float, text_gaussians_path : str, point_track_ids_path: str):
-
+        text_attributes = self.read_ply_attributes(text_gaussians_path)
+        self.create_from_pcd_and_text(pcd, cam_infos, spatial_lr_scale, text_attributes, PointTrackIndex.load(point_track_ids_path))
+
+    def create_from_pcd_and_gaussians(self, pcd : BasicPointCloud, cam_infos : int, spatial_lr_scale : float, text_gaussians, point_track_ids_colmap=None):
+        """Same as create_from_pcd_and_ply, taking the phase 1 Gaussians from a model in memory."""
+        text_attributes = (text_gaussians._xyz.detach(), text_gaussians._features_dc.detach(), text_gaussians._features_rest.detach(),
+                           text_gaussians._opacity.detach(), text_gaussians._scaling.detach(), text_gaussians._rotation.detach())
+        self.create_from_pcd_and_text(pcd, cam_infos, spatial_lr_scale, text_attributes, text_gaussians.point_track_ids, point_track_ids_colmap)
+
+    def create_from_pcd_and_text(self, pcd : BasicPointCloud, cam_infos : int, spatial_lr_scale : float, text_attributes, point_track_ids_text, point_track_ids_colmap=None):
+        """
+        Initialize from the non-text points of `pcd` followed by the text Gaussians of phase 1, given as
+        (xyz, f_dc, f_rest, opacity, scaling, rotation) tensors like read_ply_attributes returns.
+        """
         # merging only non text points with phase 1 output
-        point_track_ids_colmap = get_track_ids(self.source_path)
+        if point_track_ids_colmap is None:
+            point_track_ids_colmap = get_track_ids(self.source_path)
         text_points_mask = localize_gaussians(torch.tensor(pcd.points), point_track_ids_colmap, self.source_path).cpu().numpy().astype(bool)
-        point_track_ids_colmap = point_track_ids_colmap[~text_points_mask]
+        point_track_ids_colmap = point_track_ids_colmap[torch.from_numpy(~text_points_mask)]
 
         pcd = BasicPointCloud(points=np.asarray(pcd.points)[~text_points_mask],
                               colors=np.asarray(pcd.colors)[~text_points_mask],
@@ -205,31 +241,14 @@ class GaussianModel:
 
         opacities = self.inverse_opacity_activation(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device="cuda"))
 
-        g_text = PlyData.read(text_gaussians_path)
-        
-        g_text_xyz = torch.tensor(np.stack((np.asarray(g_text['vertex']["x"]),
-                                                 np.asarray(g_text['vertex']["y"]),
-                                                 np.asarray(g_text['vertex']["z"])), axis=1)).float().cuda()
-        self._xyz = nn.Parameter(torch.cat((fused_point_cloud, g_text_xyz), dim=0).requires_grad_(True))
-
-        g_text_features_dc = torch.tensor(np.stack((np.asarray(g_text['vertex']["f_dc_0"]),
-                                                            np.asarray(g_text['vertex']["f_dc_1"]),
-                                                            np.asarray(g_text['vertex']["f_dc_2"])), axis=1)).float().cuda()
-        g_text_features_dc = g_text_features_dc.reshape((g_text_features_dc.shape[0], 3, 1))   
-        self._features_dc = nn.Parameter(torch.cat((features[:,:,0:1], g_text_features_dc), dim=0).transpose(1, 2).contiguous().requires_grad_(True))
+        g_text_xyz, g_text_features_dc, g_text_features_rest, g_text_opacities, g_text_scaling, g_text_rotation = text_attributes
 
-        g_text_features_rest = torch.tensor(np.stack([np.asarray(g_text['vertex'][f"f_rest_{i}"]) for i in range(3*(self.max_sh_degree + 1) ** 2 - 3)], axis=1))
-        g_text_features_rest = g_text_features_rest.reshape((g_text_features_dc.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1)).float().cuda()
-        self._features_rest = nn.Parameter(torch.cat((features[:,:,1:], g_text_features_rest), dim=0).transpose(1, 2).contiguous().requires_grad_(True))
-
-        g_text_scaling = torch.tensor(np.stack([np.asarray(g_text['vertex'][f"scale_{i}"]) for i in range(3)], axis=1)).float().cuda()
+        self._xyz = nn.Parameter(torch.cat((fused_point_cloud, g_text_xyz), dim=0).requires_grad_(True))
+        self._features_dc = nn.Parameter(torch.cat((features[:,:,0:1].transpose(1, 2), g_text_features_dc), dim=0).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(torch.cat((features[:,:,1:].transpose(1, 2), g_text_features_rest), dim=0).contiguous().requires_grad_(True))
         self._scaling = nn.Parameter(torch.cat((scales, g_text_scaling), dim=0).requires_grad_(True))
-
-        g_text_rotation = torch.tensor(np.stack([np.asarray(g_text['vertex'][f"rot_{i}"]) for i in range(4)], axis=1)).float().cuda()
         self._rotation = nn.Parameter(torch.cat((rots, g_text_rotation), dim=0).requires_grad_(True))
-
-        g_text_opacities = torch.tensor(np.asarray(g_text['vertex']["opacity"])).float().cuda()
-        self._opacity = nn.Parameter(torch.cat((opacities, g_text_opacities[..., None]), dim=0).requires_grad_(True))
+        self._opacity = nn.Parameter(torch.cat((opacities, g_text_opacities), dim=0).requires_grad_(True))
 
         self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
         self.exposure_mapping = {cam_info.image_name: idx for idx, cam_info in enumerate(cam_infos)}
@@ -237,13 +256,22 @@ class GaussianModel:
         exposure = torch.eye(3, 4, device="cuda")[None].repeat(len(cam_infos), 1, 1)
         self._exposure = nn.Parameter(exposure.requires_grad_(True))
 
-        point_track_ids_phase1 = torch.load(point_track_ids_path)
-        self.point_track_ids = torch.cat((point_track_ids_colmap, point_track_ids_phase1), dim=0).cuda()
+        self.point_track_ids = PointTrackIndex.cat((point_track_ids_colmap, point_track_ids_text)).cuda()
 
     def training_setup(self, training_args, use_masked_gaussian_adam=False):
         self.percent_dense = training_args.percent_dense
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
+
+        # parameters and per-point statistics live in preallocated buffers that densification grows in place
+        self.capacity_headroom = training_args.capacity_headroom
+        self._capacity_buffers = {}
+        self._xyz = nn.Parameter(self._capacity_buffer("xyz", self._xyz.detach()).data, requires_grad=True)
+        self._features_dc = nn.Parameter(self._capacity_buffer("f_dc", self._features_dc.detach()).data, requires_grad=True)
+        self._features_rest = nn.Parameter(self._capacity_buffer("f_rest", self._features_rest.detach()).data, requires_grad=True)
+        self._opacity = nn.Parameter(self._capacity_buffer("opacity", self._opacity.detach()).data, requires_grad=True)
+        self._scaling = nn.Parameter(self._capacity_buffer("scaling", self._scaling.detach()).data, requires_grad=True)
+        self._rotation = nn.Parameter(self._capacity_buffer("rotation", self._rotation.detach()).data, requires_grad=True)
+        self.xyz_gradient_accum = self._capacity_buffer("xyz_gradient_accum", torch.zeros((self.get_xyz.shape[0], 1), device="cuda")).data
+        self.denom = self._capacity_buffer("denom", torch.zeros((self.get_xyz.shape[0], 1), device="cuda")).data
 
         l = [
             {'params': [self._xyz], 'lr': training_args.position_lr_init * self.spatial_lr_scale, "name": "xyz"},
@@ -294,7 +322,12 @@ class GaussianModel:
         # All channels except the 3 DC
         for i in range(self._features_dc.shape[1]*self._features_dc.shape[2]):
             l.append('f_dc_{}'.format(i))
-        for i in range(self._features_rest.shape[1]*self._features_rest.shape[2]):
+        # f_rest of a compressed model is only held as codes, one codebook column per coefficient
+        if self.features_rest_codes is not None:
+            num_rest = self.features_rest_codes[0].shape[1]
+        else:
+            num_rest = self._features_rest.shape[1]*self._features_rest.shape[2]
+        for i in range(num_rest):
             l.append('f_rest_{}'.format(i))
         l.append('opacity')
         for i in range(self._scaling.shape[1]):
@@ -303,119 +336,189 @@ class GaussianModel:
             l.append('rot_{}'.format(i))
         return l
 
-    def save_ply(self, path):
+    def get_ply_attributes(self):
+        # (N, F) float32 matrix of the save_ply columns, a fresh on-device copy of the parameters
+        xyz = self._xyz.detach()
+        normals = torch.zeros_like(xyz)
+        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1)
+        f_rest = self.get_features_rest.detach().transpose(1, 2).flatten(start_dim=1)
+        opacities = self._opacity.detach()
+        scale = self._scaling.detach()
+        rotation = self._rotation.detach()
+        return torch.cat((xyz, normals, f_dc, f_rest, opacities, scale, rotation), dim=1).float()
+
+    def save_ply(self, path, attributes=None):
         mkdir_p(os.path.dirname(path))
 
-        xyz = self._xyz.detach().cpu().numpy()
-        normals = np.zeros_like(xyz)
-        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        opacities = self._opacity.detach().cpu().numpy()
-        scale = self._scaling.detach().cpu().numpy()
-        rotation = self._rotation.detach().cpu().numpy()
-
         dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
 
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
-        attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
-        el = PlyElement.describe(elements, 'vertex')
-        PlyData([el]).write(path)
+        # a single device-to-host copy, written straight to disk
+        if attributes is None:
+            attributes = self.get_ply_attributes()
+        write_ply(path, attributes.cpu().numpy(), dtype_full)
 
     def reset_opacity(self):
         opacities_new = self.inverse_opacity_activation(torch.min(self.get_opacity, torch.ones_like(self.get_opacity)*0.01))
         optimizable_tensors = self.replace_tensor_to_optimizer(opacities_new, "opacity")
         self._opacity = optimizable_tensors["opacity"]
 
+    def read_ply_attributes(self, path):
+        """
+        xyz, f_dc (N, 1, 3), f_rest (N, SH - 1, 3), opacity, scale and rotation of a
+        save_ply file as float32 tensors on the GPU (the CPU without CUDA), copied in one transfer.
+        """
+        matrix, names = read_ply_matrix(path)
+        columns = {name: i for i, name in enumerate(names)}
+
+        def sorted_columns(prefix):
+            attr_names = sorted([name for name in names if name.startswith(prefix)], key = lambda x: int(x.split('_')[-1]))
+            return [columns[name] for name in attr_names]
+
+        extra_f_columns = sorted_columns("f_rest_")
+        assert len(extra_f_columns)==3*(self.max_sh_degree + 1) ** 2 - 3
+        groups = [[columns["x"], columns["y"], columns["z"]],
+                  [columns["f_dc_0"], columns["f_dc_1"], columns["f_dc_2"]],
+                  extra_f_columns,
+                  [columns["opacity"]],
+                  sorted_columns("scale_"),
+                  sorted_columns("rot")]
+
+        attributes = torch.from_numpy(matrix).to("cuda" if torch.cuda.is_available() else "cpu")
+        if [i for group in groups for i in group] != list(range(attributes.shape[1])):
+            attributes = attributes[:, [i for group in groups for i in group]]
+        xyz, features_dc, features_extra, opacities, scales, rots = torch.split(attributes, [len(group) for group in groups], dim=1)
+
+        # (P, F*SH_coeffs) to (P, SH_coeffs, F)
+        features_dc = features_dc.reshape(-1, 3, 1).transpose(1, 2).contiguous()
+        features_extra = features_extra.reshape(-1, 3, (self.max_sh_degree + 1) ** 2 - 1).transpose(1, 2).contiguous()
+        return xyz.contiguous(), features_dc, features_extra, opacities.contiguous(), scales.contiguous(), rots.contiguous()
+
     def load_ply(self, path, use_train_test_exp = False):
-        plydata = PlyData.read(path)
         if use_train_test_exp:
             exposure_file = os.path.join(os.path.dirname(path), os.pardir, os.pardir, "exposure.json")
             if os.path.exists(exposure_file):
                 with open(exposure_file, "r") as f:
                     exposures = json.load(f)
-                self.pretrained_exposures = {image_name: torch.FloatTensor(exposures[image_name]).requires_grad_(False).cuda() for image_name in exposures}
+                self.pretrained_exposures = {image_name: torch.FloatTensor(exposures[image_name]).requires_grad_(False).to("cuda" if torch.cuda.is_available() else "cpu") for image_name in exposures}
                 print(f"Pretrained exposures loaded.")
             else:
                 print(f"No exposure to be loaded at {exposure_file}")
                 self.pretrained_exposures = None
 
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])),  axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
-
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
-
-        extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
-        extra_f_names = sorted(extra_f_names, key = lambda x: int(x.split('_')[-1]))
-        assert len(extra_f_names)==3*(self.max_sh_degree + 1) ** 2 - 3
-        features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-        for idx, attr_name in enumerate(extra_f_names):
-            features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
-        # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
-        features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
-
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
-        scale_names = sorted(scale_names, key = lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
-        rot_names = sorted(rot_names, key = lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
+        xyz, features_dc, features_extra, opacities, scales, rots = self.read_ply_attributes(path)
+
+        self._xyz = nn.Parameter(xyz.requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.requires_grad_(True))
+        self._features_rest = nn.Parameter(features_extra.requires_grad_(True))
+        self._opacity = nn.Parameter(opacities.requires_grad_(True))
+        self._scaling = nn.Parameter(scales.requires_grad_(True))
+        self._rotation = nn.Parameter(rots.requires_grad_(True))
 
         self.active_sh_degree = self.max_sh_degree
 
-    def replace_tensor_to_optimizer(self, tensor, name):
-        optimizable_tensors = {}
-        for group in self.optimizer.param_groups:
-            if group["name"] == name:
-                stored_state = self.optimizer.state.get(group['params'][0], None)
-                stored_state["exp_avg"] = torch.zeros_like(tensor)
-                stored_state["exp_avg_sq"] = torch.zeros_like(tensor)
+    def load_compressed(self, path):
+        """
+        Load a model written by compress.py. f_rest stays vector quantized on the
+        device and is decoded whenever it is read (get_features_rest).
+        """
+        data = load_compressed(path, "cuda" if torch.cuda.is_available() else "cpu")
+        assert data["sh_degree"] == self.max_sh_degree
 
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(tensor.requires_grad_(True))
-                self.optimizer.state[group['params'][0]] = stored_state
+        self._xyz = nn.Parameter(data["xyz"].requires_grad_(True))
+        self._features_dc = nn.Parameter(data["features_dc"].requires_grad_(True))
+        self._features_rest = torch.empty(0)
+        self._opacity = nn.Parameter(data["opacity"].requires_grad_(True))
+        self._scaling = nn.Parameter(data["scaling"].requires_grad_(True))
+        self._rotation = nn.Parameter(data["rotation"].requires_grad_(True))
+        self.features_rest_codes = (data["f_rest_codebook"], data["f_rest_indices"], data["sh_degrees"])
 
-                optimizable_tensors[group["name"]] = group["params"][0]
-        return optimizable_tensors
+        self.active_sh_degree = self.max_sh_degree
+        self.spatial_index = None
+        self.lod = None
+
+    def load_lod(self, path):
+        """
+        Load all levels of a build_lod.py hierarchy at `path`, concatenated in
+        level order; render() then draws one level per chunk (see LODIndex).
+        """
+        index, lod = LODIndex.load(path, "cuda" if torch.cuda.is_available() else "cpu")
+        levels = [self.read_ply_attributes(os.path.join(path, level["file"])) for level in index["levels"]]
+        xyz, features_dc, features_extra, opacities, scales, rots = [torch.cat(attribute) for attribute in zip(*levels)]
+
+        self._xyz = nn.Parameter(xyz.requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.requires_grad_(True))
+        self._features_rest = nn.Parameter(features_extra.requires_grad_(True))
+        self._opacity = nn.Parameter(opacities.requires_grad_(True))
+        self._scaling = nn.Parameter(scales.requires_grad_(True))
+        self._rotation = nn.Parameter(rots.requires_grad_(True))
 
-    def _prune_optimizer(self, mask):
+        self.active_sh_degree = self.max_sh_degree
+        self.spatial_index = None
+        self.lod = lod
+
+    def _capacity_buffer(self, name, tensor):
+        """The CapacityBuffer holding `tensor`, (re)filling it when `tensor` is not already its active view."""
+        buffer = self._capacity_buffers.get(name)
+        if buffer is None:
+            buffer = CapacityBuffer(tensor, capacity=int(tensor.shape[0] * self.capacity_headroom))
+            self._capacity_buffers[name] = buffer
+        elif not buffer.is_backing(tensor):
+            buffer.assign(tensor)
+        return buffer
+
+    def _update_optimizer_tensors(self, update, names=None):
+        """
+        Apply update(buffer, name, is_moment) to the buffers of the optimized tensors (and their
+        Adam moments) in place, then rebind the parameters and optimizer state to the new views.
+        """
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
-            stored_state = self.optimizer.state.get(group['params'][0], None)
+            assert len(group["params"]) == 1
+            if names is not None and group["name"] not in names:
+                continue
+            stored_state = self.optimizer.state.pop(group['params'][0], None)
+            buffer = self._capacity_buffer(group["name"], group["params"][0].detach())
+            update(buffer, group["name"], False)
             if stored_state is not None:
-                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
-                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
+                for key in ("exp_avg", "exp_avg_sq"):
+                    state_buffer = self._capacity_buffer(group["name"] + "." + key, stored_state[key])
+                    update(state_buffer, group["name"], True)
+                    stored_state[key] = state_buffer.data
 
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
+            group["params"][0] = nn.Parameter(buffer.data, requires_grad=True)
+            if stored_state is not None:
                 self.optimizer.state[group['params'][0]] = stored_state
+            optimizable_tensors[group["name"]] = group["params"][0]
+        return optimizable_tensors
 
-                optimizable_tensors[group["name"]] = group["params"][0]
+    def _update_point_tensors(self, update, names=("xyz_gradient_accum", "denom", "max_radii2D", "tmp_radii", "text_points_mask")):
+        for name in names:
+            tensor = getattr(self, name, None)
+            if tensor is None:
+                continue
+            buffer = self._capacity_buffer(name, tensor)
+            update(buffer)
+            setattr(self, name, buffer.data)
+
+    def replace_tensor_to_optimizer(self, tensor, name):
+        def replace(buffer, _, is_moment):
+            if is_moment:
+                buffer.data.zero_()
             else:
-                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
-                optimizable_tensors[group["name"]] = group["params"][0]
-        return optimizable_tensors
+                buffer.assign(tensor)
+        return self._update_optimizer_tensors(replace, names=(name,))
 
     def prune_points(self, mask):
         valid_points_mask = ~mask
-        optimizable_tensors = self._prune_optimizer(valid_points_mask)
+        if self.optimizer is None:
+            # a model loaded for rendering, without optimizer state or densification statistics
+            optimizable_tensors = {name: nn.Parameter(tensor.detach()[valid_points_mask], requires_grad=True) for name, tensor in
+                                   (("xyz", self._xyz), ("f_dc", self._features_dc), ("f_rest", self._features_rest),
+                                    ("opacity", self._opacity), ("scaling", self._scaling), ("rotation", self._rotation))}
+            point_tensors = ("text_points_mask",)
+        else:
+            optimizable_tensors = self._update_optimizer_tensors(lambda buffer, name, is_moment: buffer.keep(valid_points_mask))
+            point_tensors = ("xyz_gradient_accum", "denom", "max_radii2D", "tmp_radii", "text_points_mask")
 
         self._xyz = optimizable_tensors["xyz"]
         self._features_dc = optimizable_tensors["f_dc"]
@@ -424,40 +527,22 @@ class GaussianModel:
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
 
-        self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
-
-        self.denom = self.denom[valid_points_mask]
-        self.max_radii2D = self.max_radii2D[valid_points_mask]
-        self.tmp_radii = self.tmp_radii[valid_points_mask]
-
-        if self.text_points_mask is not None:
-            self.text_points_mask = self.text_points_mask[valid_points_mask]
+        self._update_point_tensors(lambda buffer: buffer.keep(valid_points_mask), names=point_tensors)
         if self.point_track_ids is not None:
             self.point_track_ids = self.point_track_ids[valid_points_mask]
 
     def cat_tensors_to_optimizer(self, tensors_dict, new_text_points_mask=None, new_point_track_ids=None):
-        optimizable_tensors = {}
-        for group in self.optimizer.param_groups:
-            assert len(group["params"]) == 1
-            extension_tensor = tensors_dict[group["name"]]
-            stored_state = self.optimizer.state.get(group['params'][0], None)
-            if stored_state is not None:
-
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)), dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)), dim=0)
-
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
-                self.optimizer.state[group['params'][0]] = stored_state
-
-                optimizable_tensors[group["name"]] = group["params"][0]
+        def extend(buffer, name, is_moment):
+            if is_moment:
+                buffer.extend(count=tensors_dict[name].shape[0])
             else:
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
-                optimizable_tensors[group["name"]] = group["params"][0]
+                buffer.extend(tensors_dict[name])
+        optimizable_tensors = self._update_optimizer_tensors(extend)
+
         if new_text_points_mask is not None:
-            self.text_points_mask = torch.cat((self.text_points_mask, new_text_points_mask), dim=0) 
+            self._update_point_tensors(lambda buffer: buffer.extend(new_text_points_mask), names=("text_points_mask",))
         if new_point_track_ids is not None:
-            self.point_track_ids = torch.cat((self.point_track_ids, new_point_track_ids), dim=0)
+            self.point_track_ids = PointTrackIndex.cat((self.point_track_ids, new_point_track_ids))
         return optimizable_tensors
 
     def densification_postfix(self, new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation, new_tmp_radii, new_text_points_mask=None, new_point_track_ids=None):
@@ -476,10 +561,9 @@ class GaussianModel:
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
 
-        self.tmp_radii = torch.cat((self.tmp_radii, new_tmp_radii))
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        self._update_point_tensors(lambda buffer: buffer.extend(new_tmp_radii), names=("tmp_radii",))
+        num_points = self.get_xyz.shape[0]
+        self._update_point_tensors(lambda buffer: buffer.resize_zero(num_points), names=("xyz_gradient_accum", "denom", "max_radii2D"))
 
     def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
         n_init_points = self.get_xyz.shape[0]
@@ -507,7 +591,7 @@ class GaussianModel:
         else:
             new_text_points_mask = None
         if self.point_track_ids is not None:
-            new_point_track_ids = self.point_track_ids[selected_pts_mask].repeat(N,1)
+            new_point_track_ids = self.point_track_ids[selected_pts_mask].repeat(N)
         else:
             new_point_track_ids = None
 
@@ -569,7 +653,7 @@ class GaussianModel:
 
         if self.point_track_ids is not None:
             point_track_ids = self.point_track_ids[selected_pts_mask]
-            new_point_track_ids = point_track_ids.repeat_interleave(repeats, dim=0)
+            new_point_track_ids = point_track_ids.repeat_interleave(repeats)
         else:
             new_point_track_ids = None
 
@@ -580,7 +664,7 @@ class GaussianModel:
         )
 
         repeats_mask = torch.cat((repeats, expanded_repeats)) == 1
-        prune_mask = torch.cat((selected_pts_mask, torch.zeros(num_new_points.item(), device="cuda", dtype=bool)))
+        prune_mask = torch.cat((selected_pts_mask, torch.zeros(new_xyz.shape[0], device="cuda", dtype=bool)))
         prune_mask[repeats_mask] = ~prune_mask[repeats_mask]
 
         self.prune_points(prune_mask)
@@ -634,15 +718,13 @@ class GaussianModel:
         tmp_radii = self.tmp_radii
         self.tmp_radii = None
 
-        torch.cuda.empty_cache()
-
     def densify_text_and_prune_non_text(self, radii, min_N, max_N):
         self.tmp_radii = radii
         self.densify_and_split_text(max_N=max_N, min_N=min_N)
         self.prune_non_text()
 
-        torch.cuda.empty_cache()
-
     def add_densification_stats(self, viewspace_point_tensor, update_filter):
-        self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor.grad[update_filter,:2], dim=-1, keepdim=True)
-        self.denom[update_filter] += 1
+        # masked arithmetic on the boolean filter, indexing would wait for the device to count it
+        update_filter = update_filter.unsqueeze(-1)
+        self.xyz_gradient_accum += torch.where(update_filter, torch.norm(viewspace_point_tensor.grad[:, :2], dim=-1, keepdim=True), 0.0)
+        self.denom += update_filter
@@ -0,0 +1,224 @@
+import os
+import json
+import math
+import numpy as np
+import torch
+from utils.general_utils import build_scaling_rotation, inverse_sigmoid
+from utils.spatial_index import GaussianSubset, boxes_in_frustum
+from utils.system_utils import atomic_write_path
+
+LOD_INDEX = "lod.json"
+LOD_CHUNKS = "lod_chunks.npz"
+
+def rotation_to_quaternion(R):
+    """(N, 3, 3) rotation matrices to (N, 4) unit quaternions (w, x, y, z), the inverse of build_rotation."""
+    m00, m01, m02 = R[:, 0, 0], R[:, 0, 1], R[:, 0, 2]
+    m10, m11, m12 = R[:, 1, 0], R[:, 1, 1], R[:, 1, 2]
+    m20, m21, m22 = R[:, 2, 0], R[:, 2, 1], R[:, 2, 2]
+    # 4 * (w², x², y², z²); the largest one gives a well conditioned solution
+    t = torch.stack([1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22], dim=1)
+    candidates = torch.stack([
+        torch.stack([t[:, 0], m21 - m12, m02 - m20, m10 - m01], dim=1),
+        torch.stack([m21 - m12, t[:, 1], m10 + m01, m02 + m20], dim=1),
+        torch.stack([m02 - m20, m10 + m01, t[:, 2], m21 + m12], dim=1),
+        torch.stack([m10 - m01, m02 + m20, m21 + m12, t[:, 3]], dim=1)], dim=1)
+    best = t.argmax(dim=1)
+    q = candidates[torch.arange(R.shape[0], device=R.device), best]
+    return torch.nn.functional.normalize(q, dim=1)
+
+def covariance_to_scaling_rotation(cov):
+    """Scales (N, 3) and unit quaternions (N, 4) of (N, 3, 3) covariances."""
+    eigenvalues, eigenvectors = torch.linalg.eigh(cov)
+    # make the eigenvector basis a proper rotation
+    flip = torch.linalg.det(eigenvectors) < 0
+    eigenvectors[flip, :, 2] *= -1
+    return eigenvalues.clamp_min(1e-14).sqrt(), rotation_to_quaternion(eigenvectors)
+
+def _surface(scaling):
+    # proportional to the mean projected area of the ellipsoid
+    return scaling[:, 0] * scaling[:, 1] + scaling[:, 1] * scaling[:, 2] + scaling[:, 0] * scaling[:, 2]
+
+def merge_gaussians(gaussians, cluster, num_clusters):
+    """
+    Moment-matched parents of the Gaussians of each cluster.
+
+    `gaussians` holds activated xyz (N, 3), scaling (N, 3), rotation (N, 4),
+    opacity (N, 1) and SH features (N, K, 3). Children are weighted by their
+    opacity times surface. The parent matches the weighted mean and covariance
+    of the mixture, averages the SH coefficients and keeps the opacity-weighted
+    surface: its opacity is the sum of the children's over its own surface.
+    """
+    xyz, scaling, opacity, features = gaussians["xyz"], gaussians["scaling"], gaussians["opacity"], gaussians["features"]
+    surface = _surface(scaling)
+    weight = opacity[:, 0] * surface + 1e-12
+    total = torch.zeros(num_clusters, device=xyz.device).index_add_(0, cluster, weight)
+    w = (weight / total[cluster])[:, None]
+
+    mean = torch.zeros((num_clusters, 3), device=xyz.device).index_add_(0, cluster, w * xyz)
+    L = build_scaling_rotation(scaling, gaussians["rotation"])
+    offset = xyz - mean[cluster]
+    second_moment = L @ L.transpose(1, 2) + offset[:, :, None] * offset[:, None, :]
+    cov = torch.zeros((num_clusters, 3, 3), device=xyz.device).index_add_(0, cluster, w[:, :, None] * second_moment)
+    merged_scaling, merged_rotation = covariance_to_scaling_rotation(cov)
+
+    merged_features = torch.zeros((num_clusters,) + tuple(features.shape[1:]), device=xyz.device)
+    merged_features.index_add_(0, cluster, w[:, :, None] * features)
+    coverage = torch.zeros(num_clusters, device=xyz.device).index_add_(0, cluster, opacity[:, 0] * surface)
+    merged_opacity = (coverage / _surface(merged_scaling).clamp_min(1e-20)).clamp(1e-4, 0.99)[:, None]
+    return {"xyz": mean, "scaling": merged_scaling, "rotation": merged_rotation, "opacity": merged_opacity, "features": merged_features}
+
+def _cell_keys(xyz, origin, cell_size, dims=None):
+    cells = torch.floor((xyz - origin) / cell_size).long().clamp_min(0)
+    if dims is None:
+        dims = cells.max(dim=0).values + 1
+    cells = torch.minimum(cells, dims - 1)
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+def _concat(parts):
+    return {key: torch.cat([part[key] for part in parts]) for key in parts[0]}
+
+def _select(gaussians, mask):
+    return {key: value[mask] for key, value in gaussians.items()}
+
+def auto_cell_size(xyz):
+    """Cell size at which a uniform distribution of `xyz` over its (1%, 99%) bounding box puts ~8 points per cell."""
+    sample = xyz[torch.randperm(xyz.shape[0], device=xyz.device)[:1 << 20]]
+    lower, upper = torch.quantile(sample, 0.01, dim=0), torch.quantile(sample, 0.99, dim=0)
+    volume = (upper - lower).clamp_min(1e-6).prod().item()
+    return 2 * (volume / max(xyz.shape[0], 1)) ** (1.0 / 3.0)
+
+def build_lod(pc, text_mask=None, num_levels=4, cell_size=0.0, chunk_cells=4):
+    """
+    Level-of-detail hierarchy of the GaussianModel `pc`.
+
+    Level 0 is the model itself. Level l > 0 merges the non-text Gaussians of
+    level l - 1 per grid cell of size cell_size * 2^(l - 1), so every parent
+    lies in the cell of its children. Gaussians in `text_mask` are kept as they
+    are in every level. Every level is sorted by chunk, a grid cell of
+    `chunk_cells` coarsest cells per side. Returns the levels as dicts of
+    activated attributes and their "ply" save_ply columns, their cell sizes
+    and the chunk layout.
+    """
+    with torch.no_grad():
+        # the model's own Gaussians keep their raw parameters, only merged parents are converted back
+        gaussians = {"xyz": pc.get_xyz, "scaling": pc.get_scaling, "rotation": pc.get_rotation,
+                     "opacity": pc.get_opacity, "features": pc.get_features, "ply": pc.get_ply_attributes()}
+        if text_mask is None:
+            text_mask = torch.zeros(gaussians["xyz"].shape[0], dtype=torch.bool, device=gaussians["xyz"].device)
+        text, current = _select(gaussians, text_mask), _select(gaussians, ~text_mask)
+        if cell_size <= 0:
+            cell_size = auto_cell_size(current["xyz"])
+        origin = gaussians["xyz"].min(dim=0).values
+
+        levels, cell_sizes = [gaussians], [0.0]
+        for level in range(1, num_levels):
+            size = cell_size * 2 ** (level - 1)
+            _, cluster = torch.unique(_cell_keys(current["xyz"], origin, size), return_inverse=True)
+            current = merge_gaussians(current, cluster, int(cluster.max()) + 1 if cluster.numel() > 0 else 0)
+            current["ply"] = ply_attributes(current)
+            levels.append(_concat([text, current]))
+            cell_sizes.append(size)
+
+        chunk_size = cell_size * 2 ** max(num_levels - 2, 0) * chunk_cells
+        chunk_dims = torch.floor((gaussians["xyz"].max(dim=0).values - origin) / chunk_size).long() + 1
+        chunk_keys, chunk_ids = torch.unique(_cell_keys(gaussians["xyz"], origin, chunk_size, chunk_dims), return_inverse=True)
+        num_chunks = chunk_keys.shape[0]
+        chunk_min = torch.full((num_chunks, 3), float("inf"), device=origin.device)
+        chunk_max = torch.full((num_chunks, 3), float("-inf"), device=origin.device)
+        offsets = []
+        for index, level in enumerate(levels):
+            # parents lie in their children's chunk, the chunk grid is shared by all levels
+            level_chunks = chunk_ids if index == 0 else \
+                torch.searchsorted(chunk_keys, _cell_keys(level["xyz"], origin, chunk_size, chunk_dims)).clamp_max(num_chunks - 1)
+            order = torch.argsort(level_chunks)
+            levels[index] = level = _select(level, order)
+            level_chunks = level_chunks[order]
+            radius = 3 * level["scaling"].max(dim=1, keepdim=True).values
+            index_3d = level_chunks[:, None].expand(-1, 3)
+            chunk_min.scatter_reduce_(0, index_3d, level["xyz"] - radius, "amin")
+            chunk_max.scatter_reduce_(0, index_3d, level["xyz"] + radius, "amax")
+            level_offsets = torch.zeros(num_chunks + 1, dtype=torch.long, device=origin.device)
+            torch.cumsum(torch.bincount(level_chunks, minlength=num_chunks), dim=0, out=level_offsets[1:])
+            offsets.append(level_offsets)
+
+    chunks = {"origin": origin, "chunk_size": chunk_size, "min": chunk_min, "max": chunk_max, "offsets": torch.stack(offsets)}
+    return levels, cell_sizes, chunks
+
+def ply_attributes(gaussians):
+    """(N, F) matrix of the save_ply columns of activated attributes, with opacities kept off 0 and 1 so their logits stay finite."""
+    xyz = gaussians["xyz"]
+    features = gaussians["features"]
+    opacity = gaussians["opacity"].clamp(1e-6, 1 - 1e-6)
+    return torch.cat((xyz, torch.zeros_like(xyz),
+                      features[:, :1].transpose(1, 2).flatten(start_dim=1),
+                      features[:, 1:].transpose(1, 2).flatten(start_dim=1),
+                      inverse_sigmoid(opacity), torch.log(gaussians["scaling"]), gaussians["rotation"]), dim=1).float()
+
+def save_lod(path, pc, levels, cell_sizes, chunks):
+    """Write every level as level_<l>.ply in the save_ply format, the chunk layout and the lod.json index."""
+    files = []
+    for index, level in enumerate(levels):
+        files.append("level_{}.ply".format(index))
+        pc.save_ply(os.path.join(path, files[-1]), level["ply"])
+    with atomic_write_path(os.path.join(path, LOD_CHUNKS)) as tmp_path, open(tmp_path, "wb") as f:
+        np.savez(f, min=chunks["min"].cpu().numpy(), max=chunks["max"].cpu().numpy(), offsets=chunks["offsets"].cpu().numpy())
+    index = {
+        "levels": [{"file": file, "count": level["xyz"].shape[0], "cell_size": size} for file, level, size in zip(files, levels, cell_sizes)],
+        "origin": chunks["origin"].tolist(),
+        "chunk_size": chunks["chunk_size"],
+        "num_chunks": chunks["min"].shape[0],
+        "chunks": LOD_CHUNKS,
+    }
+    with atomic_write_path(os.path.join(path, LOD_INDEX)) as tmp_path, open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+
+class LODIndex:
+    """
+    Chunk and level layout of a GaussianModel holding all levels of a LOD
+    hierarchy, concatenated in level order (see GaussianModel.load_lod).
+
+    For each view `select` frustum culls the chunks and picks, per chunk, the
+    coarsest level whose cells project to at most `pixel_threshold` pixels at
+    the chunk's distance from the camera.
+    """
+
+    def __init__(self, index, chunks, device):
+        counts = [level["count"] for level in index["levels"]]
+        self.cell_sizes = torch.tensor([level["cell_size"] for level in index["levels"]], device=device)
+        self.level_starts = torch.tensor([0] + counts[:-1], device=device).cumsum(dim=0)
+        self.chunk_min = torch.from_numpy(chunks["min"]).to(device)
+        self.chunk_max = torch.from_numpy(chunks["max"]).to(device)
+        self.offsets = torch.from_numpy(chunks["offsets"]).to(device)
+
+    @classmethod
+    def load(cls, path, device):
+        with open(os.path.join(path, LOD_INDEX)) as f:
+            index = json.load(f)
+        chunks = np.load(os.path.join(path, index["chunks"]))
+        return index, cls(index, chunks, device)
+
+    def levels(self, camera, pixel_threshold):
+        """Level of every chunk for `camera`, -1 for chunks outside the frustum."""
+        center = camera.camera_center.to(self.chunk_min.device)
+        nearest = torch.minimum(torch.maximum(center, self.chunk_min), self.chunk_max)
+        distance = (nearest - center).norm(dim=1).clamp_min(1e-6)
+        focal = camera.image_width / (2 * math.tan(camera.FoVx * 0.5))
+        # cell sizes grow with the level, so this counts the levels fine enough to draw
+        projected = self.cell_sizes[None, 1:] * focal / distance[:, None]
+        levels = (projected <= pixel_threshold).sum(dim=1)
+        return torch.where(boxes_in_frustum(self.chunk_min, self.chunk_max, camera), levels, -1)
+
+    def select(self, camera, pixel_threshold):
+        """Indices of the Gaussians to draw for `camera`."""
+        levels = self.levels(camera, pixel_threshold)
+        chunks = torch.nonzero(levels >= 0)[:, 0]
+        levels = levels[chunks]
+        starts = self.level_starts[levels] + self.offsets[levels, chunks]
+        counts = self.offsets[levels, chunks + 1] - self.offsets[levels, chunks]
+        ends = torch.cumsum(counts, dim=0)
+        total = int(ends[-1]) if ends.numel() > 0 else 0
+        positions = torch.arange(total, device=counts.device)
+        return torch.repeat_interleave(starts - (ends - counts), counts, output_size=total) + positions
+
+    def subset(self, pc, camera, pixel_threshold):
+        return GaussianSubset(pc, self.select(camera, pixel_threshold))
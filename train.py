@@ -11,18 +11,24 @@
 
 import os
 import torch
-from random import randint
-from utils.loss_utils import l1_loss, ssim
+from utils.loss_utils import l1_loss
 from gaussian_renderer import render, network_gui
 import sys
 from scene import Scene, GaussianModel
+from scene.cameras import crop_image
 from utils.general_utils import safe_state, get_expon_lr_func
 import uuid
 from tqdm import tqdm
-from utils.image_utils import psnr
+from utils.metric_utils import image_metrics, metric_records
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams
 from localization_3d import localize_gaussians, get_track_ids
+from utils.sampling_utils import create_viewpoint_sampler
+from utils.save_utils import BackgroundSaver, snapshot_tensors
+from utils.sync_utils import DeviceMetrics, SyncCounter
+from utils.pruning_utils import prune_low_contribution, prune_target
+from utils.system_utils import atomic_write_path
+from functools import partial
 
 try:
     from torch.utils.tensorboard import SummaryWriter
@@ -42,7 +48,7 @@ try:
 except:
     SPARSE_ADAM_AVAILABLE = False
 
-def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, phase_separator, min_densify, max_densify):
+def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, phase_separator, min_densify, max_densify, saver, save_phase1_ply=False, metrics_interval=0, sync_counter=None):
 
     if not SPARSE_ADAM_AVAILABLE and opt.optimizer_type == "sparse_adam":
         sys.exit(f"Trying to use sparse adam but it is not installed, please install the correct rasterizer using pip install [3dgs_accel].")
@@ -66,25 +72,25 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
     use_sparse_adam = opt.optimizer_type == "sparse_adam" and SPARSE_ADAM_AVAILABLE 
     depth_l1_weight = get_expon_lr_func(opt.depth_l1_weight_init, opt.depth_l1_weight_final, max_steps=opt.iterations)
 
-    viewpoint_stack = scene.getTrainCameras().copy()
-    viewpoint_indices = list(range(len(viewpoint_stack)))
+    viewpoint_sampler = create_viewpoint_sampler(scene.getTrainCameras(), opt, require_text=True)
     ema_loss_for_log = 0.0
     ema_Ll1depth_for_log = 0.0
+    # with a metrics interval the losses stay on the device and are only read every metrics_interval iterations
+    metrics = DeviceMetrics(("l1", "loss", "depth"), metrics_interval) if metrics_interval > 0 else None
+    # the iterations (views) rendered since the last optimizer step, and the Gaussians visible in them
+    step_iterations = []
+    step_visible = None
 
     # check if refinement target exists
-    all_empty_masks = True
-    for viewpoint_cam in viewpoint_stack:
-        if torch.any(viewpoint_cam.gt_mask > 127):
-            all_empty_masks = False
-            break
-    if all_empty_masks:
+    if not any(viewpoint_cam.has_text for viewpoint_cam in scene.getTrainCameras()):
         sys.exit("No refinement target found in training cameras. Please provide a dataset with refinement targets.")
 
     progress_bar = tqdm(range(first_iter, phase_separator), desc="Training progress (Phase 1)")
     first_iter += 1
 
     prune_non_text_iterations = [1]
-    gaussians.point_track_ids = get_track_ids(gaussians.source_path)
+    colmap_track_ids = get_track_ids(gaussians.source_path)
+    gaussians.point_track_ids = colmap_track_ids
     gaussians.text_points_mask = localize_gaussians(gaussians._xyz, gaussians.point_track_ids, gaussians.source_path)
 
     for iteration in range(first_iter, phase_separator + 1):
@@ -103,6 +109,8 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
             except Exception as e:
                 network_gui.conn = None
 
+        if metrics is not None:
+            iter_start, iter_end = metrics.timer()
         iter_start.record()
 
         gaussians.update_learning_rate(iteration)
@@ -112,15 +120,8 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
             gaussians.oneupSHdegree()
 
         # Pick a random Camera that contains non-zero mask
-        while True:
-            if not viewpoint_stack:
-                viewpoint_stack = scene.getTrainCameras().copy()
-                viewpoint_indices = list(range(len(viewpoint_stack)))
-            rand_idx = randint(0, len(viewpoint_indices) - 1)
-            viewpoint_cam = viewpoint_stack.pop(rand_idx)
-            vind = viewpoint_indices.pop(rand_idx)
-            if torch.any(viewpoint_cam.gt_mask):
-                break
+        vind, viewpoint_cam = viewpoint_sampler.next()
+        scene.prefetch(viewpoint_sampler.peek(scene.prefetch_views))
 
         # Render
         if (iteration - 1) == debug_from:
@@ -128,22 +129,23 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
 
         bg = torch.rand((3), device="cuda") if opt.random_background else background
 
-        render_pkg = render(viewpoint_cam, gaussians, pipe, bg, use_trained_exp=dataset.train_test_exp, separate_sh=SPARSE_ADAM_AVAILABLE)
+        # The loss only covers text pixels, so optionally only the window around them is rendered
+        crop = viewpoint_cam.text_crop if opt.text_roi_render else None
+        render_pkg = render(viewpoint_cam, gaussians, pipe, bg, use_trained_exp=dataset.train_test_exp, separate_sh=SPARSE_ADAM_AVAILABLE, crop=crop)
         image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
+        # losses stay means over the full image
+        crop_fraction = image.shape[1] * image.shape[2] / (viewpoint_cam.image_height * viewpoint_cam.image_width)
 
         if viewpoint_cam.alpha_mask is not None:
-            alpha_mask = viewpoint_cam.alpha_mask.cuda()
+            alpha_mask = crop_image(viewpoint_cam.alpha_mask, crop).cuda()
             image *= alpha_mask
 
         # Loss
-        gt_image = viewpoint_cam.original_image.cuda()
-        gt_mask = viewpoint_cam.gt_mask.cuda()
+        gt_image = crop_image(viewpoint_cam.original_image, crop).cuda()
+        gt_mask = crop_image(viewpoint_cam.gt_mask, crop).cuda()
         gt_mask_text = gt_mask > 127
-        Ll1 = l1_loss(image*gt_mask_text, gt_image*gt_mask_text)
-        if FUSED_SSIM_AVAILABLE:
-            ssim_value = fused_ssim(image.unsqueeze(0), gt_image.unsqueeze(0))
-        else:
-            ssim_value = ssim(image, gt_image)
+        # phase 1 is fitted with the text L1 alone, no SSIM pass
+        Ll1 = l1_loss(image*gt_mask_text, gt_image*gt_mask_text) * crop_fraction
 
         loss = Ll1
 
@@ -151,13 +153,13 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
         Ll1depth_pure = 0.0
         if depth_l1_weight(iteration) > 0 and viewpoint_cam.depth_reliable:
             invDepth = render_pkg["depth"]
-            mono_invdepth = viewpoint_cam.invdepthmap.cuda()
-            depth_mask = viewpoint_cam.depth_mask.cuda()
+            mono_invdepth = crop_image(viewpoint_cam.invdepthmap, crop).cuda()
+            depth_mask = crop_image(viewpoint_cam.depth_mask, crop).cuda()
 
-            Ll1depth_pure = torch.abs((invDepth  - mono_invdepth) * depth_mask).mean()
+            Ll1depth_pure = torch.abs((invDepth  - mono_invdepth) * depth_mask).mean() * crop_fraction
             Ll1depth = depth_l1_weight(iteration) * Ll1depth_pure 
             loss += Ll1depth
-            Ll1depth = Ll1depth.item()
+            Ll1depth = Ll1depth.item() if metrics is None else Ll1depth.detach()
         else:
             Ll1depth = 0
 
@@ -167,41 +169,62 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
 
         with torch.no_grad():
             # Progress bar
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
-            ema_Ll1depth_for_log = 0.4 * Ll1depth + 0.6 * ema_Ll1depth_for_log
+            if metrics is None:
+                loss_value = loss.item()
+                ema_loss_for_log = 0.4 * loss_value + 0.6 * ema_loss_for_log
+                viewpoint_sampler.update(vind, loss_value)
+                ema_Ll1depth_for_log = 0.4 * Ll1depth + 0.6 * ema_Ll1depth_for_log
+            else:
+                metrics.record(iteration, vind, l1=Ll1, loss=loss, depth=Ll1depth)
+                if metrics.full() or iteration == phase_separator:
+                    ema_loss_for_log, ema_Ll1depth_for_log = drain_metrics(metrics, tb_writer, viewpoint_sampler, ema_loss_for_log, ema_Ll1depth_for_log)
+                    progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}", "Depth Loss": f"{ema_Ll1depth_for_log:.{7}f}"})
+            if sync_counter is not None:
+                sync_report(tb_writer, iteration, sync_counter)
 
             if iteration % 10 == 0:
-                progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}", "Depth Loss": f"{ema_Ll1depth_for_log:.{7}f}"})
+                if metrics is None:
+                    progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}", "Depth Loss": f"{ema_Ll1depth_for_log:.{7}f}"})
                 progress_bar.update(10)
             if iteration == phase_separator:
                 progress_bar.close()
 
             # Log and save
-            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end), testing_iterations, scene, render, (pipe, background, 1., SPARSE_ADAM_AVAILABLE, None, dataset.train_test_exp), dataset.train_test_exp)
-            if (iteration in saving_iterations) or (iteration == phase_separator):
+            elapsed = iter_start.elapsed_time(iter_end) if metrics is None else None
+            training_report(tb_writer, iteration, Ll1, loss, elapsed, testing_iterations, scene, render, (pipe, background, 1., SPARSE_ADAM_AVAILABLE, None, dataset.train_test_exp), dataset.train_test_exp)
+            sampler_report(tb_writer, iteration, testing_iterations, viewpoint_sampler)
+            # phase 2 takes the Gaussians over in memory, the phase 1 result is only written on request
+            if (iteration in saving_iterations) or (iteration == phase_separator and save_phase1_ply):
                 print("\n[ITER {}] Saving Gaussians".format(iteration))
-                scene.save(iteration)
-            if iteration == phase_separator:
-                torch.save(gaussians.point_track_ids, os.path.join(scene.model_path, "point_cloud/iteration_{}".format(iteration),"point_track_ids.pt"))
+                scene.save(iteration, saver)
+            if iteration == phase_separator and save_phase1_ply:
+                saver.submit(partial(gaussians.point_track_ids.save, os.path.join(scene.model_path, "point_cloud/iteration_{}".format(iteration),"point_track_ids.pt")),
+                             gaussians.point_track_ids.state_dict())
+
+            # Gradients of views_per_step views are accumulated before each optimizer step,
+            # densification and opacity resets due in any of these views run with it
+            step_iterations.append(iteration)
+            step_visible = radii > 0 if step_visible is None else step_visible | (radii > 0)
+            optimizer_step = len(step_iterations) == opt.views_per_step or iteration == phase_separator
 
             # Densification
             if iteration < opt.densify_until_iter:
-                # Keep track of max radii in image-space for pruning
-                gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
+                # Keep track of max radii in image-space for pruning, radii are 0 outside the visibility filter
+                torch.maximum(gaussians.max_radii2D, radii, out=gaussians.max_radii2D)
                 gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
 
-                if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 and iteration not in prune_non_text_iterations:
+                if optimizer_step and any(i > opt.densify_from_iter and i % opt.densification_interval == 0 and i not in prune_non_text_iterations for i in step_iterations):
                     size_threshold = 20 if iteration > opt.opacity_reset_interval else None
                     gaussians.densify_and_prune(opt.densify_grad_threshold, 0.005, scene.cameras_extent, size_threshold, radii)
                 
-                if iteration in prune_non_text_iterations:
+                if optimizer_step and any(i in prune_non_text_iterations for i in step_iterations):
                     gaussians.densify_text_and_prune_non_text(radii, min_densify, max_densify)
 
-                if iteration % opt.opacity_reset_interval == 0 or (dataset.white_background and iteration == opt.densify_from_iter):
+                if optimizer_step and any(i % opt.opacity_reset_interval == 0 or (dataset.white_background and i == opt.densify_from_iter) for i in step_iterations):
                     gaussians.reset_opacity()
 
             # Optimizer step
-            if iteration < opt.iterations:
+            if optimizer_step and iteration < opt.iterations:
                 gaussians.exposure_optimizer.step()
                 gaussians.exposure_optimizer.zero_grad(set_to_none = True)
 
@@ -209,7 +232,7 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
                 non_text_lr_factor = 0.0
 
                 if use_sparse_adam:
-                    visible = radii > 0
+                    visible = step_visible
                     text_visible = visible & gaussians.text_points_mask
                     non_text_visible = visible & ~gaussians.text_points_mask
                     gaussians.optimizer.step(text_visible, radii.shape[0], text_lr_factor)
@@ -220,11 +243,19 @@ def training_phase1(dataset, opt, pipe, testing_iterations, saving_iterations, c
                     gaussians.optimizer.step(~gaussians.text_points_mask, radii.shape[0], non_text_lr_factor)
                     gaussians.optimizer.zero_grad(set_to_none = True)
 
+            if optimizer_step:
+                step_iterations = []
+                step_visible = None
+
             if (iteration in checkpoint_iterations):
                 print("\n[ITER {}] Saving Checkpoint".format(iteration))
-                torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
+                saver.submit(partial(save_checkpoint, scene.model_path + "/chkpnt" + str(iteration) + ".pth"),
+                             snapshot_tensors((gaussians.capture(), iteration)), to_host=False)
+
+    saver.flush()
+    return scene, colmap_track_ids
 
-def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, phase_separator):
+def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, phase_separator, saver, phase1_scene=None, colmap_track_ids=None, metrics_interval=0, sync_counter=None):
 
     if not SPARSE_ADAM_AVAILABLE and opt.optimizer_type == "sparse_adam":
         sys.exit(f"Trying to use sparse adam but it is not installed, please install the correct rasterizer using pip install [3dgs_accel].")
@@ -233,7 +264,10 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
     tb_writer = prepare_output_and_logger(dataset)
     gaussians = GaussianModel(dataset.sh_degree, opt.optimizer_type)
     gaussians.source_path = dataset.source_path
-    scene = Scene(dataset, gaussians, merge_ply_iter=phase_separator if phase_separator!=0 else -1)
+    if phase1_scene is not None:
+        scene = Scene(dataset, gaussians, previous_scene=phase1_scene, colmap_track_ids=colmap_track_ids)
+    else:
+        scene = Scene(dataset, gaussians, merge_ply_iter=phase_separator if phase_separator!=0 else -1)
     gaussians.training_setup(opt, use_masked_gaussian_adam=True)
     if checkpoint:
         (model_params, first_iter) = torch.load(checkpoint)
@@ -248,10 +282,14 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
     use_sparse_adam = opt.optimizer_type == "sparse_adam" and SPARSE_ADAM_AVAILABLE 
     depth_l1_weight = get_expon_lr_func(opt.depth_l1_weight_init, opt.depth_l1_weight_final, max_steps=opt.iterations)
 
-    viewpoint_stack = scene.getTrainCameras().copy()
-    viewpoint_indices = list(range(len(viewpoint_stack)))
+    viewpoint_sampler = create_viewpoint_sampler(scene.getTrainCameras(), opt)
     ema_loss_for_log = 0.0
     ema_Ll1depth_for_log = 0.0
+    # with a metrics interval the losses stay on the device and are only read every metrics_interval iterations
+    metrics = DeviceMetrics(("l1", "loss", "depth"), metrics_interval) if metrics_interval > 0 else None
+    # the iterations (views) rendered since the last optimizer step, and the Gaussians visible in them
+    step_iterations = []
+    step_visible = None
 
     progress_bar = tqdm(range(first_iter, opt.iterations - phase_separator), desc="Training progress (Phase 2)")
     first_iter += 1
@@ -274,6 +312,8 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
             except Exception as e:
                 network_gui.conn = None
 
+        if metrics is not None:
+            iter_start, iter_end = metrics.timer()
         iter_start.record()
 
         gaussians.update_learning_rate(iteration)
@@ -283,12 +323,8 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
             gaussians.oneupSHdegree()
 
         # Pick a random Camera
-        if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras().copy()
-            viewpoint_indices = list(range(len(viewpoint_stack)))
-        rand_idx = randint(0, len(viewpoint_indices) - 1)
-        viewpoint_cam = viewpoint_stack.pop(rand_idx)
-        vind = viewpoint_indices.pop(rand_idx)
+        vind, viewpoint_cam = viewpoint_sampler.next()
+        scene.prefetch(viewpoint_sampler.peek(scene.prefetch_views))
 
         # Render
         if (iteration - 1) == debug_from:
@@ -305,11 +341,12 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
 
         # Loss
         gt_image = viewpoint_cam.original_image.cuda()
-        Ll1 = l1_loss(image, gt_image)
         if FUSED_SSIM_AVAILABLE:
+            Ll1 = l1_loss(image, gt_image)
             ssim_value = fused_ssim(image.unsqueeze(0), gt_image.unsqueeze(0))
         else:
-            ssim_value = ssim(image, gt_image)
+            image_values = image_metrics(image.unsqueeze(0), gt_image.unsqueeze(0))
+            Ll1, ssim_value = image_values["l1"][0], image_values["ssim"][0]
 
         loss = (1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim_value)
 
@@ -323,7 +360,7 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
             Ll1depth_pure = torch.abs((invDepth  - mono_invdepth) * depth_mask).mean()
             Ll1depth = depth_l1_weight(iteration) * Ll1depth_pure 
             loss += Ll1depth
-            Ll1depth = Ll1depth.item()
+            Ll1depth = Ll1depth.item() if metrics is None else Ll1depth.detach()
         else:
             Ll1depth = 0
 
@@ -333,43 +370,65 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
 
         with torch.no_grad():
             # Progress bar
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
-            ema_Ll1depth_for_log = 0.4 * Ll1depth + 0.6 * ema_Ll1depth_for_log
+            if metrics is None:
+                loss_value = loss.item()
+                ema_loss_for_log = 0.4 * loss_value + 0.6 * ema_loss_for_log
+                viewpoint_sampler.update(vind, loss_value)
+                ema_Ll1depth_for_log = 0.4 * Ll1depth + 0.6 * ema_Ll1depth_for_log
+            else:
+                metrics.record(iteration, vind, l1=Ll1, loss=loss, depth=Ll1depth)
+                if metrics.full() or iteration == opt.iterations - phase_separator:
+                    ema_loss_for_log, ema_Ll1depth_for_log = drain_metrics(metrics, tb_writer, viewpoint_sampler, ema_loss_for_log, ema_Ll1depth_for_log)
+                    progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}", "Depth Loss": f"{ema_Ll1depth_for_log:.{7}f}"})
+            if sync_counter is not None:
+                sync_report(tb_writer, iteration, sync_counter)
 
             if iteration % 10 == 0:
-                progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}", "Depth Loss": f"{ema_Ll1depth_for_log:.{7}f}"})
+                if metrics is None:
+                    progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}", "Depth Loss": f"{ema_Ll1depth_for_log:.{7}f}"})
                 progress_bar.update(10)
             if iteration == opt.iterations - phase_separator:
                 progress_bar.close()
 
             # Log and save
-            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end), testing_iterations, scene, render, (pipe, background, 1., SPARSE_ADAM_AVAILABLE, None, dataset.train_test_exp), dataset.train_test_exp)
+            elapsed = iter_start.elapsed_time(iter_end) if metrics is None else None
+            training_report(tb_writer, iteration, Ll1, loss, elapsed, testing_iterations, scene, render, (pipe, background, 1., SPARSE_ADAM_AVAILABLE, None, dataset.train_test_exp), dataset.train_test_exp)
+            sampler_report(tb_writer, iteration, testing_iterations, viewpoint_sampler)
             if (iteration+phase_separator in saving_iterations):
                 print("\n[ITER {}] Saving Gaussians".format(iteration+phase_separator))
-                scene.save(iteration+phase_separator)
+                scene.save(iteration+phase_separator, saver)
+                # text Gaussians are kept at full detail by build_lod.py
+                saver.submit(partial(save_checkpoint, os.path.join(scene.model_path, "point_cloud/iteration_{}".format(iteration+phase_separator), "text_points_mask.pt")),
+                             gaussians.text_points_mask.clone())
+
+            # Gradients of views_per_step views are accumulated before each optimizer step,
+            # densification and opacity resets due in any of these views run with it
+            step_iterations.append(iteration)
+            step_visible = radii > 0 if step_visible is None else step_visible | (radii > 0)
+            optimizer_step = len(step_iterations) == opt.views_per_step or iteration == opt.iterations - phase_separator
 
             # Densification
             if iteration < opt.densify_until_iter - phase_separator:
-                # Keep track of max radii in image-space for pruning
-                gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
+                # Keep track of max radii in image-space for pruning, radii are 0 outside the visibility filter
+                torch.maximum(gaussians.max_radii2D, radii, out=gaussians.max_radii2D)
                 gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
 
-                if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0:
+                if optimizer_step and any(i > opt.densify_from_iter and i % opt.densification_interval == 0 for i in step_iterations):
                     size_threshold = 20 if iteration > opt.opacity_reset_interval else None
                     gaussians.densify_and_prune(opt.densify_grad_threshold, 0.005, scene.cameras_extent, size_threshold, radii)
                 
-                if iteration % opt.opacity_reset_interval == 0 or (dataset.white_background and iteration == opt.densify_from_iter):
+                if optimizer_step and any(i % opt.opacity_reset_interval == 0 or (dataset.white_background and i == opt.densify_from_iter) for i in step_iterations):
                     gaussians.reset_opacity()
 
             # Optimizer step
-            if iteration < opt.iterations:
+            if optimizer_step and iteration < opt.iterations:
                 gaussians.exposure_optimizer.step()
                 gaussians.exposure_optimizer.zero_grad(set_to_none = True)
 
                 text_lr_factor = 0.5 / (1+2.71828**(-0.0005*(iteration-12000)))
                 non_text_lr_factor = 0.5
                 if use_sparse_adam:
-                    visible = radii > 0
+                    visible = step_visible
                     text_visible = visible & gaussians.text_points_mask
                     non_text_visible = visible & ~gaussians.text_points_mask
                     gaussians.optimizer.step(text_visible, radii.shape[0], text_lr_factor)
@@ -380,9 +439,25 @@ def training_phase2(dataset, opt, pipe, testing_iterations, saving_iterations, c
                     gaussians.optimizer.step(~gaussians.text_points_mask, radii.shape[0], non_text_lr_factor)
                     gaussians.optimizer.zero_grad(set_to_none = True)
 
+            # Contribution pruning of the non-text Gaussians, the remaining iterations fine-tune the pruned model
+            if optimizer_step and any(i + phase_separator == opt.contribution_prune_iteration for i in step_iterations):
+                target_count = prune_target(gaussians, opt.contribution_prune_target, opt.contribution_prune_budget_mb)
+                if target_count is not None:
+                    prune_low_contribution(gaussians, scene.getTrainCameras(), pipe, background, target_count, dataset.train_test_exp,
+                                           opt.contribution_prune_view_stride)
+
+            if optimizer_step:
+                step_iterations = []
+                step_visible = None
+
             if (iteration in checkpoint_iterations):
                 print("\n[ITER {}] Saving Checkpoint".format(iteration))
-                torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
+                saver.submit(partial(save_checkpoint, scene.model_path + "/chkpnt" + str(iteration) + ".pth"),
+                             snapshot_tensors((gaussians.capture(), iteration)), to_host=False)
+
+def save_checkpoint(path, snapshot):
+    with atomic_write_path(path) as tmp_path:
+        torch.save(snapshot, tmp_path)
 
 def prepare_output_and_logger(args):    
     if not args.model_path:
@@ -406,8 +481,37 @@ def prepare_output_and_logger(args):
         print("Tensorboard not available: not logging progress")
     return tb_writer
 
-def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs, train_test_exp):
+def sampler_report(tb_writer, iteration, testing_iterations, sampler):
+    if tb_writer and iteration in testing_iterations:
+        probabilities = sampler.probabilities()
+        tb_writer.add_histogram("sampler/view_probabilities", probabilities, iteration)
+        tb_writer.add_scalar("sampler/max_view_probability", probabilities.max(), iteration)
+
+def drain_metrics(metrics, tb_writer, sampler, ema_loss_for_log, ema_Ll1depth_for_log):
+    """Read the losses recorded in `metrics`, log them and feed them to the sampler; returns the updated EMAs."""
+    for iteration, view_index, values, elapsed in metrics.drain():
+        ema_loss_for_log = 0.4 * values["loss"] + 0.6 * ema_loss_for_log
+        ema_Ll1depth_for_log = 0.4 * values["depth"] + 0.6 * ema_Ll1depth_for_log
+        sampler.update(view_index, values["loss"])
+        if tb_writer:
+            tb_writer.add_scalar('train_loss_patches/l1_loss', values["l1"], iteration)
+            tb_writer.add_scalar('train_loss_patches/total_loss', values["loss"], iteration)
+            if elapsed is not None:
+                tb_writer.add_scalar('iter_time', elapsed, iteration)
+    return ema_loss_for_log, ema_Ll1depth_for_log
+
+def sync_report(tb_writer, iteration, sync_counter):
+    syncs = sync_counter.tick()
+    if syncs is None:
+        return
     if tb_writer:
+        tb_writer.add_scalar('syncs_per_{}_iterations'.format(sync_counter.window), syncs, iteration)
+    else:
+        print("\n[ITER {}] {} host-device synchronizations in the last {} iterations".format(iteration, syncs, sync_counter.window))
+
+def training_report(tb_writer, iteration, Ll1, loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs, train_test_exp):
+    # without an elapsed time the per-iteration scalars are logged by drain_metrics
+    if tb_writer and elapsed is not None:
         tb_writer.add_scalar('train_loss_patches/l1_loss', Ll1.item(), iteration)
         tb_writer.add_scalar('train_loss_patches/total_loss', loss.item(), iteration)
         tb_writer.add_scalar('iter_time', elapsed, iteration)
@@ -420,26 +524,33 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_i
 
         for config in validation_configs:
             if config['cameras'] and len(config['cameras']) > 0:
-                l1_test = 0.0
-                psnr_test = 0.0
+                records = []
                 for idx, viewpoint in enumerate(config['cameras']):
+                    scene.prefetch(config['cameras'][idx + 1:])
                     image = torch.clamp(renderFunc(viewpoint, scene.gaussians, *renderArgs)["render"], 0.0, 1.0)
                     gt_image = torch.clamp(viewpoint.original_image.to("cuda"), 0.0, 1.0)
+                    gt_mask = viewpoint.gt_mask.to("cuda")
                     if train_test_exp:
                         image = image[..., image.shape[-1] // 2:]
                         gt_image = gt_image[..., gt_image.shape[-1] // 2:]
+                        gt_mask = gt_mask[..., gt_mask.shape[-1] // 2:]
                     if tb_writer and (idx < 5):
                         tb_writer.add_images(config['name'] + "_view_{}/render".format(viewpoint.image_name), image[None], global_step=iteration)
                         if iteration == testing_iterations[0]:
                             tb_writer.add_images(config['name'] + "_view_{}/ground_truth".format(viewpoint.image_name), gt_image[None], global_step=iteration)
-                    l1_test += l1_loss(image, gt_image).mean().double()
-                    psnr_test += psnr(image, gt_image).mean().double()
-                psnr_test /= len(config['cameras'])
-                l1_test /= len(config['cameras'])          
-                print("\n[ITER {}] Evaluating {}: L1 {} PSNR {}".format(iteration, config['name'], l1_test, psnr_test))
+                    records.append(image_metrics(image[None], gt_image[None], gt_mask[None]))
+                records = metric_records({key: torch.cat([record[key] for record in records]) for key in records[0]})
+                l1_test = sum(record["l1"] for record in records) / len(records)
+                psnr_test = sum(record["psnr"] for record in records) / len(records)
+                # text metrics average the views that show text
+                text_psnrs = [record["psnr_text"] for record in records if record["text_fraction"] > 0]
+                psnr_text_test = sum(text_psnrs) / len(text_psnrs) if text_psnrs else float("nan")
+                print("\n[ITER {}] Evaluating {}: L1 {} PSNR {} PSNR (text) {}".format(iteration, config['name'], l1_test, psnr_test, psnr_text_test))
                 if tb_writer:
                     tb_writer.add_scalar(config['name'] + '/loss_viewpoint - l1_loss', l1_test, iteration)
                     tb_writer.add_scalar(config['name'] + '/loss_viewpoint - psnr', psnr_test, iteration)
+                    if text_psnrs:
+                        tb_writer.add_scalar(config['name'] + '/loss_viewpoint - psnr_text', psnr_text_test, iteration)
 
         if tb_writer:
             tb_writer.add_histogram("scene/opacity_histogram", scene.gaussians.get_opacity, iteration)
@@ -462,11 +573,15 @@ if __name__ == "__main__":
     parser.add_argument('--disable_viewer', action='store_true', default=False)
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--sync_save", action="store_true", default=False)
+    parser.add_argument("--metrics_interval", type=int, default=0)
+    parser.add_argument("--count_syncs", action="store_true", default=False)
 
     # custom args
     parser.add_argument("--phase_separator", type=str, default="3_000")
     parser.add_argument("--min_densify", type=int, default=1)
     parser.add_argument("--max_densify", type=int, default=15)
+    parser.add_argument("--save_phase1_ply", action="store_true", default=False)
     args = parser.parse_args(sys.argv[1:])
     args.save_iterations.append(args.iterations)
     
@@ -479,10 +594,18 @@ if __name__ == "__main__":
     if not args.disable_viewer:
         network_gui.init(args.ip, args.port)
     torch.autograd.set_detect_anomaly(args.detect_anomaly)
+    saver = BackgroundSaver(asynchronous=not args.sync_save)
+    sync_counter = SyncCounter() if args.count_syncs else None
+    if sync_counter is not None:
+        sync_counter.start()
+    phase1_scene, colmap_track_ids = None, None
     if args.phase_separator != '0':
-        training_phase1(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, int(args.phase_separator), args.min_densify, args.max_densify)
+        phase1_scene, colmap_track_ids = training_phase1(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, int(args.phase_separator), args.min_densify, args.max_densify, saver, args.save_phase1_ply, args.metrics_interval, sync_counter)
 
-    training_phase2(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, int(args.phase_separator))
+    training_phase2(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, int(args.phase_separator), saver, phase1_scene, colmap_track_ids, args.metrics_interval, sync_counter)
+    saver.close()
+    if sync_counter is not None:
+        sync_counter.stop()
 
     # All done
     print("\nTraining complete.")
@@ -0,0 +1,76 @@
+import torch
+
+
+class CapacityBuffer:
+    """
+    Preallocated (capacity, ...) tensor of which the first `length` rows are in use.
+
+    `data` is a view of the active rows. Appending writes past the end and only
+    reallocates (doubling the capacity) when the storage is full; `keep`
+    compacts the kept rows to the front, preserving their order.
+    """
+
+    def __init__(self, tensor, capacity=None):
+        capacity = max(int(capacity or 0), tensor.shape[0])
+        self.storage = torch.empty((capacity,) + tuple(tensor.shape[1:]), dtype=tensor.dtype, device=tensor.device)
+        self.storage[:tensor.shape[0]].copy_(tensor)
+        self.length = tensor.shape[0]
+
+    @property
+    def capacity(self):
+        return self.storage.shape[0]
+
+    @property
+    def data(self):
+        return self.storage[:self.length]
+
+    def is_backing(self, tensor):
+        """Whether `tensor` is exactly the active view of this buffer."""
+        return (tensor is not None and tensor.data_ptr() == self.storage.data_ptr() and tensor.shape == self.data.shape
+                and tensor.dtype == self.storage.dtype)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        storage = torch.empty((max(capacity, 2 * self.capacity),) + tuple(self.storage.shape[1:]),
+                              dtype=self.storage.dtype, device=self.storage.device)
+        storage[:self.length].copy_(self.storage[:self.length])
+        self.storage = storage
+
+    def assign(self, tensor):
+        """Replace the contents with `tensor`, reusing the storage when it is large enough."""
+        if tuple(tensor.shape[1:]) != tuple(self.storage.shape[1:]) or tensor.dtype != self.storage.dtype:
+            self.__init__(tensor)
+            return
+        if tensor.data_ptr() != self.storage.data_ptr():
+            self.reserve(tensor.shape[0])
+            self.storage[:tensor.shape[0]].copy_(tensor)
+        self.length = tensor.shape[0]
+
+    def extend(self, values=None, count=None):
+        """Append `values`, or `count` zero rows."""
+        count = values.shape[0] if values is not None else count
+        self.reserve(self.length + count)
+        if values is not None:
+            self.storage[self.length:self.length + count].copy_(values)
+        else:
+            self.storage[self.length:self.length + count].zero_()
+        self.length += count
+
+    def keep(self, mask, chunk_size=1 << 16):
+        """
+        Drop the rows where `mask` is False, compacting the kept rows in place
+        `chunk_size` rows at a time. A kept row never moves back past its
+        source, so only one chunk of rows is ever held outside the storage.
+        """
+        indices = torch.nonzero(mask)[:, 0]
+        for start in range(0, indices.shape[0], chunk_size):
+            chunk = indices[start:start + chunk_size]
+            self.storage[start:start + chunk.shape[0]] = self.storage[chunk]
+        self.length = indices.shape[0]
+
+    def resize_zero(self, length):
+        """Resize to `length` rows, all zero."""
+        self.reserve(length)
+        self.length = length
+        self.data.zero_()
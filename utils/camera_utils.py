@@ -9,47 +9,47 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
-from scene.cameras import Camera
+from scene.cameras import Camera, prepare_camera_data
 import numpy as np
 from utils.graphics_utils import fov2focal
+from utils.mask_cache import get_mask_cache, count_mask_pixels
 from PIL import Image
 import cv2
 import os
+import threading
+import torch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 WARNED = False
 
-def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dataset):
-    image = Image.open(cam_info.image_path)
-    mask_path = Path(cam_info.image_path).parent.parent / "masks" / Path(cam_info.image_path).name
-    if os.path.exists(mask_path):
-        mask = Image.open(mask_path).convert("L")
-    else:
-        mask = Image.new("L", image.size, 0) 
-        print("[ WARNING ] Mask file not found at path: ", mask_path)
+def get_mask_path(cam_info):
+    return Path(cam_info.image_path).parent.parent / "masks" / Path(cam_info.image_path).name
 
-    if cam_info.depth_path != "":
-        try:
-            if is_nerf_synthetic:
-                invdepthmap = cv2.imread(cam_info.depth_path, -1).astype(np.float32) / 512
-            else:
-                invdepthmap = cv2.imread(cam_info.depth_path, -1).astype(np.float32) / float(2**16)
-
-        except FileNotFoundError:
-            print(f"Error: The depth file at path '{cam_info.depth_path}' was not found.")
-            raise
-        except IOError:
-            print(f"Error: Unable to open the image file '{cam_info.depth_path}'. It may be corrupted or an unsupported format.")
-            raise
-        except Exception as e:
-            print(f"An unexpected error occurred when trying to read depth at {cam_info.depth_path}: {e}")
-            raise
-    else:
-        invdepthmap = None
-        
-    orig_w, orig_h = image.size
+def read_invdepth(cam_info, is_nerf_synthetic):
+    if cam_info.depth_path == "":
+        return None
+    try:
+        if is_nerf_synthetic:
+            return cv2.imread(cam_info.depth_path, -1).astype(np.float32) / 512
+        else:
+            return cv2.imread(cam_info.depth_path, -1).astype(np.float32) / float(2**16)
+
+    except FileNotFoundError:
+        print(f"Error: The depth file at path '{cam_info.depth_path}' was not found.")
+        raise
+    except IOError:
+        print(f"Error: Unable to open the image file '{cam_info.depth_path}'. It may be corrupted or an unsupported format.")
+        raise
+    except Exception as e:
+        print(f"An unexpected error occurred when trying to read depth at {cam_info.depth_path}: {e}")
+        raise
+
+def get_resolution(args, orig_w, orig_h, resolution_scale):
     if args.resolution in [1, 2, 4, 8]:
-        resolution = round(orig_w/(resolution_scale * args.resolution)), round(orig_h/(resolution_scale * args.resolution))
+        return round(orig_w/(resolution_scale * args.resolution)), round(orig_h/(resolution_scale * args.resolution))
     else:  # should be a type that converts to float
         if args.resolution == -1:
             if orig_w > 1600:
@@ -66,22 +66,120 @@ def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dat
     
 
         scale = float(global_down) * float(resolution_scale)
-        resolution = (int(orig_w / scale), int(orig_h / scale))
+        return (int(orig_w / scale), int(orig_h / scale))
+
+def load_camera_data(cam_info, resolution, is_nerf_synthetic, is_test_dataset, train_test_exp):
+    """Decode the image, text mask and inverse depth of `cam_info` at `resolution` into host tensors."""
+    image = Image.open(cam_info.image_path)
+    invdepthmap = read_invdepth(cam_info, is_nerf_synthetic)
+
+    mask_path = get_mask_path(cam_info)
+    mask = get_mask_cache(mask_path.parent.parent).get(mask_path, resolution)
+    if mask is None:
+        mask = np.zeros((resolution[1], resolution[0]), dtype=bool)
+
+    return prepare_camera_data(resolution, image, invdepthmap, mask, cam_info.depth_params,
+                               train_test_exp=train_test_exp, is_test_dataset=is_test_dataset, is_test_view=cam_info.is_test)
+
+def load_packed_camera_data(image_pack, cam_info, resolution, is_test_dataset, train_test_exp):
+    """Same as load_camera_data, reading the pre-decoded planes of an ImagePack instead."""
+    image, mask, invdepthmap = image_pack.get(cam_info.image_name)
+    image = torch.from_numpy(image.astype(np.float32) / 255.0)
+    if invdepthmap is not None:
+        invdepthmap = invdepthmap.astype(np.float32)
+
+    return prepare_camera_data(resolution, image, invdepthmap, mask, cam_info.depth_params,
+                               train_test_exp=train_test_exp, is_test_dataset=is_test_dataset, is_test_view=cam_info.is_test)
+
+def loadCam(args, id, cam_info, resolution_scale, is_nerf_synthetic, is_test_dataset, data_loader=None, image_pack=None):
+    # only the header is read here, pixels are decoded by load_camera_data
+    with Image.open(cam_info.image_path) as image:
+        orig_w, orig_h = image.size
+    resolution = get_resolution(args, orig_w, orig_h, resolution_scale)
+    mask_path = get_mask_path(cam_info)
+
+    if image_pack is not None and image_pack.is_valid(cam_info.image_name, resolution, cam_info.image_path, mask_path, cam_info.depth_path or None):
+        text_coverage = image_pack.text_coverage(cam_info.image_name)
+        data_source = partial(load_packed_camera_data, image_pack, cam_info, resolution, is_test_dataset, args.train_test_exp)
+    else:
+        if image_pack is not None:
+            print(f"[ WARNING ] Image pack is missing or outdated for {cam_info.image_name}, decoding it from the source files")
+        packed_mask = get_mask_cache(mask_path.parent.parent).get_packed(mask_path, resolution)
+        if packed_mask is None:
+            print("[ WARNING ] Mask file not found at path: ", mask_path)
+        text_coverage = count_mask_pixels(packed_mask) / (resolution[0] * resolution[1]) if packed_mask is not None else 0.0
+        data_source = partial(load_camera_data, cam_info, resolution, is_nerf_synthetic, is_test_dataset, args.train_test_exp)
 
     return Camera(resolution, colmap_id=cam_info.uid, R=cam_info.R, T=cam_info.T, 
                   FoVx=cam_info.FovX, FoVy=cam_info.FovY, depth_params=cam_info.depth_params,
-                  image=image, invdepthmap=invdepthmap,
-                  image_name=cam_info.image_name, uid=id, data_device=args.data_device,
-                  train_test_exp=args.train_test_exp, is_test_dataset=is_test_dataset, is_test_view=cam_info.is_test, mask=mask)
+                  data_source=data_source, image_name=cam_info.image_name, uid=id, data_device=args.data_device,
+                  has_depth=cam_info.depth_path != "", text_coverage=text_coverage, data_loader=data_loader)
 
-def cameraList_from_camInfos(cam_infos, resolution_scale, args, is_nerf_synthetic, is_test_dataset):
+def cameraList_from_camInfos(cam_infos, resolution_scale, args, is_nerf_synthetic, is_test_dataset, data_loader=None, image_pack=None):
     camera_list = []
 
     for id, c in enumerate(cam_infos):
-        camera_list.append(loadCam(args, id, c, resolution_scale, is_nerf_synthetic, is_test_dataset))
+        camera_list.append(loadCam(args, id, c, resolution_scale, is_nerf_synthetic, is_test_dataset, data_loader, image_pack))
+
+    if cam_infos:
+        get_mask_cache(Path(cam_infos[0].image_path).parent.parent).flush()
 
     return camera_list
 
+class CameraDataLoader:
+    """
+    On-demand image, mask and inverse depth loading for lazy cameras.
+
+    `prefetch` decodes upcoming views on a background thread pool; decoded
+    views are kept in (pinned, when CUDA is available) host memory in an LRU
+    of at most `cache_size` views.
+    """
+
+    def __init__(self, cache_size=64, num_workers=4):
+        self.cache_size = max(1, cache_size)
+        self.pin_memory = torch.cuda.is_available()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="camera_loader")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pending = {}
+
+    def _decode(self, camera):
+        data = camera.data_source()
+        if self.pin_memory:
+            data = {key: value.pin_memory() if value is not None else None for key, value in data.items()}
+        return data
+
+    def prefetch(self, cameras):
+        """Schedule decoding of `cameras` that are neither cached nor already being decoded."""
+        with self._lock:
+            for camera in cameras:
+                if camera in self._cache or camera in self._pending:
+                    continue
+                if len(self._pending) >= self.cache_size:
+                    break
+                self._pending[camera] = self._executor.submit(self._decode, camera)
+
+    def get(self, camera):
+        with self._lock:
+            data = self._cache.get(camera)
+            if data is not None:
+                self._cache.move_to_end(camera)
+                return data
+            future = self._pending.pop(camera, None)
+        data = future.result() if future is not None else self._decode(camera)
+        with self._lock:
+            self._cache[camera] = data
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def clear(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending = {}
+            self._cache = OrderedDict()
+
 def camera_to_JSON(id, camera : Camera):
     Rt = np.zeros((4, 4))
     Rt[:3, :3] = camera.R.transpose()
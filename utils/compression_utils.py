@@ -0,0 +1,135 @@
+import os
+import numpy as np
+import torch
+from utils.system_utils import atomic_write_path
+
+def kmeans(x, k, iterations=10, batch_size=1 << 16, seed=0):
+    """
+    Lloyd's k-means of the rows of `x` (N, D). Returns the (k, D) centroids and
+    the (N,) assignment. Distances are computed in batches of `batch_size`
+    rows; empty clusters are reseeded with random rows.
+    """
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    k = min(k, x.shape[0])
+    centroids = x[torch.randperm(x.shape[0], generator=generator)[:k].to(x.device)].clone()
+    labels = torch.empty(x.shape[0], dtype=torch.long, device=x.device)
+    for iteration in range(iterations + 1):
+        for start in range(0, x.shape[0], batch_size):
+            labels[start:start + batch_size] = torch.cdist(x[start:start + batch_size], centroids).argmin(dim=1)
+        if iteration == iterations:
+            break
+        counts = torch.bincount(labels, minlength=k)
+        sums = torch.zeros_like(centroids).index_add_(0, labels, x)
+        empty = counts == 0
+        centroids = torch.where(empty[:, None], centroids, sums / counts.clamp_min(1)[:, None])
+        num_empty = int(empty.sum())
+        if num_empty > 0:
+            centroids[empty] = x[torch.randint(x.shape[0], (num_empty,), generator=generator).to(x.device)]
+    return centroids, labels
+
+def _contribution(pc):
+    # opacity times the mean projected area of the Gaussian, a view independent proxy of its contribution
+    scaling = pc.get_scaling
+    surface = scaling[:, 0] * scaling[:, 1] + scaling[:, 1] * scaling[:, 2] + scaling[:, 0] * scaling[:, 2]
+    return pc.get_opacity[:, 0] * surface
+
+def compress_gaussians(pc, codebook_size=4096, kmeans_iterations=10, truncate_fraction=0.0, truncate_degree=0):
+    """
+    Compact encoding of the GaussianModel `pc` as a dict of numpy arrays.
+
+    f_rest (the view dependent SH coefficients) is vector quantized with a
+    k-means codebook of `codebook_size` entries; positions (relative to their
+    mean), scales (log), rotations and f_dc are stored as float16, opacity
+    as 8 bits. The `truncate_fraction` of Gaussians contributing least
+    (opacity times surface) keep only SH degree `truncate_degree` and are left
+    out of the codebook fit.
+    """
+    with torch.no_grad():
+        xyz = pc.get_xyz
+        center = xyz.mean(dim=0)
+        num_points = xyz.shape[0]
+        f_rest = pc.get_features_rest.transpose(1, 2).flatten(start_dim=1)
+
+        sh_degrees = torch.full((num_points,), pc.max_sh_degree, dtype=torch.uint8, device=xyz.device)
+        num_truncated = int(num_points * truncate_fraction)
+        if num_truncated > 0 and truncate_degree < pc.max_sh_degree:
+            truncated = torch.argsort(_contribution(pc))[:num_truncated]
+            sh_degrees[truncated] = truncate_degree
+        # coefficients of the truncated degrees are decoded as zeros, fit the codebook to the rest
+        f_rest = f_rest * _degree_mask(sh_degrees, pc.max_sh_degree).repeat(1, 3)
+        fitted = sh_degrees == pc.max_sh_degree
+        if f_rest.shape[1] > 0:
+            codebook, _ = kmeans(f_rest[fitted] if fitted.any() else f_rest, codebook_size, kmeans_iterations)
+        else:
+            codebook = f_rest[:1]
+        # each Gaussian picks its entry by the coefficients its SH degree keeps, the others are decoded as zeros
+        indices = torch.zeros(num_points, dtype=torch.long, device=xyz.device)
+        for degree in (torch.unique(sh_degrees).tolist() if f_rest.shape[1] > 0 else []):
+            selected = torch.nonzero(sh_degrees == degree)[:, 0]
+            kept = _degree_mask(torch.tensor([degree], device=xyz.device), pc.max_sh_degree)[0].repeat(3)
+            if not kept.any():
+                continue
+            for start in range(0, selected.shape[0], 1 << 16):
+                chunk = selected[start:start + (1 << 16)]
+                indices[chunk] = torch.cdist(f_rest[chunk][:, kept], codebook[:, kept]).argmin(dim=1)
+
+        # 256 opacity bins, decoded at their centers
+        opacity = (pc.get_opacity[:, 0] * 256).floor().clamp(0, 255)
+        index_dtype = np.uint16 if codebook.shape[0] <= 1 << 16 else np.int32
+        return {
+            "sh_degree": np.array(pc.max_sh_degree),
+            "center": center.cpu().numpy().astype(np.float32),
+            "xyz": (xyz - center).cpu().numpy().astype(np.float16),
+            "f_dc": pc.get_features_dc.transpose(1, 2).flatten(start_dim=1).cpu().numpy().astype(np.float16),
+            "f_rest_codebook": codebook.cpu().numpy().astype(np.float16),
+            "f_rest_indices": indices.cpu().numpy().astype(index_dtype),
+            "sh_degrees": sh_degrees.cpu().numpy(),
+            "opacity": opacity.cpu().numpy().astype(np.uint8),
+            "scaling": pc._scaling.detach().cpu().numpy().astype(np.float16),
+            "rotation": pc.get_rotation.detach().cpu().numpy().astype(np.float16),
+        }
+
+def save_compressed(path, data):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with atomic_write_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **data)
+
+def _degree_mask(sh_degrees, max_sh_degree):
+    # (N, (max_sh_degree + 1)² - 1): whether each f_rest coefficient is within the Gaussian's SH degree
+    coefficient = torch.arange(1, (max_sh_degree + 1) ** 2, device=sh_degrees.device)
+    degree = torch.floor(torch.sqrt(coefficient.float())).long()
+    return degree[None, :] <= sh_degrees[:, None].long()
+
+def decode_features_rest(codebook, indices, sh_degrees, max_sh_degree):
+    """(N, (max_sh_degree + 1)² - 1, 3) f_rest of a compressed model, zero beyond each Gaussian's SH degree."""
+    features = codebook[indices].view(indices.shape[0], 3, -1).transpose(1, 2)
+    if bool((sh_degrees < max_sh_degree).any()):
+        features = features * _degree_mask(sh_degrees, max_sh_degree)[:, :, None]
+    return features
+
+def load_compressed(path, device):
+    """
+    The tensors of a compressed model on `device`: float32 xyz, f_dc (N, 1, 3),
+    opacity, scaling and rotation in their save_ply (pre-activation) form, and
+    the f_rest codebook, indices and SH degrees for decode_features_rest.
+    """
+    with np.load(path) as data:
+        data = {key: data[key] for key in data.files}
+    tensor = lambda key, dtype=np.float32: torch.from_numpy(data[key].astype(dtype)).to(device)
+    xyz = tensor("xyz") + tensor("center")
+    features_dc = tensor("f_dc").view(-1, 3, 1).transpose(1, 2).contiguous()
+    opacity = ((tensor("opacity") + 0.5) / 256)[:, None]
+    opacity = torch.log(opacity / (1 - opacity))
+    return {
+        "sh_degree": int(data["sh_degree"]),
+        "xyz": xyz,
+        "features_dc": features_dc,
+        "opacity": opacity,
+        "scaling": tensor("scaling"),
+        "rotation": tensor("rotation"),
+        "f_rest_codebook": tensor("f_rest_codebook"),
+        "f_rest_indices": tensor("f_rest_indices", np.int64),
+        "sh_degrees": tensor("sh_degrees", np.uint8),
+    }
@@ -0,0 +1,131 @@
+import os
+import json
+import struct
+import numpy as np
+from utils.mask_cache import count_mask_pixels
+
+IMAGE_PACK_VERSION = 1
+
+_MAGIC = b"STRPACK\0"
+# magic, version, index offset, index size
+_HEADER = struct.Struct("<8sIQQ")
+# planes are aligned so every memmap slice starts on a cache line
+_ALIGNMENT = 64
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (FileNotFoundError, TypeError):
+        return None
+
+class ImagePackWriter:
+    """
+    Writes pre-decoded training images into a single memory-mappable file.
+
+    Each view is stored as one chunk: uint8 image planes (C, H, W), the text
+    mask bit-packed (1 bit per pixel, row-major, little bit order) and, if
+    present, the inverse depth map as float16 (H, W). A JSON index at the end
+    records the chunk layout and the mtimes of the source files.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.entries = {}
+        self.metadata = metadata or {}
+        self._file = open(self.tmp_path, "wb")
+        self._file.write(b"\0" * _HEADER.size)
+        self._offset = _HEADER.size
+
+    def _write(self, array):
+        padding = -self._offset % _ALIGNMENT
+        self._file.write(b"\0" * padding)
+        offset = self._offset + padding
+        data = np.ascontiguousarray(array).tobytes()
+        self._file.write(data)
+        self._offset = offset + len(data)
+        return offset
+
+    def add(self, image_name, image, mask, invdepthmap, image_path, mask_path, depth_path):
+        """
+        Add a view. `image` is the resized uint8 (H, W[, C]) image, `mask` a boolean (H, W)
+        array and `invdepthmap` the resized float (H, W) inverse depth or None.
+        """
+        if image.dtype != np.uint8:
+            raise ValueError(f"Only 8-bit images can be packed, got {image.dtype} for {image_path}")
+        planes = image[None] if image.ndim == 2 else image.transpose(2, 0, 1)
+        height, width = planes.shape[1:]
+        if mask.shape != (height, width):
+            raise ValueError(f"Mask of {image_name} has shape {mask.shape}, expected {(height, width)}")
+
+        entry = {"width": width, "height": height, "channels": planes.shape[0]}
+        entry["image"] = self._write(planes)
+        entry["mask"] = self._write(np.packbits(mask.reshape(-1), bitorder="little"))
+        entry["has_text"] = bool(mask.any())
+        entry["depth"] = None
+        if invdepthmap is not None:
+            entry["depth"] = self._write(invdepthmap.astype(np.float16))
+        entry["sources"] = {"image": _mtime(image_path), "mask": _mtime(mask_path), "depth": _mtime(depth_path)}
+        self.entries[image_name] = entry
+
+    def close(self):
+        index = json.dumps({"metadata": self.metadata, "entries": self.entries}).encode("utf-8")
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(_MAGIC, IMAGE_PACK_VERSION, self._offset, len(index)))
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+class ImagePack:
+    """
+    Read side of ImagePackWriter. Views are returned as zero-copy slices of a
+    read-only memmap of the whole file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, index_offset, index_size = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not an image pack")
+            if version != IMAGE_PACK_VERSION:
+                raise ValueError(f"Image pack {path} has version {version}, expected {IMAGE_PACK_VERSION}. Please re-run pack_images.py")
+            f.seek(index_offset)
+            index = json.loads(f.read(index_size).decode("utf-8"))
+        self.metadata = index["metadata"]
+        self.entries = index["entries"]
+        self._data = np.memmap(path, dtype=np.uint8, mode="r", shape=(index_offset,))
+
+    def is_valid(self, image_name, resolution, image_path, mask_path, depth_path):
+        """Whether the pack holds `image_name` at `resolution` and its source files are unchanged."""
+        entry = self.entries.get(image_name)
+        if entry is None or (entry["width"], entry["height"]) != tuple(resolution):
+            return False
+        sources = entry["sources"]
+        return (sources["image"] == _mtime(image_path) and sources["mask"] == _mtime(mask_path)
+                and sources["depth"] == _mtime(depth_path))
+
+    def has_text(self, image_name):
+        return self.entries[image_name]["has_text"]
+
+    def text_coverage(self, image_name):
+        """Fraction of the pixels of `image_name` covered by its text mask."""
+        entry = self.entries[image_name]
+        num_pixels = entry["width"] * entry["height"]
+        if not entry["has_text"]:
+            return 0.0
+        return count_mask_pixels(self._data[entry["mask"]:entry["mask"] + (num_pixels + 7) // 8]) / num_pixels
+
+    def get(self, image_name):
+        """uint8 (C, H, W) image planes, boolean (H, W) mask and float16 (H, W) inverse depth (or None)."""
+        entry = self.entries[image_name]
+        width, height, channels = entry["width"], entry["height"], entry["channels"]
+        num_pixels = width * height
+
+        image = self._data[entry["image"]:entry["image"] + channels * num_pixels].reshape(channels, height, width)
+        packed_mask = self._data[entry["mask"]:entry["mask"] + (num_pixels + 7) // 8]
+        mask = np.unpackbits(packed_mask, count=num_pixels, bitorder="little").view(bool).reshape(height, width)
+        invdepthmap = None
+        if entry["depth"] is not None:
+            invdepthmap = self._data[entry["depth"]:entry["depth"] + 2 * num_pixels].view(np.float16).reshape(height, width)
+        return image, mask, invdepthmap
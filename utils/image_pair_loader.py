@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import torch
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+def read_image(path):
+    """(C, H, W) uint8 tensor of the image at `path`, channels as stored (PIL mode order)."""
+    with Image.open(path) as image:
+        array = np.array(image)
+    if array.ndim == 2:
+        array = array[:, :, None]
+    return torch.from_numpy(array).permute(2, 0, 1)
+
+class ImagePairLoader:
+    """
+    Streams the render/ground truth pairs of `renders_dir` and `gt_dir`, and
+    their text masks in `masks_dir` if given, in batches of up to
+    `batch_size` same-sized pairs.
+
+    Images are decoded on a thread pool and stacked into (pinned, when CUDA is
+    available) uint8 host buffers; at most `max_in_flight` batches are decoded
+    ahead of the one being consumed, so host and device memory stay bounded
+    whatever the size of the test set. Yields (renders, gts, masks, names)
+    with renders and gts (N, 3, H, W) float in [0, 1] and masks (N, 1, H, W)
+    uint8 (None without `masks_dir`, empty where a mask does not match its
+    render's size) on `device`, in the order of `names` (os.listdir of
+    `renders_dir` by default).
+    """
+
+    def __init__(self, renders_dir, gt_dir, masks_dir=None, names=None, batch_size=8, num_workers=4, max_in_flight=2, device=None):
+        self.renders_dir = renders_dir
+        self.gt_dir = gt_dir
+        self.masks_dir = masks_dir
+        self.names = list(names) if names is not None else os.listdir(renders_dir)
+        self.batch_size = max(1, batch_size)
+        self.num_workers = max(1, num_workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.device = torch.device(device if device is not None else "cuda" if torch.cuda.is_available() else "cpu")
+        self.pin_memory = self.device.type == "cuda"
+
+    def __len__(self):
+        return len(self.names)
+
+    def _read_pair(self, name):
+        render = read_image(os.path.join(self.renders_dir, name))[:3]
+        gt = read_image(os.path.join(self.gt_dir, name))[:3]
+        if gt.shape[1:] != render.shape[1:]:
+            raise ValueError("Render and ground truth of {} differ in size: {} vs {}".format(name, tuple(render.shape[1:]), tuple(gt.shape[1:])))
+        mask = None
+        if self.masks_dir is not None:
+            mask = read_image(os.path.join(self.masks_dir, name))[:1]
+            if mask.shape[1:] != render.shape[1:]:
+                # an empty mask leaves the text metrics of this view undefined instead of failing the others
+                print("[ WARNING ] Mask of {} is {}, not {} like the render, skipping its text metrics".format(
+                    name, tuple(mask.shape[1:]), tuple(render.shape[1:])))
+                mask = torch.zeros((1,) + tuple(render.shape[1:]), dtype=torch.uint8)
+        return render, gt, mask
+
+    def _stack(self, names, futures):
+        # split into runs of same-sized pairs, each stacked into one host buffer
+        runs = []
+        for name, future in zip(names, futures):
+            render, gt, mask = future.result()
+            if not runs or runs[-1][1][0].shape != render.shape:
+                runs.append(([], [], [], []))
+            runs[-1][0].append(name)
+            runs[-1][1].append(render)
+            runs[-1][2].append(gt)
+            runs[-1][3].append(mask)
+        batches = []
+        for run_names, renders, gts, masks in runs:
+            buffer = torch.empty((2, len(run_names)) + tuple(renders[0].shape), dtype=torch.uint8, pin_memory=self.pin_memory)
+            torch.stack(renders, out=buffer[0])
+            torch.stack(gts, out=buffer[1])
+            mask_buffer = None
+            if self.masks_dir is not None:
+                mask_buffer = torch.empty((len(run_names),) + tuple(masks[0].shape), dtype=torch.uint8, pin_memory=self.pin_memory)
+                torch.stack(masks, out=mask_buffer)
+            batches.append((run_names, buffer, mask_buffer))
+        return batches
+
+    def __iter__(self):
+        batches = iter([self.names[start:start + self.batch_size] for start in range(0, len(self.names), self.batch_size)])
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.num_workers + 1, thread_name_prefix="image_pair_loader") as executor:
+            def submit():
+                names = next(batches, None)
+                if names is not None:
+                    # pairs are submitted before the batch that stacks them, which then never waits on queued work
+                    futures = [executor.submit(self._read_pair, name) for name in names]
+                    pending.append(executor.submit(self._stack, names, futures))
+
+            try:
+                for _ in range(self.max_in_flight):
+                    submit()
+                while pending:
+                    stacked = pending.popleft().result()
+                    submit()
+                    for names, buffer, mask_buffer in stacked:
+                        images = buffer.to(self.device, non_blocking=True).float() / 255.0
+                        masks = mask_buffer.to(self.device, non_blocking=True) if mask_buffer is not None else None
+                        yield images[0], images[1], masks, names
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -53,13 +53,16 @@ def create_window(window_size, channel):
     window = Variable(_2D_window.expand(channel, 1, window_size, window_size).contiguous())
     return window
 
+# windows of ssim, built once per size, channel count, device and dtype
+_windows = {}
+
 def ssim(img1, img2, window_size=11, size_average=True):
     channel = img1.size(-3)
-    window = create_window(window_size, channel)
-
-    if img1.is_cuda:
-        window = window.cuda(img1.get_device())
-    window = window.type_as(img1)
+    key = (window_size, channel, img1.device, img1.dtype)
+    window = _windows.get(key)
+    if window is None:
+        window = create_window(window_size, channel).to(img1.device).type_as(img1)
+        _windows[key] = window
 
     return _ssim(img1, img2, window, window_size, channel, size_average)
 
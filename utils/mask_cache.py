@@ -0,0 +1,209 @@
+import os
+import json
+import atexit
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+MASK_CACHE_FILE = "mask_cache.bin"
+MASK_CACHE_VERSION = 1
+
+_MAGIC = b"STRMASK\0"
+# magic, version, index offset, index size
+_HEADER = struct.Struct("<8sIQQ")
+
+_caches = {}
+
+# number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def count_mask_pixels(packed):
+    """Number of set pixels of a bit-packed mask, without unpacking it."""
+    return int(_POPCOUNT[np.asarray(packed)].sum(dtype=np.int64))
+
+def decode_mask(mask_path, resolution):
+    """Decode a mask PNG, resize it to `resolution` (width, height) and binarize it at 127."""
+    mask = Image.open(mask_path).convert("L")
+    if resolution is not None and mask.size != tuple(resolution):
+        mask = mask.resize(tuple(resolution), Image.NEAREST)
+    return np.array(mask) > 127
+
+class MaskCache:
+    """
+    Persistent cache of decoded, resized and binarized text masks.
+
+    Masks are stored bit-packed (1 bit per pixel, row-major, little bit order)
+    in a single file that is memory-mapped when opened. Entries are keyed by
+    (mask path, resolution) and invalidated when the mask's mtime changes.
+    Unpacked masks are additionally kept in an LRU bounded by `ram_budget_mb`.
+    """
+
+    def __init__(self, cache_path, ram_budget_mb=256):
+        self.cache_path = cache_path
+        self.cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        self.ram_budget = ram_budget_mb * 2**20
+        self._lru = OrderedDict()
+        self._lru_bytes = 0
+        self._pending = {}
+        self._entries = {}
+        self._data = None
+        self._garbage = 0
+        self._lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        self._entries = {}
+        self._data = None
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                magic, version, index_offset, index_size = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or version != MASK_CACHE_VERSION:
+                    print(f"[ WARNING ] Ignoring mask cache with unknown format: {self.cache_path}")
+                    return
+                f.seek(index_offset)
+                index = json.loads(f.read(index_size).decode("utf-8"))
+        except (OSError, ValueError, struct.error) as e:
+            print(f"[ WARNING ] Could not read mask cache {self.cache_path}: {e}")
+            return
+        self._entries = index["entries"]
+        self._garbage = index.get("garbage", 0)
+        if index_offset > _HEADER.size:
+            self._data = np.memmap(self.cache_path, dtype=np.uint8, mode="r", shape=(index_offset,))
+
+    def _key(self, mask_path, resolution):
+        return "{}|{}x{}".format(os.path.relpath(os.path.abspath(mask_path), self.cache_dir), *resolution)
+
+    def _stat(self, mask_path, resolution):
+        try:
+            mtime = os.stat(mask_path).st_mtime_ns
+        except FileNotFoundError:
+            return None, None
+        return self._key(mask_path, resolution), mtime
+
+    def _packed(self, key, mtime, mask_path, resolution):
+        if key in self._pending and self._pending[key][0] == mtime:
+            return self._pending[key][1]
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == mtime and self._data is not None:
+            _, offset, size = entry
+            return self._data[offset:offset + size]
+
+        packed = np.packbits(decode_mask(mask_path, resolution).reshape(-1), bitorder="little")
+        self._pending[key] = (mtime, packed)
+        return packed
+
+    def get_packed(self, mask_path, resolution):
+        """
+        Bit-packed mask at `resolution` (width, height), decoding and caching it on a miss.
+        Returns None if the mask file does not exist.
+        """
+        key, mtime = self._stat(mask_path, resolution)
+        if key is None:
+            return None
+        with self._lock:
+            return self._packed(key, mtime, mask_path, resolution)
+
+    def get(self, mask_path, resolution):
+        """Boolean (height, width) mask at `resolution`, or None if the mask file does not exist."""
+        key, mtime = self._stat(mask_path, resolution)
+        if key is None:
+            return None
+        with self._lock:
+            return self._get(key, mtime, mask_path, resolution)
+
+    def _get(self, key, mtime, mask_path, resolution):
+        cached = self._lru.pop(key, None)
+        if cached is not None:
+            self._lru_bytes -= cached[1].nbytes
+            if cached[0] != mtime:
+                cached = None
+
+        if cached is None:
+            width, height = resolution
+            packed = self._packed(key, mtime, mask_path, resolution)
+            mask = np.unpackbits(packed, count=width * height, bitorder="little").view(bool).reshape(height, width)
+            cached = (mtime, mask)
+
+        self._lru[key] = cached
+        self._lru_bytes += cached[1].nbytes
+        while self._lru_bytes > self.ram_budget and len(self._lru) > 1:
+            _, (_, evicted) = self._lru.popitem(last=False)
+            self._lru_bytes -= evicted.nbytes
+        return cached[1]
+
+    def flush(self):
+        """Append newly decoded masks to the cache file, compacting it when it holds too many stale entries."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        try:
+            entries = dict(self._entries)
+            garbage = self._garbage
+            for key in self._pending:
+                if key in entries:
+                    garbage += entries[key][2]
+            if self._data is not None and garbage * 2 > self._data.shape[0]:
+                self._rewrite()
+            else:
+                self._append(entries, garbage)
+        except OSError as e:
+            print(f"[ WARNING ] Could not write mask cache {self.cache_path}: {e}")
+            return
+        self._pending = {}
+        self._open()
+
+    def _append(self, entries, garbage):
+        mode = "r+b" if self._data is not None else "wb"
+        with open(self.cache_path, mode) as f:
+            if self._data is not None:
+                offset = self._data.shape[0]
+            else:
+                offset = _HEADER.size
+                f.write(b"\0" * _HEADER.size)
+            f.seek(offset)
+            for key, (mtime, packed) in self._pending.items():
+                f.write(packed.tobytes())
+                entries[key] = [mtime, offset, packed.shape[0]]
+                offset += packed.shape[0]
+            self._write_index(f, offset, entries, garbage)
+
+    def _rewrite(self):
+        live = {key: (mtime, self._data[offset:offset + size]) for key, (mtime, offset, size) in self._entries.items()
+                if key not in self._pending}
+        live.update(self._pending)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            offset = _HEADER.size
+            entries = {}
+            for key, (mtime, packed) in live.items():
+                f.write(np.asarray(packed).tobytes())
+                entries[key] = [mtime, offset, packed.shape[0]]
+                offset += packed.shape[0]
+            self._write_index(f, offset, entries, 0)
+        self._data = None
+        os.replace(tmp_path, self.cache_path)
+
+    def _write_index(self, f, index_offset, entries, garbage):
+        index = json.dumps({"entries": entries, "garbage": garbage}).encode("utf-8")
+        f.seek(index_offset)
+        f.write(index)
+        f.truncate()
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, MASK_CACHE_VERSION, index_offset, len(index)))
+
+def get_mask_cache(cache_dir):
+    """Return the MaskCache stored under `cache_dir` (usually the scene source path), opening it on first use."""
+    cache_path = os.path.join(os.path.abspath(cache_dir), MASK_CACHE_FILE)
+    if cache_path not in _caches:
+        cache = MaskCache(cache_path)
+        atexit.register(cache.flush)
+        _caches[cache_path] = cache
+    return _caches[cache_path]
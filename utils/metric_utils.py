@@ -0,0 +1,66 @@
+import torch
+import torch.nn.functional as F
+
+_FILTERS = {}
+
+def gaussian_filters(window_size=11, sigma=1.5, channels=1, device="cpu", dtype=torch.float32):
+    """
+    Horizontal (C, 1, 1, K) and vertical (C, 1, K, 1) depthwise weights of a
+    normalized 1D Gaussian, cached per size, channel count, device and dtype.
+    """
+    key = (window_size, sigma, channels, torch.device(device), dtype)
+    filters = _FILTERS.get(key)
+    if filters is None:
+        x = torch.arange(window_size, dtype=torch.float64) - window_size // 2
+        kernel = torch.exp(-x ** 2 / (2 * sigma ** 2))
+        kernel = (kernel / kernel.sum()).to(device, dtype)
+        filters = (kernel.view(1, 1, 1, -1).repeat(channels, 1, 1, 1), kernel.view(1, 1, -1, 1).repeat(channels, 1, 1, 1))
+        _FILTERS[key] = filters
+    return filters
+
+def gaussian_blur(x, window_size=11, sigma=1.5):
+    """Zero padded Gaussian filter of every channel of (N, C, H, W) `x`, as two 1D passes."""
+    channels = x.shape[1]
+    horizontal, vertical = gaussian_filters(window_size, sigma, channels, x.device, x.dtype)
+    x = F.conv2d(x, horizontal, padding=(0, window_size // 2), groups=channels)
+    return F.conv2d(x, vertical, padding=(window_size // 2, 0), groups=channels)
+
+def image_metrics(images, gts, masks=None, window_size=11):
+    """
+    Per-image L1, MSE, PSNR and SSIM of (N, C, H, W) `images` against `gts`,
+    as a dict of (N,) tensors. The five SSIM statistics are filtered in a
+    single pass; the result is differentiable.
+
+    With `masks` ((N, 1, H, W) text masks, text where > 127 as in render.py,
+    or bool), also the same metrics over text pixels only (`l1_text`,
+    `mse_text`, `psnr_text`, `ssim_text`, NaN for images without text) and
+    the `text_fraction` of pixels.
+    """
+    channels = images.shape[1]
+    diff = images - gts
+    stats = gaussian_blur(torch.cat((images, gts, images * images, gts * gts, images * gts), dim=1), window_size)
+    mu1, mu2, mu11, mu22, mu12 = stats.split(channels, dim=1)
+    mu1_sq, mu2_sq, mu1_mu2 = mu1 * mu1, mu2 * mu2, mu1 * mu2
+    C1, C2 = 0.01 ** 2, 0.03 ** 2
+    ssim_map = ((2 * mu1_mu2 + C1) * (2 * (mu12 - mu1_mu2) + C2)) / ((mu1_sq + mu2_sq + C1) * (mu11 - mu1_sq + mu22 - mu2_sq + C2))
+
+    l1_map, se_map = diff.abs().flatten(1), (diff * diff).flatten(1)
+    metrics = {"l1": l1_map.mean(1), "mse": se_map.mean(1), "ssim": ssim_map.flatten(1).mean(1)}
+    metrics["psnr"] = 20 * torch.log10(1.0 / torch.sqrt(metrics["mse"]))
+    if masks is not None:
+        text = masks if masks.dtype == torch.bool else masks > 127
+        text = text.expand_as(diff).flatten(1).to(diff.dtype)
+        count = text.sum(1)
+        masked_mean = lambda values: (values * text).sum(1) / count
+        metrics["l1_text"] = masked_mean(l1_map)
+        metrics["mse_text"] = masked_mean(se_map)
+        metrics["ssim_text"] = masked_mean(ssim_map.flatten(1))
+        metrics["psnr_text"] = 20 * torch.log10(1.0 / torch.sqrt(metrics["mse_text"]))
+        metrics["text_fraction"] = count / text.shape[1]
+    return metrics
+
+def metric_records(metrics):
+    """The per-image dicts of floats of `image_metrics` output, with a single device to host copy."""
+    keys = list(metrics)
+    rows = torch.stack([metrics[key].detach().float() for key in keys], dim=1).cpu().tolist()
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,99 @@
+import os
+import numpy as np
+from utils.system_utils import atomic_write_path
+
+# numpy type codes to the PLY property type names plyfile writes
+_PLY_TYPES = {
+    "i1": "char", "u1": "uchar", "i2": "short", "u2": "ushort",
+    "i4": "int", "u4": "uint", "f4": "float", "f8": "double",
+}
+
+def ply_header(element, count, dtype):
+    lines = ["ply", "format binary_little_endian 1.0", "element {} {}".format(element, count)]
+    for name, type_code in dtype:
+        lines.append("property {} {}".format(_PLY_TYPES[type_code], name))
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+def write_ply(path, attributes, dtype, element="vertex"):
+    """
+    Write a binary little endian PLY holding a single element, byte-identical to
+    PlyData([PlyElement.describe(elements, element)]).write(path).
+
+    `attributes` is an (N, F) array (or a list of (N, k) arrays) whose columns
+    follow `dtype`, a list of (name, numpy type code) pairs. When all properties
+    share one type the matrix is written as is; otherwise every column is copied
+    once into a structured array. No per-row Python objects are created. The
+    file is written to a temporary path and renamed over `path` when complete.
+    """
+    if isinstance(attributes, (list, tuple)):
+        attributes = np.concatenate(attributes, axis=1)
+    if attributes.ndim != 2 or attributes.shape[1] != len(dtype):
+        raise ValueError("Expected attributes of shape (N, {}), got {}".format(len(dtype), attributes.shape))
+
+    type_codes = {type_code for _, type_code in dtype}
+    if len(type_codes) == 1:
+        body = np.ascontiguousarray(attributes, dtype="<" + type_codes.pop())
+    else:
+        body = np.empty(attributes.shape[0], dtype=[(name, "<" + type_code) for name, type_code in dtype])
+        for i, (name, _) in enumerate(dtype):
+            body[name] = attributes[:, i]
+
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with atomic_write_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(ply_header(element, attributes.shape[0], dtype))
+        body.tofile(f)
+
+def read_ply_header(path):
+    """Name, count and (name, numpy type code) properties of the first element, the format and the header size in bytes."""
+    type_codes = {ply_type: type_code for type_code, ply_type in _PLY_TYPES.items()}
+    type_codes.update({"int8": "i1", "uint8": "u1", "int16": "i2", "uint16": "u2",
+                       "int32": "i4", "uint32": "u4", "float32": "f4", "float64": "f8"})
+    elements = []
+    ply_format = None
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a PLY file")
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"Unterminated PLY header in {path}")
+            tokens = line.decode("ascii").split()
+            if not tokens:
+                continue
+            if tokens[0] == "end_header":
+                break
+            if tokens[0] == "format":
+                ply_format = tokens[1]
+            elif tokens[0] == "element":
+                elements.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == "property":
+                # list properties have no fixed type code
+                type_code = None if tokens[1] == "list" else type_codes.get(tokens[1])
+                elements[-1][2].append((tokens[-1], type_code))
+        header_size = f.tell()
+    element, count, properties = elements[0]
+    return element, count, properties, ply_format, header_size
+
+def read_ply_matrix(path):
+    """
+    Properties of the first element of a PLY as an (N, F) float32 matrix, and their names.
+
+    Binary little endian files whose properties are all float32 (as written by
+    save_ply) are memory-mapped and reinterpreted in place, without per-property
+    copies. Anything else goes through plyfile.
+    """
+    element, count, properties, ply_format, header_size = read_ply_header(path)
+    names = [name for name, _ in properties]
+    if count == 0:
+        return np.zeros((0, len(properties)), dtype=np.float32), names
+    if ply_format == "binary_little_endian" and all(type_code == "f4" for _, type_code in properties):
+        # copy-on-write so the mapping can back writable tensors without touching the file
+        matrix = np.memmap(path, dtype="<f4", mode="c", offset=header_size, shape=(count, len(properties)))
+        return matrix, names
+
+    from plyfile import PlyData
+    vertices = PlyData.read(path).elements[0]
+    return np.stack([np.asarray(vertices[name], dtype=np.float32) for name in names], axis=1), names
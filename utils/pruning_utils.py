@@ -0,0 +1,53 @@
+import time
+import torch
+from tqdm import tqdm
+from gaussian_renderer import render
+
+def accumulate_contributions(views, gaussians, pipe, background, use_trained_exp=False, view_stride=1):
+    """
+    Largest blending weight (alpha times transmittance) of every Gaussian over
+    all pixels of every `view_stride`-th view of `views`. The views are
+    rendered with the PyTorch reference rasterizer, much slower than the CUDA one.
+    """
+    contribution = torch.zeros(gaussians.get_xyz.shape[0], device=gaussians.get_xyz.device)
+    with torch.no_grad():
+        for view in tqdm(views[::max(1, view_stride)], desc="Accumulating contributions"):
+            view_contribution = render(view, gaussians, pipe, background, use_trained_exp=use_trained_exp, track_contribution=True)["contribution"]
+            torch.maximum(contribution, view_contribution, out=contribution)
+    return contribution
+
+def prune_target(gaussians, target_count=0, budget_mb=0.0):
+    """Number of Gaussians to keep: `target_count`, capped by what fits a save_ply file of `budget_mb`. None if neither is set."""
+    targets = []
+    if target_count > 0:
+        targets.append(target_count)
+    if budget_mb > 0:
+        bytes_per_point = 4 * len(gaussians.construct_list_of_attributes())
+        targets.append(int(budget_mb * 2**20) // bytes_per_point)
+    return min(targets) if targets else None
+
+def contribution_prune_mask(contribution, target_count, protected=None):
+    """
+    Mask of the lowest contribution Gaussians to remove so that `target_count`
+    remain. Gaussians in `protected` are never removed, so more may remain.
+    """
+    mask = torch.zeros_like(contribution, dtype=torch.bool)
+    excess = contribution.shape[0] - target_count
+    if excess <= 0:
+        return mask
+    if protected is not None:
+        contribution = torch.where(protected, torch.inf, contribution)
+        excess = min(excess, contribution.shape[0] - int(protected.sum()))
+    mask[torch.argsort(contribution)[:excess]] = True
+    return mask
+
+def prune_low_contribution(gaussians, views, pipe, background, target_count, use_trained_exp=False, view_stride=1):
+    """Render every `view_stride`-th view, then prune the non-text Gaussians that contribute least until `target_count` remain."""
+    start = time.perf_counter()
+    contribution = accumulate_contributions(views, gaussians, pipe, background, use_trained_exp, view_stride)
+    mask = contribution_prune_mask(contribution, target_count, gaussians.text_points_mask)
+    num_points = contribution.shape[0]
+    gaussians.prune_points(mask)
+    print("Pruned {} of {} Gaussians by contribution over {} views in {:.1f}s".format(
+        num_points - gaussians.get_xyz.shape[0], num_points, len(views[::max(1, view_stride)]), time.perf_counter() - start))
+    return mask
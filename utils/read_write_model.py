@@ -49,6 +49,25 @@ Point3D = collections.namedtuple(
 )
 
 
+Points3DColumns = collections.namedtuple(
+    "Points3DColumns",
+    ["ids", "xyz", "rgb", "error", "track_offsets", "image_ids", "point2D_idxs"],
+)
+ImagesColumns = collections.namedtuple(
+    "ImagesColumns",
+    [
+        "ids",
+        "qvecs",
+        "tvecs",
+        "camera_ids",
+        "names",
+        "points2D_offsets",
+        "xys",
+        "point3D_ids",
+    ],
+)
+
+
 class Image(BaseImage):
     def qvec2rotmat(self):
         return qvec2rotmat(self.qvec)
@@ -74,6 +93,27 @@ CAMERA_MODEL_NAMES = dict(
     [(camera_model.model_name, camera_model) for camera_model in CAMERA_MODELS]
 )
 
+# Fixed-size parts of the binary records, see read_*_binary_columnar.
+POINT3D_HEADER_DTYPE = np.dtype(
+    [
+        ("id", "<u8"),
+        ("xyz", "<f8", (3,)),
+        ("rgb", "u1", (3,)),
+        ("error", "<f8"),
+        ("track_length", "<u8"),
+    ]
+)
+TRACK_ELEM_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+IMAGE_HEADER_DTYPE = np.dtype(
+    [
+        ("id", "<i4"),
+        ("qvec", "<f8", (4,)),
+        ("tvec", "<f8", (3,)),
+        ("camera_id", "<i4"),
+    ]
+)
+POINT2D_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+
 
 def read_next_bytes(fid, num_bytes, format_char_sequence, endian_character="<"):
     """Read and unpack the next bytes from a binary file.
@@ -244,52 +284,81 @@ def read_images_text(path):
     return images
 
 
-def read_images_binary(path_to_model_file):
+def read_images_binary_columnar(path_to_model_file):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
+
+    Reads the whole file at once and returns an ImagesColumns tuple. The 2D
+    observations of all images are concatenated in CSR layout: the xys and
+    point3D_ids of the i-th image are
+    xys[points2D_offsets[i]:points2D_offsets[i + 1]].
     """
-    images = {}
     with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi"
-            )
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            image_name = ""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":  # look for the ASCII 0 entry
-                image_name += current_char.decode("utf-8")
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            num_points2D = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            x_y_id_s = read_next_bytes(
-                fid,
-                num_bytes=24 * num_points2D,
-                format_char_sequence="ddq" * num_points2D,
-            )
-            xys = np.column_stack(
-                [
-                    tuple(map(float, x_y_id_s[0::3])),
-                    tuple(map(float, x_y_id_s[1::3])),
-                ]
-            )
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id,
-                qvec=qvec,
-                tvec=tvec,
-                camera_id=camera_id,
-                name=image_name,
-                xys=xys,
-                point3D_ids=point3D_ids,
+        data = fid.read()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+
+    num_reg_images = struct.unpack_from("<Q", data, 0)[0]
+    headers = np.empty(num_reg_images, dtype=IMAGE_HEADER_DTYPE)
+    names = []
+    points2D = []
+    points2D_offsets = np.zeros(num_reg_images + 1, dtype=np.int64)
+    pos = 8
+    for i in range(num_reg_images):
+        headers[i] = np.frombuffer(
+            buffer, dtype=IMAGE_HEADER_DTYPE, count=1, offset=pos
+        )[0]
+        pos += IMAGE_HEADER_DTYPE.itemsize
+        name_end = data.index(b"\x00", pos)  # look for the ASCII 0 entry
+        names.append(data[pos:name_end].decode("utf-8"))
+        pos = name_end + 1
+        num_points2D = struct.unpack_from("<Q", data, pos)[0]
+        pos += 8
+        points2D.append(
+            np.frombuffer(
+                buffer, dtype=POINT2D_DTYPE, count=num_points2D, offset=pos
             )
+        )
+        pos += POINT2D_DTYPE.itemsize * num_points2D
+        points2D_offsets[i + 1] = points2D_offsets[i] + num_points2D
+
+    if points2D:
+        points2D = np.concatenate(points2D)
+    else:
+        points2D = np.empty(0, dtype=POINT2D_DTYPE)
+
+    return ImagesColumns(
+        ids=headers["id"].astype(np.int64),
+        qvecs=np.ascontiguousarray(headers["qvec"]),
+        tvecs=np.ascontiguousarray(headers["tvec"]),
+        camera_ids=headers["camera_id"].astype(np.int64),
+        names=names,
+        points2D_offsets=points2D_offsets,
+        xys=np.ascontiguousarray(points2D["xy"]),
+        point3D_ids=np.ascontiguousarray(points2D["point3D_id"]),
+    )
+
+
+def read_images_binary(path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    columns = read_images_binary_columnar(path_to_model_file)
+    offsets = columns.points2D_offsets
+    images = {}
+    for i, image_id in enumerate(columns.ids.tolist()):
+        images[image_id] = Image(
+            id=image_id,
+            qvec=columns.qvecs[i],
+            tvec=columns.tvecs[i],
+            camera_id=int(columns.camera_ids[i]),
+            name=columns.names[i],
+            xys=columns.xys[offsets[i] : offsets[i + 1]],
+            point3D_ids=columns.point3D_ids[offsets[i] : offsets[i + 1]],
+        )
     return images
 
 
@@ -386,41 +455,78 @@ def read_points3D_text(path):
     return points3D
 
 
+def read_points3D_binary_columnar(path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+
+    Reads the whole file at once and returns a Points3DColumns tuple of flat
+    arrays. Tracks are concatenated in CSR layout: the track of the i-th point
+    is image_ids[track_offsets[i]:track_offsets[i + 1]] (and the same slice of
+    point2D_idxs).
+    """
+    buffer = np.fromfile(path_to_model_file, dtype=np.uint8)
+    num_points = int(buffer[:8].view("<u8")[0]) if buffer.size else 0
+    header_size = POINT3D_HEADER_DTYPE.itemsize
+
+    # Records are variable sized, so the only sequential work is walking the
+    # track lengths to find where each record starts.
+    record_starts = [0] * num_points
+    unpack_track_length = struct.Struct("<Q").unpack_from
+    pos = 8
+    for i in range(num_points):
+        record_starts[i] = pos
+        pos += header_size + 8 * unpack_track_length(buffer, pos + 43)[0]
+    record_starts = np.asarray(record_starts, dtype=np.int64)
+
+    # Split the body into header bytes and track bytes in one vectorized pass.
+    boundaries = np.zeros(buffer.size + 1, dtype=np.int8)
+    boundaries[record_starts] += 1
+    boundaries[record_starts + header_size] -= 1
+    is_header = np.cumsum(boundaries[:-1], dtype=np.int8).view(bool)
+    is_header[:8] = False
+    is_track = ~is_header
+    is_track[:8] = False
+
+    headers = buffer[is_header].view(POINT3D_HEADER_DTYPE)
+    track = buffer[is_track].view(TRACK_ELEM_DTYPE)
+
+    track_offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(headers["track_length"], out=track_offsets[1:])
+
+    return Points3DColumns(
+        ids=headers["id"].astype(np.int64),
+        xyz=np.ascontiguousarray(headers["xyz"]),
+        rgb=np.ascontiguousarray(headers["rgb"]),
+        error=np.ascontiguousarray(headers["error"]),
+        track_offsets=track_offsets,
+        image_ids=np.ascontiguousarray(track["image_id"]),
+        point2D_idxs=np.ascontiguousarray(track["point2D_idx"]),
+    )
+
+
 def read_points3D_binary(path_to_model_file):
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
+    columns = read_points3D_binary_columnar(path_to_model_file)
+    split_at = columns.track_offsets[1:-1]
+    image_ids = np.split(columns.image_ids.astype(np.int64), split_at)
+    point2D_idxs = np.split(columns.point2D_idxs.astype(np.int64), split_at)
+    rgb = columns.rgb.astype(np.int64)
     points3D = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd"
-            )
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            track_elems = read_next_bytes(
-                fid,
-                num_bytes=8 * track_length,
-                format_char_sequence="ii" * track_length,
-            )
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id,
-                xyz=xyz,
-                rgb=rgb,
-                error=error,
-                image_ids=image_ids,
-                point2D_idxs=point2D_idxs,
-            )
+    for i, point3D_id in enumerate(columns.ids.tolist()):
+        points3D[point3D_id] = Point3D(
+            id=point3D_id,
+            xyz=columns.xyz[i],
+            rgb=rgb[i],
+            error=columns.error[i],
+            image_ids=image_ids[i],
+            point2D_idxs=point2D_idxs[i],
+        )
     return points3D
 
 
@@ -0,0 +1,116 @@
+from collections import deque
+from random import randint, choices, shuffle
+import numpy as np
+
+
+class ViewpointSampler:
+    """
+    Random training view order: every epoch visits each camera once, in random order.
+
+    Draws the same sequence as popping random entries off a copy of the camera
+    list, but can look ahead with `peek` so upcoming views can be prefetched.
+    With `require_text` views without text are drawn but skipped.
+    """
+
+    def __init__(self, cameras, require_text=False):
+        self.cameras = cameras
+        self.require_text = require_text
+        self._stack = []
+        self._upcoming = deque()
+
+    def _eligible(self, index):
+        return not self.require_text or self.cameras[index].has_text
+
+    def _draw(self):
+        if not self._stack:
+            self._stack = list(range(len(self.cameras)))
+        return self._stack.pop(randint(0, len(self._stack) - 1))
+
+    def next(self):
+        """Index and camera of the next training view."""
+        while True:
+            index = self._upcoming.popleft() if self._upcoming else self._draw()
+            if self._eligible(index):
+                return index, self.cameras[index]
+
+    def peek(self, count):
+        """The next `count` cameras, without consuming them."""
+        upcoming = [index for index in self._upcoming if self._eligible(index)]
+        while len(upcoming) < count:
+            index = self._draw()
+            self._upcoming.append(index)
+            if self._eligible(index):
+                upcoming.append(index)
+        return [self.cameras[index] for index in upcoming[:count]]
+
+    def update(self, index, loss):
+        """Report the training loss of view `index`."""
+        pass
+
+    def probabilities(self):
+        """Current probability of drawing each camera."""
+        eligible = np.array([self._eligible(index) for index in range(len(self.cameras))], dtype=np.float64)
+        return eligible / max(eligible.sum(), 1.0)
+
+class TextImportanceSampler(ViewpointSampler):
+    """
+    Samples views in proportion to their text coverage times their running loss.
+
+    Every epoch visits each eligible view once (the fairness floor) plus
+    len(views) * (1 - uniform_fraction) / uniform_fraction extra draws taken
+    with probability proportional to text coverage * loss, where the loss of a
+    view is an exponential moving average of the losses reported by `update`.
+    The epoch is drawn up front and shuffled, so `peek` still sees upcoming views.
+    """
+
+    def __init__(self, cameras, require_text=False, uniform_fraction=0.5, loss_decay=0.9):
+        super().__init__(cameras, require_text)
+        if not 0 < uniform_fraction <= 1:
+            raise ValueError(f"sampler_uniform_fraction must be in (0, 1], got {uniform_fraction}")
+        self.uniform_fraction = uniform_fraction
+        self.loss_decay = loss_decay
+        self.views = [index for index in range(len(cameras)) if self._eligible(index)]
+        self.coverage = np.array([cameras[index].text_coverage for index in self.views], dtype=np.float64)
+        self.loss = np.full(len(self.views), np.nan)
+        self._position = {index: i for i, index in enumerate(self.views)}
+        self.epoch = 0
+
+    def _weights(self):
+        """Importance weights of the eligible views, unseen views use the mean loss."""
+        seen = ~np.isnan(self.loss)
+        loss = np.where(seen, self.loss, self.loss[seen].mean() if seen.any() else 1.0)
+        weights = self.coverage * loss
+        if not weights.sum() > 0:
+            weights = np.ones(len(self.views))
+        return weights / weights.sum()
+
+    def _draw(self):
+        if not self._stack:
+            extra = int(round(len(self.views) * (1.0 - self.uniform_fraction) / self.uniform_fraction))
+            self._stack = self.views + choices(self.views, weights=self._weights(), k=extra)
+            shuffle(self._stack)
+            self.epoch += 1
+        return self._stack.pop()
+
+    def update(self, index, loss):
+        i = self._position.get(index)
+        if i is None:
+            return
+        if np.isnan(self.loss[i]):
+            self.loss[i] = loss
+        else:
+            self.loss[i] = self.loss_decay * self.loss[i] + (1.0 - self.loss_decay) * loss
+
+    def probabilities(self):
+        epoch_length = len(self.views) / self.uniform_fraction
+        probabilities = np.zeros(len(self.cameras))
+        probabilities[self.views] = (1.0 + self._weights() * (epoch_length - len(self.views))) / epoch_length
+        return probabilities
+
+def create_viewpoint_sampler(cameras, opt, require_text=False):
+    """The training view sampler selected by `opt.viewpoint_sampler` ("uniform" or "text_importance")."""
+    if opt.viewpoint_sampler == "uniform":
+        return ViewpointSampler(cameras, require_text)
+    if opt.viewpoint_sampler == "text_importance":
+        return TextImportanceSampler(cameras, require_text, opt.sampler_uniform_fraction, opt.sampler_loss_decay)
+    raise ValueError(f"Unknown viewpoint sampler: {opt.viewpoint_sampler}")
@@ -0,0 +1,100 @@
+import atexit
+import queue
+import threading
+import torch
+from torch import nn
+
+
+def snapshot_tensors(obj):
+    """Detached on-device copy of every tensor in a nested tuple / list / dict, Parameters stay Parameters."""
+    if isinstance(obj, nn.Parameter):
+        return nn.Parameter(obj.detach().clone(), requires_grad=obj.requires_grad)
+    if torch.is_tensor(obj):
+        return obj.detach().clone()
+    if isinstance(obj, dict):
+        return {key: snapshot_tensors(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_tensors(value) for value in obj)
+    return obj
+
+def tensors_to_host(obj):
+    if torch.is_tensor(obj):
+        return obj.cpu()
+    if isinstance(obj, dict):
+        return {key: tensors_to_host(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(tensors_to_host(value) for value in obj)
+    return obj
+
+class BackgroundSaver:
+    """
+    Writes model snapshots on a worker thread while training continues.
+
+    `submit(write_fn, snapshot)` takes a snapshot whose tensors are private
+    copies (see snapshot_tensors), so later optimizer steps cannot change what
+    is written. The worker waits for the copies to finish on the training stream,
+    moves them to the host on its own CUDA stream and calls write_fn. At most
+    `max_pending` snapshots are queued, `submit` blocks beyond that. With
+    asynchronous=False everything runs inline, as before.
+    """
+
+    def __init__(self, max_pending=2, asynchronous=True):
+        self.asynchronous = asynchronous
+        self._error = None
+        if not asynchronous:
+            return
+        self._stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._thread = threading.Thread(target=self._run, name="background_saver", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, write_fn, snapshot, to_host=True):
+        """Call write_fn(snapshot) in the background; snapshot tensors are moved to the host first if `to_host`."""
+        if not self.asynchronous:
+            write_fn(tensors_to_host(snapshot) if to_host else snapshot)
+            return
+        if self._thread is None:
+            raise RuntimeError("BackgroundSaver is closed")
+        event = None
+        if self._stream is not None:
+            event = torch.cuda.Event()
+            event.record()
+        self._queue.put((write_fn, snapshot, to_host, event))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                write_fn, snapshot, to_host, event = item
+                if self._stream is not None:
+                    with torch.cuda.stream(self._stream):
+                        self._stream.wait_event(event)
+                        if to_host:
+                            snapshot = tensors_to_host(snapshot)
+                        write_fn(snapshot)
+                else:
+                    write_fn(tensors_to_host(snapshot) if to_host else snapshot)
+            except Exception as e:
+                print(f"\n[ WARNING ] Background save failed: {e}")
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every submitted snapshot has been written."""
+        if self.asynchronous and self._thread is not None:
+            self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        if self.asynchronous and self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.flush()
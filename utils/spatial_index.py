@@ -0,0 +1,169 @@
+import torch
+
+
+def boxes_in_frustum(box_min, box_max, camera, margin=16):
+    """
+    Axis aligned boxes that may reach the image of `camera`: not entirely beyond
+    one of the side planes (widened by `margin` pixels) or in front of the
+    rasterizer's 0.2 near limit. There is no far plane, like in the rasterizer.
+    """
+    corners = torch.stack([torch.where(torch.tensor(bits, device=box_min.device).bool(), box_max, box_min)
+                           for bits in [(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)]], dim=1)
+    corners = torch.cat([corners, torch.ones_like(corners[..., :1])], dim=-1)
+    clip = corners @ camera.full_proj_transform
+    depth = (corners @ camera.world_view_transform)[..., 2]
+    x_limit = 1 + 2 * margin / camera.image_width
+    y_limit = 1 + 2 * margin / camera.image_height
+    w = clip[..., 3]
+    outside = torch.stack([(clip[..., 0] > x_limit * w).all(dim=1), (-clip[..., 0] > x_limit * w).all(dim=1),
+                           (clip[..., 1] > y_limit * w).all(dim=1), (-clip[..., 1] > y_limit * w).all(dim=1),
+                           (depth <= 0.2).all(dim=1)], dim=1)
+    return ~outside.any(dim=1)
+
+class GaussianSubset:
+    """
+    The Gaussians `indices` of a GaussianModel, exposing the attributes render() reads.
+
+    Only the raw parameters of the subset are gathered, activations are applied
+    afterwards, so the cost follows the subset size. Gradients flow back to the
+    model's parameters when autograd is enabled.
+    """
+
+    def __init__(self, pc, indices, gather=None):
+        gather = gather or (lambda name, tensor, index: tensor.index_select(0, index))
+        self.pc = pc
+        self.indices = indices
+        self.active_sh_degree = pc.active_sh_degree
+        self.max_sh_degree = pc.max_sh_degree
+        self._xyz = gather("xyz", pc._xyz, indices)
+        self._features_dc = gather("f_dc", pc.get_features_dc, indices)
+        self._features_rest = gather("f_rest", pc.get_features_rest, indices)
+        self._opacity = gather("opacity", pc._opacity, indices)
+        self._scaling = gather("scaling", pc._scaling, indices)
+        self._rotation = gather("rotation", pc._rotation, indices)
+
+    @property
+    def get_scaling(self):
+        return self.pc.scaling_activation(self._scaling)
+
+    @property
+    def get_rotation(self):
+        return self.pc.rotation_activation(self._rotation)
+
+    @property
+    def get_xyz(self):
+        return self._xyz
+
+    @property
+    def get_features(self):
+        return torch.cat((self._features_dc, self._features_rest), dim=1)
+
+    @property
+    def get_features_dc(self):
+        return self._features_dc
+
+    @property
+    def get_features_rest(self):
+        return self._features_rest
+
+    @property
+    def get_opacity(self):
+        return self.pc.opacity_activation(self._opacity)
+
+    def get_covariance(self, scaling_modifier = 1):
+        return self.pc.covariance_activation(self.get_scaling, scaling_modifier, self._rotation)
+
+    def get_exposure_from_name(self, image_name):
+        return self.pc.get_exposure_from_name(image_name)
+
+class GaussianGrid:
+    """
+    Uniform grid over the Gaussian means for frustum culling before rasterization.
+
+    Gaussians are sorted by grid cell, each cell (chunk) keeps the bounding box
+    of its Gaussians' 3 sigma extents. The grid is rebuilt lazily when the
+    positions or scales are replaced or change in number (densification,
+    pruning, loading); after in-place updates (optimizer steps) the Gaussians
+    keep their cells and only the cell boxes are refitted. A frozen model is
+    indexed once. Culled indices and gathered parameters are written into
+    buffers reused across calls.
+    """
+
+    def __init__(self, points_per_cell=4096):
+        self.points_per_cell = points_per_cell
+        self._key = None
+        self._versions = None
+        self._gather_buffers = {}
+        self._indices = None
+
+    @staticmethod
+    def _tensor_key(tensor):
+        return (tensor.data_ptr(), tuple(tensor.shape))
+
+    def update(self, pc):
+        """Rebuild the grid if Gaussians were added, removed or replaced, refit its boxes if they moved or were scaled."""
+        key = (self._tensor_key(pc._xyz), self._tensor_key(pc._scaling))
+        versions = (pc._xyz._version, pc._scaling._version)
+        if key == self._key and versions == self._versions:
+            return
+        with torch.no_grad():
+            xyz, radius = pc.get_xyz, 3 * pc.get_scaling.max(dim=1).values
+            if key == self._key:
+                self._fit_cells(xyz, radius)
+            else:
+                self._build(xyz, radius)
+        self._key, self._versions = key, versions
+
+    def _build(self, xyz, radius):
+        lower = xyz.min(dim=0).values
+        extent = (xyz.max(dim=0).values - lower).clamp_min(1e-6)
+        num_cells = max(1, xyz.shape[0] // self.points_per_cell)
+        cell_size = (extent.prod() / num_cells) ** (1.0 / 3.0)
+        dims = torch.ceil(extent / cell_size).long().clamp_min(1)
+        cell = torch.minimum(((xyz - lower) / cell_size).long(), dims - 1)
+        cell_id = (cell[:, 0] * dims[1] + cell[:, 1]) * dims[2] + cell[:, 2]
+
+        self.order = torch.argsort(cell_id)
+        _, cell_rank, counts = torch.unique_consecutive(cell_id[self.order], return_inverse=True, return_counts=True)
+        self.cell_of_sorted = cell_rank
+        self.num_cells = counts.shape[0]
+        self._fit_cells(xyz, radius)
+        self._indices = torch.empty(xyz.shape[0], dtype=torch.long, device=xyz.device).resize_(0)
+
+    def _fit_cells(self, xyz, radius):
+        # boxes of the Gaussians assigned to each cell, wherever they have moved since
+        sorted_xyz, sorted_radius = xyz[self.order], radius[self.order, None]
+        index = self.cell_of_sorted[:, None].expand(-1, 3)
+        self.cell_min = torch.full((self.num_cells, 3), float("inf"), device=xyz.device).scatter_reduce(0, index, sorted_xyz - sorted_radius, "amin")
+        self.cell_max = torch.full((self.num_cells, 3), float("-inf"), device=xyz.device).scatter_reduce(0, index, sorted_xyz + sorted_radius, "amax")
+
+    def visible_cells(self, camera, margin=16):
+        return boxes_in_frustum(self.cell_min, self.cell_max, camera, margin)
+
+    def cull(self, pc, camera):
+        """
+        Indices of the Gaussians in cells visible from `camera`. Without autograd
+        they are written to a buffer reused by the next call; while autograd
+        records, the backward pass keeps them, so they get their own tensor.
+        """
+        self.update(pc)
+        recording = torch.is_grad_enabled()
+        with torch.no_grad():
+            keep = self.visible_cells(camera)[self.cell_of_sorted]
+            if recording:
+                return self.order[keep]
+            # resizing to zero keeps the storage, masked_select only grows it when needed
+            return torch.masked_select(self.order, keep, out=self._indices.resize_(0))
+
+    def gather(self, name, tensor, indices):
+        """tensor[indices] into a buffer reused across calls; a differentiable gather while autograd records."""
+        if torch.is_grad_enabled() and tensor.requires_grad:
+            return tensor.index_select(0, indices)
+        buffer = self._gather_buffers.get(name)
+        if buffer is None or buffer.dtype != tensor.dtype or buffer.device != tensor.device:
+            buffer = self._gather_buffers[name] = torch.empty(0, dtype=tensor.dtype, device=tensor.device)
+        return torch.index_select(tensor.detach(), 0, indices, out=buffer.resize_(0))
+
+    def subset(self, pc, camera):
+        """The Gaussians of `pc` that survive frustum culling for `camera`, as a GaussianSubset."""
+        return GaussianSubset(pc, self.cull(pc, camera), self.gather)
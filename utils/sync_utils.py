@@ -0,0 +1,106 @@
+import warnings
+import torch
+
+
+class DeviceMetrics:
+    """
+    Ring buffer of per-iteration training scalars kept on the device.
+
+    `record` stores scalar tensors (or numbers) without waiting for them to be
+    computed. `drain` copies the ring to the host in a single transfer, the
+    only synchronization, and returns the rows recorded since the last drain.
+    Each slot owns a pair of timing events (see `timer`), read once drained.
+    """
+
+    def __init__(self, names, size, device="cuda"):
+        self.names = tuple(names)
+        self.size = max(1, size)
+        self.values = torch.zeros((self.size, len(self.names)), device=device)
+        self._rows = []
+        self._timers = None
+        if torch.cuda.is_available():
+            self._timers = [(torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)) for _ in range(self.size)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def full(self):
+        return len(self._rows) == self.size
+
+    def timer(self):
+        """(start, end) CUDA events for the iteration that will be recorded next, or None without CUDA."""
+        return self._timers[len(self._rows)] if self._timers is not None else None
+
+    def record(self, iteration, view_index, **values):
+        if self.full():
+            raise RuntimeError("DeviceMetrics is full, drain it first")
+        slot = len(self._rows)
+        for column, name in enumerate(self.names):
+            value = values[name]
+            if torch.is_tensor(value):
+                self.values[slot, column].copy_(value.detach())
+            else:
+                self.values[slot, column].fill_(value)
+        self._rows.append((iteration, view_index))
+
+    def drain(self):
+        """(iteration, view index, {name: value}, elapsed ms or None) of every recorded row, in order."""
+        values = self.values[:len(self._rows)].tolist()
+        rows = []
+        for slot, ((iteration, view_index), row) in enumerate(zip(self._rows, values)):
+            elapsed = None
+            if self._timers is not None:
+                start, end = self._timers[slot]
+                elapsed = start.elapsed_time(end)
+            rows.append((iteration, view_index, dict(zip(self.names, row)), elapsed))
+        self._rows = []
+        return rows
+
+class SyncCounter:
+    """
+    Counts the host-device synchronizations of the training loop.
+
+    Runs with torch.cuda's sync debug mode set to "warn" and counts its warnings
+    instead of printing them. `tick` is called once per iteration and returns
+    the number of synchronizations of the last `window` iterations every
+    `window` iterations, None otherwise.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.count = 0
+        self.iterations = 0
+        self._showwarning = None
+        self._catch_warnings = None
+
+    def start(self):
+        if not torch.cuda.is_available() or self._catch_warnings is not None:
+            return
+        # saves the warning filters and showwarning, stop restores both
+        self._catch_warnings = warnings.catch_warnings()
+        self._catch_warnings.__enter__()
+        self._showwarning = warnings.showwarning
+        warnings.filterwarnings("always", message=".*synchronizing CUDA operation.*")
+        warnings.showwarning = self._count
+        torch.cuda.set_sync_debug_mode("warn")
+
+    def stop(self):
+        if self._catch_warnings is None:
+            return
+        torch.cuda.set_sync_debug_mode("default")
+        self._catch_warnings.__exit__(None, None, None)
+        self._catch_warnings = None
+        self._showwarning = None
+
+    def _count(self, message, category, filename, lineno, file=None, line=None):
+        if "synchronizing CUDA operation" in str(message):
+            self.count += 1
+        else:
+            self._showwarning(message, category, filename, lineno, file, line)
+
+    def tick(self):
+        self.iterations += 1
+        if self.iterations < self.window:
+            return None
+        count, self.count, self.iterations = self.count, 0, 0
+        return count
@@ -10,6 +10,7 @@
 #
 
 from errno import EEXIST
+from contextlib import contextmanager
 from os import makedirs, path
 import os
 
@@ -26,3 +27,16 @@ def mkdir_p(folder_path):
 def searchForMaxIteration(folder):
     saved_iters = [int(fname.split("_")[-1]) for fname in os.listdir(folder)]
     return max(saved_iters)
+
+@contextmanager
+def atomic_write_path(file_path):
+    # Yields a temporary path next to file_path that replaces it once the block completes,
+    # so readers never see a partially written file
+    tmp_path = file_path + ".tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+import torch
+from utils.metric_utils import image_metrics, metric_records
+
+# per_view.json names of the image_metrics keys reported per region
+REGION_METRICS = {"ssim": "SSIM", "psnr": "PSNR", "lpips": "LPIPS", "ssim_text": "SSIM_text", "psnr_text": "PSNR_text", "l1_text": "L1_text"}
+
+def text_region_boxes(mask, padding=8, min_area=16):
+    """
+    (x0, y0, x1, y1) boxes of the connected text regions of the (H, W) uint8
+    `mask` (text where > 127, as written by render.py). Components closer
+    than 2 * `padding` pixels are merged and every box is grown by `padding`
+    within the image; regions of fewer than `min_area` text pixels are dropped.
+    """
+    text = (mask > 127).astype(np.uint8)
+    grown = cv2.dilate(text, np.ones((2 * padding + 1, 2 * padding + 1), np.uint8)) if padding > 0 else text
+    _, _, stats, _ = cv2.connectedComponentsWithStats(grown, connectivity=8)
+    boxes = []
+    for x, y, w, h, _ in stats[1:]:
+        if int(text[y:y + h, x:x + w].sum()) >= min_area:
+            boxes.append((int(x), int(y), int(x + w), int(y + h)))
+    return boxes
+
+def bucket_box(box, width, height, multiple=32):
+    """`box` grown around its center to a multiple of `multiple` pixels per side (at most the image size), shifted into the image."""
+    def grow(low, high, size):
+        extent = min(-(-(high - low) // multiple) * multiple, size)
+        low = min(max(low - (extent - (high - low)) // 2, 0), size - extent)
+        return low, low + extent
+    (x0, x1), (y0, y1) = grow(box[0], box[2], width), grow(box[1], box[3], height)
+    return x0, y0, x1, y1
+
+def evaluate_text_regions(renders, gts, masks, names, lpips_evaluator, batch_size=8, padding=8, min_area=16, multiple=32):
+    """
+    Metrics of the text regions of a batch of (N, 3, H, W) `renders`, `gts`
+    and (N, 1, H, W) `masks`, as a dict mapping each of `names` to a list of
+    region records: the evaluated crop "box" [x0, y0, x1, y1] and the
+    REGION_METRICS of the crop.
+
+    Crops are grown to a multiple of `multiple` pixels so that regions of
+    similar size share a bucket; each bucket goes through image_metrics and
+    LPIPS `batch_size` crops at a time.
+    """
+    height, width = masks.shape[-2:]
+    regions = {name: [] for name in names}
+    buckets = {}
+    for index, (name, mask) in enumerate(zip(names, masks[:, 0].cpu().numpy())):
+        for box in text_region_boxes(mask, padding, min_area):
+            x0, y0, x1, y1 = bucket_box(box, width, height, multiple)
+            record = {"box": [x0, y0, x1, y1]}
+            regions[name].append(record)
+            buckets.setdefault((y1 - y0, x1 - x0), []).append((index, record))
+
+    for crops in buckets.values():
+        for start in range(0, len(crops), batch_size):
+            chunk = crops[start:start + batch_size]
+            boxes = [(index, record["box"]) for index, record in chunk]
+            crop = lambda images: torch.stack([images[index, :, y0:y1, x0:x1] for index, (x0, y0, x1, y1) in boxes])
+            render_crops, gt_crops = crop(renders), crop(gts)
+            values = image_metrics(render_crops, gt_crops, crop(masks))
+            values["lpips"] = lpips_evaluator(render_crops, gt_crops, batch_size)
+            for (_, record), row in zip(chunk, metric_records(values)):
+                record.update({name: row[key] for key, name in REGION_METRICS.items()})
+    return regions
@@ -0,0 +1,143 @@
+import numpy as np
+import torch
+from utils.system_utils import atomic_write_path
+
+
+class PointTrackIndex:
+    """
+    Sparse (CSR) record of the COLMAP images observing each point.
+
+    The images of point i are image_ids[offsets[i]:offsets[i + 1]], sorted and
+    without duplicates. This replaces the dense (num_points, num_images + 1)
+    boolean matrix and supports the same operations: per-image column queries
+    and the row gather / repeat / repeat_interleave / cat used when Gaussians
+    are cloned, split and pruned.
+    """
+
+    def __init__(self, offsets, image_ids, num_images):
+        self.offsets = offsets
+        self.image_ids = image_ids
+        self.num_images = num_images
+        self._columns = None
+
+    @classmethod
+    def from_colmap(cls, track_offsets, image_ids, num_images=None, device="cuda"):
+        """Build the index from the CSR tracks of read_points3D_binary_columnar."""
+        track_offsets = torch.as_tensor(np.asarray(track_offsets), dtype=torch.long, device=device)
+        image_ids = torch.as_tensor(np.asarray(image_ids), dtype=torch.long, device=device)
+        num_points = track_offsets.shape[0] - 1
+        max_image_id = int(image_ids.max()) if image_ids.numel() > 0 else 0
+        num_images = max(num_images or 0, max_image_id + 1)
+
+        # COLMAP tracks may observe a point twice in the same image, the dense
+        # matrix stored that as a single entry.
+        rows = torch.repeat_interleave(torch.arange(num_points, device=device), track_offsets[1:] - track_offsets[:-1])
+        keys = torch.unique(rows * num_images + image_ids)
+        rows = keys // num_images
+        offsets = torch.zeros(num_points + 1, dtype=torch.long, device=device)
+        torch.cumsum(torch.bincount(rows, minlength=num_points), dim=0, out=offsets[1:])
+        return cls(offsets, (keys % num_images).int(), num_images)
+
+    @classmethod
+    def from_dense(cls, track_ids):
+        """Convert a legacy dense boolean track matrix."""
+        rows, cols = torch.nonzero(track_ids, as_tuple=True)
+        offsets = torch.zeros(track_ids.shape[0] + 1, dtype=torch.long, device=track_ids.device)
+        torch.cumsum(torch.bincount(rows, minlength=track_ids.shape[0]), dim=0, out=offsets[1:])
+        return cls(offsets, cols.int(), track_ids.shape[1])
+
+    def to_dense(self):
+        track_ids = torch.zeros((len(self), self.num_images), dtype=torch.bool, device=self.device)
+        track_ids[self.rows(), self.image_ids.long()] = True
+        return track_ids
+
+    @property
+    def device(self):
+        return self.offsets.device
+
+    def to(self, device):
+        return PointTrackIndex(self.offsets.to(device), self.image_ids.to(device), self.num_images)
+
+    def cuda(self):
+        return self.to("cuda")
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def row_lengths(self):
+        return self.offsets[1:] - self.offsets[:-1]
+
+    def rows(self):
+        """Row (point) index of every stored entry."""
+        return torch.repeat_interleave(torch.arange(len(self), device=self.device), self.row_lengths())
+
+    def column(self, image_id):
+        """Boolean mask of the points observed by `image_id`, i.e. track_ids[:, image_id]."""
+        if self._columns is None:
+            order = torch.argsort(self.image_ids, stable=True)
+            counts = torch.bincount(self.image_ids.long(), minlength=self.num_images)
+            col_offsets = torch.zeros(self.num_images + 1, dtype=torch.long)
+            torch.cumsum(counts.cpu(), dim=0, out=col_offsets[1:])
+            self._columns = (self.rows()[order], col_offsets)
+        column_rows, col_offsets = self._columns
+        visible = torch.zeros(len(self), dtype=torch.bool, device=self.device)
+        if 0 <= image_id < self.num_images:
+            visible[column_rows[col_offsets[image_id]:col_offsets[image_id + 1]]] = True
+        return visible
+
+    def __getitem__(self, index):
+        if isinstance(index, np.ndarray):
+            index = torch.from_numpy(index)
+        index = index.to(self.device)
+        if index.dtype == torch.bool:
+            index = torch.nonzero(index, as_tuple=True)[0]
+        return self._gather_rows(index)
+
+    def repeat(self, repeats):
+        """Row-wise equivalent of track_ids.repeat(repeats, 1)."""
+        return self._gather_rows(torch.arange(len(self), device=self.device).repeat(repeats))
+
+    def repeat_interleave(self, repeats):
+        """Row-wise equivalent of track_ids.repeat_interleave(repeats, dim=0)."""
+        return self._gather_rows(torch.repeat_interleave(torch.arange(len(self), device=self.device), repeats))
+
+    @staticmethod
+    def cat(indices):
+        """Row-wise equivalent of torch.cat(indices, dim=0)."""
+        device = indices[0].device
+        offsets = [indices[0].offsets]
+        for index in indices[1:]:
+            offsets.append(index.offsets[1:].to(device) + offsets[-1][-1])
+        return PointTrackIndex(torch.cat(offsets),
+                               torch.cat([index.image_ids.to(device) for index in indices]),
+                               max(index.num_images for index in indices))
+
+    def _gather_rows(self, rows):
+        rows = rows.long()
+        lengths = self.row_lengths()[rows]
+        offsets = torch.zeros(rows.shape[0] + 1, dtype=torch.long, device=self.device)
+        torch.cumsum(lengths, dim=0, out=offsets[1:])
+        shift = torch.repeat_interleave(self.offsets[:-1][rows] - offsets[:-1], lengths)
+        source = shift + torch.arange(shift.shape[0], device=self.device)
+        return PointTrackIndex(offsets, self.image_ids[source], self.num_images)
+
+    def state_dict(self):
+        """Serializable copy of the index, on its current device."""
+        return {"row_lengths": self.row_lengths().int(),
+                "image_ids": self.image_ids.clone(),
+                "num_images": self.num_images}
+
+    def save(self, path, state_dict=None):
+        if state_dict is None:
+            state_dict = self.state_dict()
+        with atomic_write_path(path) as tmp_path:
+            torch.save({key: value.cpu() if torch.is_tensor(value) else value for key, value in state_dict.items()}, tmp_path)
+
+    @classmethod
+    def load(cls, path, device="cuda"):
+        data = torch.load(path, map_location=device)
+        if torch.is_tensor(data):
+            return cls.from_dense(data)
+        offsets = torch.zeros(data["row_lengths"].shape[0] + 1, dtype=torch.long, device=device)
+        torch.cumsum(data["row_lengths"].long(), dim=0, out=offsets[1:])
+        return cls(offsets, data["image_ids"].int(), data["num_images"])